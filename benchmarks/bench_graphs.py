@@ -0,0 +1,32 @@
+import pytest
+from relational import *
+
+def test_create_adj_mat_dict(profile, structure, skeleton):
+    profile(create_adj_mat_dict, structure, skeleton)
+
+def test_create_ground_graph(profile, structure, skeleton):
+    profile(create_ground_graph, structure, skeleton)
+
+def test_ground_graph_build(profile, structure, skeleton):
+    profile(GroundGraph, structure, skeleton)
+
+def test_create_subgraph_for_ITE(profile, structure, skeleton):
+    ground_graph = create_ground_graph(structure, skeleton)
+    treatment = InstanceNode("state", "policy", skeleton.entity_instances["state"]["names"][0])
+    outcome = InstanceNode("town", "prevalence", skeleton.entity_instances["town"]["names"][0])
+    profile(create_subgraph_for_ITE, ground_graph, treatment, outcome)
+
+def test_load_json(profile, request, tmp_path, structure, skeleton, scale):
+    if scale > request.config.getoption("max_json_scale"):
+        pytest.skip("JSON skeleton is too large at this scale, see --max-json-scale")
+    path = str(tmp_path / "skeleton.json")
+    skeleton.save(structure.schema, path)
+    profile(RelationalSkeleton(structure.schema).load, structure.schema, path)
+
+def test_load_columnar(profile, tmp_path, structure, skeleton):
+    path = str(tmp_path / "skeleton")
+    skeleton.save_columnar(structure.schema, path)
+    profile(RelationalSkeleton(structure.schema).load_columnar, structure.schema, path)
+
+def test_build_partitioned_ground_graph(profile, tmp_path, structure, skeleton):
+    profile(build_partitioned_ground_graph, structure, skeleton, "state", str(tmp_path), roots_per_partition=10)
@@ -0,0 +1,7 @@
+import subprocess
+import sys
+
+def test_import_schema(benchmark):
+    # A fresh interpreter every round so that nothing is imported yet
+    code = "from relational import RelationalSchema, RelationalCausalStructure, RelationalSCM"
+    benchmark.pedantic(subprocess.run, args=([sys.executable, "-c", code],), kwargs={"check": True}, rounds=5, iterations=1)
@@ -0,0 +1,14 @@
+import pytest
+import torch
+from relational import *
+
+@pytest.fixture(scope="session")
+def sampled_skeleton(structure, skeleton):
+    scm = RelationalSCM()
+    scm.create_from_structure(structure)
+    scm.init_linear_gaussian(torch.Generator().manual_seed(0))
+    return RelationalSampler(scm, skeleton).sample_skeleton(torch.Generator().manual_seed(0))
+
+@pytest.mark.parametrize("num_workers", [1, 4])
+def test_structure_learning(profile, structure, sampled_skeleton, num_workers):
+    profile(lambda: RelationalStructureLearner(structure.schema, sampled_skeleton, num_workers=num_workers).learn())
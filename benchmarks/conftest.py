@@ -0,0 +1,39 @@
+import tracemalloc
+import pytest
+
+from relational import *
+
+def pytest_addoption(parser):
+    parser.addoption("--scale", action="append", type=int, default=None,
+                     help="number of business instances in the synthetic skeleton, can be repeated. Defaults to 1000 and 10000.")
+    parser.addoption("--max-json-scale", type=int, default=100000,
+                     help="largest scale at which the JSON skeleton is written and loaded. Defaults to 100000.")
+
+def pytest_generate_tests(metafunc):
+    if "scale" in metafunc.fixturenames:
+        scales = metafunc.config.getoption("scale") or [1000, 10000]
+        metafunc.parametrize("scale", scales, scope="session")
+
+@pytest.fixture(scope="session")
+def structure():
+    schema = RelationalSchema()
+    schema.load('tests/example/covid_schema.json')
+    structure = RelationalCausalStructure(schema)
+    structure.load('tests/example/covid_structure.json')
+    return structure
+
+@pytest.fixture(scope="session")
+def skeleton(structure, scale):
+    # Ten businesses per town and ten towns per state
+    return generate_skeleton(structure.schema, {"business": scale}, fan_out={"contains": 10, "resides": 10}, seed=0)
+
+@pytest.fixture
+def profile(benchmark):
+    """ Run a function once under tracemalloc and record its peak memory next to the timings, then benchmark it """
+    def run(function, *args, **kwargs):
+        tracemalloc.start()
+        function(*args, **kwargs)
+        benchmark.extra_info["peak_memory_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+        return benchmark.pedantic(function, args=args, kwargs=kwargs, rounds=3, iterations=1)
+    return run
@@ -12,14 +12,14 @@ import funsor.ops as ops
 # For example, you don't need to manually write every sample statement, just traverse the graph and add one every time you hit a new node
 # A -> B -> C where each node is Gaussian, then try to marginalize B - funsor should be able to do this - then inspect the Tensor and try to figure out what it is
 
-def relational_linear_gaussian_model(scm: RelationalSCM, num_instances: dict):
-    """ Build a funsor model from the relational SCM
+def relational_linear_gaussian_model(scm: RelationalSCM, skeleton: RelationalSkeleton):
+    """ Build a Pyro model from the relational SCM with one plated sample site per attribute class
 
     Args:
         scm (RelationalSCM): relational SCM containing a set of structural functions
+        skeleton (RelationalSkeleton): relational skeleton containing all instances
     """
-    for node, parents in scm.functions.items():
-        raise NotImplementedError
+    return compile_pyro_model(scm, skeleton)
 
 def parse_name(name):
     """Parse a name of the form entity_attribute into a tuple (entity, attribute)
@@ -41,15 +41,13 @@ def parse_name(name):
 
 if __name__ == "__main__":
 
-    # Can improve API so that schema and structure do not need to be created every time
-    # However this can introduce nightmares in verifying correctness, e.g. acyclicity and missing parents
-    schema = RelationalSchema()
-    schema.load('example/covid_schema.json')
-    structure = RelationalCausalStructure(schema)
-    structure.load('example/covid_structure.json')
-    scm = RelationalSCM()
-    scm.create_from_structure(structure)
+    # Schema, structure, SCM and skeleton are cached by the contents of their files, and pickled between runs
+    cache = ArtifactCache(cache_dir='example/.cache')
+    scm = load_scm('example/covid_schema.json', 'example/covid_structure.json', cache)
     print(scm.functions)
 
-    # Hardcoding the number of instances
-    num_instances = {'state': 2, 'town': 3, 'business': 5}
\ No newline at end of file
+    # Compile the SCM over the example skeleton and condition on its attribute values
+    skeleton = load_skeleton('example/covid_schema.json', 'example/covid_skeleton.json', cache)
+    model = relational_linear_gaussian_model(scm, skeleton)
+    trace = pyro.poutine.trace(pyro.condition(model, data=get_observations(scm, skeleton))).get_trace()
+    print(f"Log joint of the example skeleton: {trace.log_prob_sum().item()}")
\ No newline at end of file
@@ -1,6 +1,44 @@
-from relational.causal_structure import *
-from relational.data import *
-from relational.graphs import *
-from relational.schema import *
-from relational.scm import *
-from relational.utils import *
\ No newline at end of file
+import importlib
+
+# Public names and the module defining them, modules are only imported when one of their names is first used
+# so that e.g. a schema can be loaded without importing torch, pandas or networkx
+_EXPORTS = {
+    "abstract_ground_graph": ["is_valid_relational_path", "get_relational_paths", "extend_relational_path", "get_dependency_path", "AbstractGroundGraph"],
+    "aggregation": ["AGGREGATIONS", "segment_reduce", "get_edge_positions", "aggregate_relational_edge", "compute_relational_aggregates",
+                    "get_feature_matrix", "flatten"],
+    "cache": ["hash_file", "hash_files", "ArtifactCache", "default_cache", "load_schema", "load_structure", "load_scm", "load_skeleton",
+              "load_ground_graph", "load_adjacency"],
+    "causal_structure": ["RelationalCausalStructure"],
+    "data": ["RelationalSkeleton", "convert_skeleton_to_columnar"],
+    "estimation": ["EFFECTS", "estimate_ite", "estimate_ites", "get_peer_matrix", "estimate_effect"],
+    "fitting": ["MODELS", "fit_linear_gaussian", "fit_mlp", "fit_scm"],
+    "funsor_model": ["FunsorLinearGaussian"],
+    "graphs": ["create_adj_mat_dict", "get_node_name", "create_ground_graph", "intervene_ground_graph", "create_subgraph_for_ITE", "create_subgraphs_for_ITE"],
+    "ground_graph": ["GroundGraph"],
+    "inference": ["RelationalMinibatchSVI"],
+    "ingest": ["iter_table_chunks", "get_relation_columns", "load_skeleton_from_tables"],
+    "learning": ["fisher_z_test", "compute_relational_feature", "RelationalStructureLearner"],
+    "partitioned_ground_graph": ["get_instance_partitions", "build_partitioned_ground_graph", "PartitionedGroundGraph"],
+    "pyro_model": ["get_observations", "compile_pyro_model"],
+    "sampling": ["RelationalSampler"],
+    "schema": ["RelationalSchema"],
+    "scm": ["RelationalSCM", "InterventionOverlay"],
+    "shm": ["share_array", "attach_array"],
+    "synthetic": ["get_num_instances", "generate_skeleton"],
+    "utils": ["Edge", "Node", "InstanceNode", "RelationIndex", "SkeletonViolation", "LinearGaussian", "EliminationCost", "EffectEstimate",
+              "RelationalVariable", "IntersectionVariable", "RelationalFeature", "FeatureMatrix", "MLPMechanism",
+              "GroundGraphPartition"],
+}
+_MODULE_OF = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = list(_MODULE_OF)
+
+def __getattr__(name):
+    if name not in _MODULE_OF:
+        raise AttributeError(f"module {__name__} has no attribute {name}")
+    value = getattr(importlib.import_module(f"relational.{_MODULE_OF[name]}"), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,188 @@
+import itertools
+import networkx as nx
+
+from relational.causal_structure import RelationalCausalStructure
+from relational.schema import RelationalSchema
+from relational.utils import RelationalVariable, IntersectionVariable
+
+def is_valid_relational_path(schema: RelationalSchema, path: tuple) -> bool:
+    """ Check if a relational path (entity, relation, entity, ..., entity) can be traversed in the schema
+        Going back to an entity through the same relation only reaches other instances if that entity is on the 'many' side
+
+    Args:
+        schema (RelationalSchema): schema of the path
+        path (tuple): alternating entity and relation names, starting and ending with an entity
+
+    Returns:
+        bool: True if the path is valid
+    """
+    if len(path) % 2 == 0 or any(entity not in schema.entity_classes for entity in path[::2]):
+        return False
+    for idx in range(1, len(path), 2):
+        relation = path[idx]
+        if relation not in schema.relations or set(schema.relations[relation]) != {path[idx - 1], path[idx + 1]}:
+            return False
+        if idx >= 3 and path[idx - 2] == relation and schema.cardinality[relation][path[idx - 3]] != "many":
+            return False
+    return True
+
+def get_relational_paths(schema: RelationalSchema, perspective: str, hop_threshold: int) -> list:
+    """ Enumerate all valid relational paths from an entity with at most hop_threshold relations
+
+    Args:
+        schema (RelationalSchema): schema of the paths
+        perspective (str): entity every path starts from
+        hop_threshold (int): maximum number of relations on a path
+
+    Returns:
+        list: relational paths in order of increasing length
+    """
+    paths = [(perspective,)]
+    frontier = [(perspective,)]
+    for _ in range(hop_threshold):
+        next_frontier = []
+        for path in frontier:
+            for relation in sorted(schema.relationship_classes):
+                entity_from, entity_to = schema.relations[relation]
+                if path[-1] not in (entity_from, entity_to):
+                    continue
+                next_path = path + (relation, entity_to if path[-1] == entity_from else entity_from)
+                if is_valid_relational_path(schema, next_path):
+                    next_frontier.append(next_path)
+        paths.extend(next_frontier)
+        frontier = next_frontier
+    return paths
+
+def extend_relational_path(schema: RelationalSchema, path: tuple, extension: tuple) -> list:
+    """ Find the paths reached by following extension from the terminal entity of path
+        The extension may backtrack along the end of path, so the path is cut at every entity where they overlap
+
+    Args:
+        schema (RelationalSchema): schema of the paths
+        path (tuple): relational path ending at the first entity of extension
+        extension (tuple): relational path, e.g. the path of a relational dependency
+
+    Returns:
+        list: valid relational paths, without duplicates
+    """
+    reverse = path[::-1]
+    extended_paths = []
+    for pivot in range(0, min(len(reverse), len(extension)), 2):
+        if reverse[:pivot + 1] != extension[:pivot + 1]:
+            break
+        extended_path = path[:len(path) - pivot] + extension[pivot + 1:]
+        if is_valid_relational_path(schema, extended_path) and extended_path not in extended_paths:
+            extended_paths.append(extended_path)
+    return extended_paths
+
+def get_dependency_path(schema: RelationalSchema, relation: str, edge) -> tuple:
+    """ Relational path from the child of a relational edge to its parents
+
+    Args:
+        schema (RelationalSchema): schema of the structure
+        relation (str): relation of the edge, or 'self'
+        edge (Edge): relational edge
+
+    Returns:
+        tuple: (child entity,) for self edges and (child entity, relation, parent entity) otherwise
+    """
+    if relation.lower() == "self":
+        return (edge.child.entity,)
+    return (edge.child.entity, relation, edge.parent.entity)
+
+class AbstractGroundGraph:
+    """
+    Abstract ground graph of a relational causal structure from the perspective of one entity.
+    Nodes are relational variables reached by relational paths of at most hop_threshold relations, plus the intersections
+    of variables whose instances can overlap, so reasoning about independence never touches a skeleton.
+    """
+    def __init__(self, structure: RelationalCausalStructure, perspective: str, hop_threshold: int) -> None:
+
+        self.structure = structure
+        self.perspective = perspective
+        self.hop_threshold = hop_threshold
+        self.d_separation_cache = {}
+        self.build()
+
+    def build(self):
+        """ Add all relational variables, the dependencies between them and their intersection variables
+        """
+        schema = self.structure.schema
+        self.graph = nx.DiGraph()
+        self.paths = get_relational_paths(schema, self.perspective, self.hop_threshold)
+        path_set = set(self.paths)
+        for path in self.paths:
+            for attribute in sorted(schema.attribute_classes[path[-1]]):
+                self.graph.add_node(RelationalVariable(path, attribute))
+
+        # A dependency [C ... P].X -> [C].Y gives edges from every extension of a path to C by the dependency path
+        for path in self.paths:
+            for attribute in schema.attribute_classes[path[-1]]:
+                for relation, edge in self.structure.get_incoming_edges(path[-1], attribute):
+                    dependency_path = get_dependency_path(schema, relation, edge)
+                    for parent_path in extend_relational_path(schema, path, dependency_path):
+                        if parent_path in path_set:
+                            self.graph.add_edge(RelationalVariable(parent_path, edge.parent.attribute), RelationalVariable(path, attribute))
+
+        # Different paths to the same entity may reach common instances, so each pair gets an intersection variable
+        # with the parents and children of both. Pairs are not checked further, which can only hide independencies.
+        self.intersections = {}
+        variables = sorted(node for node in self.graph.nodes)
+        for first, second in itertools.combinations(variables, 2):
+            if first.attribute != second.attribute or first.path[-1] != second.path[-1]:
+                continue
+            intersection = IntersectionVariable(first, second)
+            parents = set(self.graph.predecessors(first)) | set(self.graph.predecessors(second))
+            children = set(self.graph.successors(first)) | set(self.graph.successors(second))
+            self.graph.add_edges_from((parent, intersection) for parent in parents)
+            self.graph.add_edges_from((intersection, child) for child in children)
+            self.graph.add_node(intersection)
+            self.intersections.setdefault(first, []).append(intersection)
+            self.intersections.setdefault(second, []).append(intersection)
+
+    def get_variable(self, variable) -> RelationalVariable:
+        """ Convert a (path, attribute) pair to a relational variable of this graph
+
+        Args:
+            variable (tuple): (path, attribute) with a path starting at the perspective
+
+        Returns:
+            RelationalVariable: the variable, or None if it isn't in the abstract ground graph
+        """
+        variable = RelationalVariable(tuple(variable[0]), variable[1])
+        if variable not in self.graph:
+            print(f"Variable {variable} is not in the abstract ground graph of {self.perspective} with hop threshold {self.hop_threshold}")
+            return None
+        return variable
+
+    def d_separated(self, x: list, y: list, z: list = None) -> bool:
+        """ Relational d-separation of sets of relational variables from the perspective of this graph
+            Each set is augmented with the intersection variables of its members, and results are cached
+
+        Args:
+            x (list): list of (path, attribute) pairs
+            y (list): list of (path, attribute) pairs
+            z (list, optional): list of (path, attribute) pairs to condition on. Defaults to None.
+
+        Returns:
+            bool: True if x and y are d-separated given z, or None if some variable is not in the graph
+        """
+        z = [] if z is None else z
+        sets = [[self.get_variable(variable) for variable in variables] for variables in [x, y, z]]
+        if any(variable is None for variables in sets for variable in variables):
+            return None
+        x, y, z = [frozenset(variables) for variables in sets]
+        key = (frozenset([x, y]), z)
+        if key not in self.d_separation_cache:
+            x_bar, y_bar, z_bar = [set(variables).union(*[self.intersections.get(variable, []) for variable in variables]) for variables in [x, y, z]]
+            x_bar -= z_bar
+            y_bar -= z_bar
+            if len(x_bar & y_bar) > 0:
+                self.d_separation_cache[key] = False
+            elif len(x_bar) == 0 or len(y_bar) == 0:
+                self.d_separation_cache[key] = True
+            else:
+                # d_separated was renamed to is_d_separator in later versions of networkx
+                is_d_separator = getattr(nx, "is_d_separator", None) or nx.d_separated
+                self.d_separation_cache[key] = is_d_separator(self.graph, x_bar, y_bar, z_bar)
+        return self.d_separation_cache[key]
@@ -0,0 +1,165 @@
+import torch
+
+from relational.causal_structure import RelationalCausalStructure
+from relational.data import RelationalSkeleton
+from relational.utils import Edge, FeatureMatrix, Node
+
+AGGREGATIONS = ['mean', 'sum', 'count', 'max']
+
+def segment_reduce(values: torch.Tensor, segment_ids: torch.Tensor, num_segments: int, aggregation: str = 'sum') -> torch.Tensor:
+    """ Reduce values over segments along the last dimension, segments without any values are set to zero
+
+    Args:
+        values (torch.Tensor): tensor of shape (..., num_values)
+        segment_ids (torch.Tensor): segment of each value, of shape (num_values,)
+        num_segments (int): number of segments
+        aggregation (str, optional): one of 'mean', 'sum', 'count', 'max'. Defaults to 'sum'.
+
+    Returns:
+        torch.Tensor: tensor of shape (..., num_segments)
+    """
+    out = torch.zeros(values.shape[:-1] + (num_segments,), dtype=values.dtype, device=values.device)
+    index = segment_ids.expand_as(values)
+    if aggregation == 'count':
+        return out.scatter_add(-1, index, torch.ones_like(values))
+    elif aggregation == 'sum':
+        return out.scatter_add(-1, index, values)
+    elif aggregation == 'mean':
+        return out.scatter_reduce(-1, index, values, reduce='mean', include_self=False)
+    elif aggregation == 'max':
+        return out.scatter_reduce(-1, index, values, reduce='amax', include_self=False)
+    else:
+        raise ValueError(f"Aggregation {aggregation} is not valid, should be in {AGGREGATIONS}")
+
+def get_edge_positions(structure: RelationalCausalStructure, skeleton: RelationalSkeleton, relation: str, edge: Edge) -> tuple:
+    """ Obtain the positions of parent and child instances for every instance edge underlying a relational edge
+
+    Args:
+        structure (RelationalCausalStructure): contains schema and edges
+        skeleton (RelationalSkeleton): contains all instances
+        relation (str): relation of the edge, or "self"
+        edge (Edge): relational edge between two (entity, attribute) nodes
+
+    Returns:
+        tuple: parent positions and child positions as torch.LongTensor
+    """
+    if relation == "self":
+        positions = torch.arange(len(skeleton.entity_instances[edge.child.entity]["names"]))
+        return positions, positions
+    entity_from, entity_to = structure.schema.relations[relation]
+    index = skeleton.get_relation_index(relation)
+    source = torch.as_tensor(index.source, dtype=torch.long)
+    target = torch.as_tensor(index.target, dtype=torch.long)
+    if edge.parent.entity == entity_from and edge.child.entity == entity_to:
+        return source, target
+    return target, source
+
+def aggregate_relational_edge(structure: RelationalCausalStructure, skeleton: RelationalSkeleton, relation: str, edge: Edge, values: torch.Tensor = None, aggregation: str = 'mean') -> torch.Tensor:
+    """ Aggregate parent attribute values over all related parent instances of each child instance
+        If the parent entity is on the 'one' side of the relation each child has at most one parent,
+        so its value is gathered directly instead of reduced
+
+    Args:
+        structure (RelationalCausalStructure): contains schema and edges
+        skeleton (RelationalSkeleton): contains all instances
+        relation (str): relation of the edge, or "self"
+        edge (Edge): relational edge between two (entity, attribute) nodes
+        values (torch.Tensor, optional): parent values of shape (..., num_parent_instances), read from the skeleton if None. Defaults to None.
+        aggregation (str, optional): one of 'mean', 'sum', 'count', 'max'. Defaults to 'mean'.
+
+    Returns:
+        torch.Tensor: aggregated values of shape (..., num_child_instances)
+    """
+    if values is None:
+        values = skeleton.get_attribute_vector(edge.parent.entity, edge.parent.attribute)
+    num_children = len(skeleton.entity_instances[edge.child.entity]["names"])
+    parent_positions, child_positions = get_edge_positions(structure, skeleton, relation, edge)
+    parent_values = values[..., parent_positions]
+
+    if aggregation != 'count' and (relation == "self" or structure.schema.cardinality[relation][edge.parent.entity] == "one"):
+        out = torch.zeros(values.shape[:-1] + (num_children,), dtype=values.dtype, device=values.device)
+        return out.index_copy(-1, child_positions, parent_values)
+    return segment_reduce(parent_values, child_positions, num_children, aggregation)
+
+def compute_relational_aggregates(structure: RelationalCausalStructure, skeleton: RelationalSkeleton, aggregations: list = AGGREGATIONS, values: dict = None) -> dict:
+    """ Compute aggregates of parent values for every relational edge in the structure
+
+    Args:
+        structure (RelationalCausalStructure): contains schema and edges
+        skeleton (RelationalSkeleton): contains all instances
+        aggregations (list, optional): aggregations to compute. Defaults to AGGREGATIONS.
+        values (dict, optional): key is a Node and value is a tensor of its values, read from the skeleton if missing. Defaults to None.
+
+    Returns:
+        dict: key is a (relation, edge) tuple and value is a dict from aggregation name to a tensor over child instances
+    """
+    values = {} if values is None else values
+    aggregates = {}
+    for relation, edge_list in structure.edges.items():
+        for edge in edge_list:
+            parent_values = values.get(edge.parent)
+            aggregates[(relation, edge)] = {aggregation: aggregate_relational_edge(structure, skeleton, relation, edge, parent_values, aggregation) for aggregation in aggregations}
+    return aggregates
+
+def get_feature_matrix(structure: RelationalCausalStructure, skeleton: RelationalSkeleton, node: Node, aggregations: tuple = ('mean',), aggregates: dict = None) -> FeatureMatrix:
+    """ Obtain the design matrix of the parents of a node, with one row per instance of its entity
+        Parents on the 'one' side of a relation or of the same instance have one column, and parents on the 'many'
+        side have one column per aggregation. The matrix is cached on the skeleton until the values it was built from change.
+
+    Args:
+        structure (RelationalCausalStructure): contains schema and edges
+        skeleton (RelationalSkeleton): contains all instances
+        node (Node): an (entity, attribute) node of the structure
+        aggregations (tuple, optional): aggregations of parents on the 'many' side of a relation. Defaults to ('mean',).
+        aggregates (dict, optional): aggregated parent values shared between nodes, key is (relation, parent, child entity,
+            aggregation). Defaults to None.
+
+    Returns:
+        FeatureMatrix: features of shape (num_instances, num_columns), the (relation, edge, aggregation) of each column
+            and the values of the node itself
+    """
+    aggregates = {} if aggregates is None else aggregates
+    incoming_edges = sorted(structure.get_incoming_edges(node.entity, node.attribute))
+    key = (node, tuple(incoming_edges), tuple(aggregations))
+
+    # The matrix is rebuilt when any node it uses has a new version from set_attribute_values or was replaced directly
+    sources = {source: (skeleton.attribute_versions.get(source, 0), skeleton.entity_instances[source.entity][source.attribute])
+               for source in [node] + [edge.parent for _, edge in incoming_edges]}
+    if key in skeleton.feature_matrices:
+        cached_sources, feature_matrix = skeleton.feature_matrices[key]
+        if all(cached_sources[source][0] == version and cached_sources[source][1] is values for source, (version, values) in sources.items()):
+            return feature_matrix
+
+    columns, features = [], []
+    for relation, edge in incoming_edges:
+        if relation == "self" or structure.schema.cardinality[relation][edge.parent.entity] == "one":
+            edge_aggregations = ["value"]
+        else:
+            edge_aggregations = aggregations
+        for aggregation in edge_aggregations:
+            aggregate_key = (relation, edge.parent, edge.child.entity, aggregation)
+            if aggregate_key not in aggregates:
+                aggregates[aggregate_key] = aggregate_relational_edge(structure, skeleton, relation, edge, aggregation='mean' if aggregation == "value" else aggregation)
+            columns.append((relation, edge, aggregation))
+            features.append(aggregates[aggregate_key])
+    target = skeleton.get_attribute_vector(node.entity, node.attribute)
+    num_instances = len(skeleton.entity_instances[node.entity]["names"])
+    features = torch.stack(features, dim=-1) if len(features) > 0 else torch.zeros(num_instances, 0, dtype=target.dtype)
+    feature_matrix = FeatureMatrix(features, columns, target)
+    skeleton.feature_matrices[key] = (sources, feature_matrix)
+    return feature_matrix
+
+def flatten(structure: RelationalCausalStructure, skeleton: RelationalSkeleton, aggregations: tuple = ('mean',)) -> dict:
+    """ Propositionalize the skeleton into one design matrix per node of the structure, see get_feature_matrix
+        Aggregates of the same parent through the same relation are computed once and shared between nodes
+
+    Args:
+        structure (RelationalCausalStructure): contains schema and edges
+        skeleton (RelationalSkeleton): contains all instances
+        aggregations (tuple, optional): aggregations of parents on the 'many' side of a relation. Defaults to ('mean',).
+
+    Returns:
+        dict: key is a Node and value is its FeatureMatrix, whose tensors can be viewed as arrays with .numpy()
+    """
+    aggregates = {}
+    return {node: get_feature_matrix(structure, skeleton, node, aggregations, aggregates) for node in sorted(structure.nodes)}
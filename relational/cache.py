@@ -0,0 +1,271 @@
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
+from copy import copy, deepcopy
+from typing import TYPE_CHECKING
+
+from relational.causal_structure import RelationalCausalStructure
+from relational.schema import RelationalSchema
+from relational.scm import RelationalSCM
+
+# Skeletons and ground graphs need numpy, pandas, torch and networkx, which are only imported when they are loaded
+if TYPE_CHECKING:
+    from relational.data import RelationalSkeleton
+    from relational.ground_graph import GroundGraph
+
+# Digests of files keyed by path, recomputed only when the modification time or size of a file changes
+_file_digests = {}
+
+def hash_file(path: str) -> str:
+    """ Compute the SHA-256 digest of the contents of a file
+
+    Args:
+        path (str): location of the file
+
+    Returns:
+        str: hex digest of the file contents
+    """
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    if key in _file_digests and _file_digests[key][:2] == (stat.st_mtime_ns, stat.st_size):
+        return _file_digests[key][2]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    _file_digests[key] = (stat.st_mtime_ns, stat.st_size, digest.hexdigest())
+    return _file_digests[key][2]
+
+def hash_files(kind: str, paths: list) -> str:
+    """ Build a cache key from the kind of artifact and the contents of all files it is created from
+
+    Args:
+        kind (str): kind of artifact, e.g. "schema"
+        paths (list): locations of the source files
+
+    Returns:
+        str: cache key of the form kind-digest
+    """
+    digest = hashlib.sha256(kind.encode())
+    for path in paths:
+        digest.update(hash_file(path).encode())
+    return f"{kind}-{digest.hexdigest()}"
+
+class ArtifactCache:
+    """
+    Cache of loaded objects keyed by the contents of their source files, so changed files are loaded again.
+    Recently used objects are kept in memory, and all objects are optionally pickled to a directory shared between runs.
+    Objects returned by get are shared between callers, the load functions below return copies unless asked for the shared object.
+    """
+    def __init__(self, maxsize: int = 32, cache_dir: str = None) -> None:
+
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, key: str, create, attach = None):
+        """ Returns the cached object for a key, creating and storing it if it is not cached
+
+        Args:
+            key (str): cache key, e.g. from hash_files
+            create (callable): function without arguments that creates the object
+            attach (callable, optional): function applied to an object read from disk, e.g. to replace the objects it refers to
+                with the cached ones. Defaults to None.
+
+        Returns:
+            object: the cached or newly created object
+        """
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        path = None if self.cache_dir is None else os.path.join(self.cache_dir, f"{key}.pkl")
+        if path is not None and os.path.exists(path):
+            self.disk_hits += 1
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            if attach is not None:
+                attach(value)
+        else:
+            self.misses += 1
+            value = create()
+            if path is not None:
+                # Write to a temporary file first so other processes never read a partial pickle
+                with open(f"{path}.{os.getpid()}.tmp", 'wb') as f:
+                    pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(f"{path}.{os.getpid()}.tmp", path)
+
+        self.entries[key] = value
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return value
+
+    def clear(self, disk: bool = False):
+        """ Remove all objects from memory
+
+        Args:
+            disk (bool, optional): also remove the pickled objects from the cache directory. Defaults to False.
+        """
+        self.entries.clear()
+        if disk and self.cache_dir is not None:
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".pkl"):
+                    os.remove(os.path.join(self.cache_dir, name))
+
+default_cache = ArtifactCache()
+
+def load_schema(path_to_schema: str, cache: ArtifactCache = None, shared: bool = False) -> RelationalSchema:
+    """ Load a relational schema through the cache
+
+    Args:
+        path_to_schema (str): location of the schema JSON file
+        cache (ArtifactCache, optional): cache to use. Defaults to default_cache.
+        shared (bool, optional): return the cached schema itself, which must not be changed. Defaults to False.
+
+    Returns:
+        RelationalSchema: a copy of the schema
+    """
+    cache = default_cache if cache is None else cache
+
+    def create():
+        schema = RelationalSchema()
+        schema.load(path_to_schema)
+        return schema
+    schema = cache.get(hash_files("schema", [path_to_schema]), create)
+    return schema if shared else deepcopy(schema)
+
+def load_structure(path_to_schema: str, path_to_structure: str, cache: ArtifactCache = None, shared: bool = False) -> RelationalCausalStructure:
+    """ Load a relational causal structure through the cache
+
+    Args:
+        path_to_schema (str): location of the schema JSON file
+        path_to_structure (str): location of the structure JSON file
+        cache (ArtifactCache, optional): cache to use. Defaults to default_cache.
+        shared (bool, optional): return the cached structure itself, which must not be changed. Defaults to False.
+
+    Returns:
+        RelationalCausalStructure: a copy of the structure with its own schema
+    """
+    cache = default_cache if cache is None else cache
+
+    def create():
+        structure = RelationalCausalStructure(load_schema(path_to_schema, cache, shared=True))
+        structure.load(path_to_structure)
+        return structure
+
+    def attach(structure):
+        structure.schema = load_schema(path_to_schema, cache, shared=True)
+    structure = cache.get(hash_files("structure", [path_to_schema, path_to_structure]), create, attach)
+    return structure if shared else deepcopy(structure)
+
+def load_scm(path_to_schema: str, path_to_structure: str, cache: ArtifactCache = None, shared: bool = False) -> RelationalSCM:
+    """ Create a relational SCM from a structure through the cache
+
+    Args:
+        path_to_schema (str): location of the schema JSON file
+        path_to_structure (str): location of the structure JSON file
+        cache (ArtifactCache, optional): cache to use. Defaults to default_cache.
+        shared (bool, optional): return the cached SCM itself, which must not be changed. Defaults to False.
+
+    Returns:
+        RelationalSCM: a copy of the SCM without mechanisms and with its own structure
+    """
+    cache = default_cache if cache is None else cache
+
+    def create():
+        scm = RelationalSCM()
+        scm.create_from_structure(load_structure(path_to_schema, path_to_structure, cache, shared=True))
+        return scm
+
+    def attach(scm):
+        scm.structure = load_structure(path_to_schema, path_to_structure, cache, shared=True)
+    scm = cache.get(hash_files("scm", [path_to_schema, path_to_structure]), create, attach)
+    return scm if shared else deepcopy(scm)
+
+def load_skeleton(path_to_schema: str, path_to_skeleton: str, cache: ArtifactCache = None, shared: bool = False) -> "RelationalSkeleton":
+    """ Load a relational skeleton through the cache, together with its relation indexes
+
+    Args:
+        path_to_schema (str): location of the schema JSON file
+        path_to_skeleton (str): location of the skeleton JSON file
+        cache (ArtifactCache, optional): cache to use. Defaults to default_cache.
+        shared (bool, optional): return the cached skeleton itself, which must not be changed. Defaults to False.
+
+    Returns:
+        RelationalSkeleton: a copy of the skeleton sharing the cached arrays and indexes, set new values with set_attribute_values
+            instead of changing them in place
+    """
+    cache = default_cache if cache is None else cache
+
+    def create():
+        from relational.data import RelationalSkeleton
+
+        schema = load_schema(path_to_schema, cache, shared=True)
+        skeleton = RelationalSkeleton(schema)
+        skeleton.load(schema, path_to_skeleton)
+        for relation in schema.relationship_classes:
+            skeleton.get_relation_index(relation)
+        return skeleton
+    skeleton = cache.get(hash_files("skeleton", [path_to_schema, path_to_skeleton]), create)
+    return skeleton if shared else copy(skeleton)
+
+def load_ground_graph(path_to_schema: str, path_to_structure: str, path_to_skeleton: str, cache: ArtifactCache = None, shared: bool = False) -> "GroundGraph":
+    """ Build the ground graph of a structure and skeleton through the cache
+
+    Args:
+        path_to_schema (str): location of the schema JSON file
+        path_to_structure (str): location of the structure JSON file
+        path_to_skeleton (str): location of the skeleton JSON file
+        cache (ArtifactCache, optional): cache to use. Defaults to default_cache.
+        shared (bool, optional): return the cached ground graph itself, which must not be changed. Defaults to False.
+
+    Returns:
+        GroundGraph: a copy of the ground graph with its own values, structure and skeleton, which can be intervened on in place
+    """
+    cache = default_cache if cache is None else cache
+
+    def create():
+        from relational.ground_graph import GroundGraph
+
+        return GroundGraph(load_structure(path_to_schema, path_to_structure, cache, shared=True), load_skeleton(path_to_schema, path_to_skeleton, cache, shared=True))
+
+    def attach(ground_graph):
+        # The pickle holds its own structure and skeleton, use the cached ones so they are shared again
+        ground_graph.structure = load_structure(path_to_schema, path_to_structure, cache, shared=True)
+        ground_graph.skeleton = load_skeleton(path_to_schema, path_to_skeleton, cache, shared=True)
+    ground_graph = cache.get(hash_files("ground_graph", [path_to_schema, path_to_structure, path_to_skeleton]), create, attach)
+    if shared:
+        return ground_graph
+    ground_graph = copy(ground_graph)
+    ground_graph.structure = deepcopy(ground_graph.structure)
+    ground_graph.skeleton = copy(ground_graph.skeleton)
+    return ground_graph
+
+def load_adjacency(path_to_schema: str, path_to_structure: str, path_to_skeleton: str, cache: ArtifactCache = None, shared: bool = False) -> dict:
+    """ Build the adjacency matrices of the skeleton through the cache
+
+    Args:
+        path_to_schema (str): location of the schema JSON file
+        path_to_structure (str): location of the structure JSON file
+        path_to_skeleton (str): location of the skeleton JSON file
+        cache (ArtifactCache, optional): cache to use. Defaults to default_cache.
+        shared (bool, optional): return the cached matrices themselves, which must not be changed. Defaults to False.
+
+    Returns:
+        dict: a copy of the sparse adjacency matrix for each relationship class as returned by create_adj_mat_dict
+    """
+    cache = default_cache if cache is None else cache
+
+    def create():
+        from relational.graphs import create_adj_mat_dict
+
+        return create_adj_mat_dict(load_structure(path_to_schema, path_to_structure, cache, shared=True), load_skeleton(path_to_schema, path_to_skeleton, cache, shared=True))
+    adjacency = cache.get(hash_files("adjacency", [path_to_schema, path_to_structure, path_to_skeleton]), create)
+    return adjacency if shared else {relation: adj_mat.copy() for relation, adj_mat in adjacency.items()}
@@ -21,6 +21,13 @@ class RelationalCausalStructure:
         self.parents = {}
         self.incoming_edges = self.create_incoming_edges_dict()
 
+        # Topological layers are computed on demand and cached until an edge breaks the order
+        self.topological_layers = None
+        self.topological_positions = None
+
+        # Abstract ground graphs are cached by (perspective, hop threshold) until the edges change
+        self.abstract_ground_graphs = {}
+
     def add_edge(self, relation, node_from, node_to):
         """Adds edge to the relational causal structure
 
@@ -49,18 +56,24 @@ class RelationalCausalStructure:
             print(f"Attribute {node_to.attribute} of entity {node_to.entity} not in schema")
 
         # Check if relations are valid
-        elif relation.lower() == "self":
-            if node_from.entity != node_to.entity:
-                print(f"Self relation between {node_from.entity} and {node_to.entity} is not possible")
-        elif node_from.entity not in self.schema.relations[relation] or node_to.entity not in self.schema.relations[relation]:
+        elif relation.lower() == "self" and node_from.entity != node_to.entity:
+            print(f"Self relation between {node_from.entity} and {node_to.entity} is not possible")
+        elif relation.lower() != "self" and (node_from.entity not in self.schema.relations[relation] or node_to.entity not in self.schema.relations[relation]):
             print(f"Relation {relation} not valid between {node_from.entity} and {node_to.entity}")
 
+        # Check if the edge would create a cycle
+        elif self.is_ancestor(node_to, node_from):
+            print(f"Edge from {tuple(node_from)} to {tuple(node_to)} would create a cycle")
+
         else:
 
             # Add edge to the edge list
             if relation not in self.edges:
                 self.edges[relation] = set()
-            self.edges[relation].add(Edge(node_from, node_to))
+            edge = Edge(node_from, node_to)
+            if edge not in self.edges[relation]:
+                self.incoming_edges[node_to.entity][node_to.attribute].append((relation, edge))
+            self.edges[relation].add(edge)
 
             # Update the list of parents
             if node_to not in self.parents:
@@ -68,6 +81,12 @@ class RelationalCausalStructure:
             if node_from not in self.parents:
                 self.parents[node_from] = set()
             self.parents[node_to].add(node_from)
+            self.abstract_ground_graphs = {}
+
+            # The cached layers stay valid as long as the parent is in an earlier layer than the child
+            if self.topological_positions is not None and self.topological_positions[node_from] >= self.topological_positions[node_to]:
+                self.topological_layers = None
+                self.topological_positions = None
 
     def load(self, path_to_json):
         """Loads edge set from a JSON file
@@ -95,6 +114,12 @@ class RelationalCausalStructure:
                     self.parents[edge.parent] = set()
             # Convert list of edges to set
             self.edges[relation] = set(self.edges[relation])
+        self.incoming_edges = self.create_incoming_edges_dict()
+        self.topological_layers = None
+        self.topological_positions = None
+        self.abstract_ground_graphs = {}
+        if not self.is_acyclic():
+            print("Relational causal structure loaded from file has a cycle")
 
     def save(self, path_to_json: str):
         """Saves edge set to a JSON file
@@ -135,4 +160,91 @@ class RelationalCausalStructure:
         """ 
         Get the list of incoming edges to an attribute of an entity
         """
-        return self.incoming_edges[entity_name][attribute_name]
\ No newline at end of file
+        return self.incoming_edges[entity_name][attribute_name]
+
+    def is_ancestor(self, node, descendant):
+        """ Check if there is a directed path from node to descendant, a node is its own ancestor
+
+        Args:
+            node (Node): named tuple with the form (entity, attribute)
+            descendant (Node): named tuple with the form (entity, attribute)
+
+        Returns:
+            bool: True if node is an ancestor of descendant
+        """
+        visited = set([descendant])
+        stack = [descendant]
+        while len(stack) > 0:
+            current = stack.pop()
+            if current == node:
+                return True
+            for parent in self.parents.get(current, set()):
+                if parent not in visited:
+                    visited.add(parent)
+                    stack.append(parent)
+        return False
+
+    def get_topological_layers(self):
+        """ Obtain a layer schedule of the structure, every node comes after all of its parents
+            The schedule is cached and only recomputed after an add_edge that breaks it
+
+        Returns:
+            list: list of layers, each a sorted list of nodes whose parents are all in earlier layers, or None if there is a cycle
+        """
+        if self.topological_layers is None:
+            num_parents = {node: len(self.parents.get(node, set())) for node in self.nodes}
+            children = {node: [] for node in self.nodes}
+            for node, parents in self.parents.items():
+                for parent in parents:
+                    children[parent].append(node)
+            layers = []
+            layer = sorted(node for node, count in num_parents.items() if count == 0)
+            while len(layer) > 0:
+                layers.append(layer)
+                next_layer = []
+                for node in layer:
+                    for child in children[node]:
+                        num_parents[child] -= 1
+                        if num_parents[child] == 0:
+                            next_layer.append(child)
+                layer = sorted(next_layer)
+            if sum(len(layer) for layer in layers) < len(self.nodes):
+                return None
+            self.topological_layers = layers
+            self.topological_positions = {node: idx for idx, layer in enumerate(layers) for node in layer}
+        return self.topological_layers
+
+    def get_topological_order(self):
+        """ Obtain a topological order of the nodes in the structure
+
+        Returns:
+            list: list of nodes, or None if there is a cycle
+        """
+        layers = self.get_topological_layers()
+        if layers is None:
+            return None
+        return [node for layer in layers for node in layer]
+
+    def is_acyclic(self):
+        """
+        Check if the relational causal structure has no directed cycles
+        """
+        return self.get_topological_layers() is not None
+
+    def get_abstract_ground_graph(self, perspective: str, hop_threshold: int):
+        """ Obtain the abstract ground graph from the perspective of an entity, it is cached until an edge is added
+
+        Args:
+            perspective (str): entity that all relational paths start from
+            hop_threshold (int): maximum number of relations on a relational path
+
+        Returns:
+            AbstractGroundGraph: the abstract ground graph, or None if the entity is not in the schema
+        """
+        from relational.abstract_ground_graph import AbstractGroundGraph
+        if perspective not in self.schema.entity_classes:
+            print(f"Entity {perspective} not in schema")
+            return None
+        if (perspective, hop_threshold) not in self.abstract_ground_graphs:
+            self.abstract_ground_graphs[(perspective, hop_threshold)] = AbstractGroundGraph(self, perspective, hop_threshold)
+        return self.abstract_ground_graphs[(perspective, hop_threshold)]
@@ -1,6 +1,35 @@
 import json
+import os
+from collections.abc import Mapping
+from copy import copy
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
 import torch
 
+from relational.utils import RelationIndex, SkeletonViolation
+
+class RelationshipInstances(Mapping):
+    """
+    Read-only view of the relationship instances of a skeleton as tuples of (name, name) pairs.
+    Instances set from positions are decoded on every lookup, use RelationalSkeleton.get_relation_index for large skeletons
+    and RelationalSkeleton.set_relationship_instances to change them.
+    """
+    def __init__(self, skeleton) -> None:
+        self.skeleton = skeleton
+
+    def __getitem__(self, relation):
+        return self.skeleton.get_relationship_instances(relation)
+
+    def __iter__(self):
+        return iter(relation for relation in self.skeleton.relations if relation in self.skeleton._named_edges or relation in self.skeleton._edge_positions)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
 class RelationalSkeleton:
     """
     Relational Skeleton
@@ -10,71 +39,278 @@ class RelationalSkeleton:
 
     def empty_skeleton(self, schema):
         self.entity_instances = {}
-        self.relationship_instances = {}
         for entity in schema.entity_classes:
             self.entity_instances[entity] = {"names": []}
             for attribute in schema.attribute_classes[entity]:
                 self.entity_instances[entity][attribute] = []
-        for relation in schema.relationship_classes:
-            self.relationship_instances[relation] = []
+        # Relationship instances are stored either as name pairs or as integer positions, never both
+        self._named_edges = {relation: () for relation in schema.relationship_classes}
+        self._edge_positions = {}
         self.instance_type = {}
+        self.relations = dict(schema.relations)
+        # Incremented by set_attribute_values so that feature matrices notice values changed in place
+        self.attribute_versions = {}
+        self.invalidate_index()
+
+    @property
+    def relationship_instances(self) -> RelationshipInstances:
+        """ Read-only view of the relationship instances, change them with set_relationship_instances so the relation index stays valid
+        """
+        return RelationshipInstances(self)
+
+    def invalidate_index(self):
+        """
+        Drop the instance and relation indexes and the feature matrices built from them, they are rebuilt on the next lookup
+        """
+        self.instance_positions = {}
+        self.relation_index = {}
+        self.feature_matrices = {}
+
+    def __copy__(self):
+        """ Shallow copy sharing the instance names, values and position arrays but not the dicts holding them,
+            so setting values or relationship instances of the copy never changes this skeleton or its indexes
+        """
+        skeleton = RelationalSkeleton.__new__(RelationalSkeleton)
+        skeleton.__dict__.update(self.__dict__)
+        skeleton.entity_instances = {entity: dict(instances) for entity, instances in self.entity_instances.items()}
+        for key in ["relations", "_named_edges", "_edge_positions", "instance_positions", "relation_index", "feature_matrices",
+                    "attribute_versions"]:
+            setattr(skeleton, key, dict(getattr(self, key)))
+        return skeleton
 
     def get_instance_type(self, instance):
+        if instance not in self.instance_type:
+            # Skeletons generated from positions don't keep a type per instance, so it is looked up in the name indexes
+            for entity in self.entity_instances:
+                if instance in self.get_instance_positions(entity):
+                    return entity
         return self.instance_type[instance]
 
     def load(self, schema, path_to_json):
         with open(path_to_json, 'r') as f:
             skeleton_dict = json.load(f)
         self.entity_instances = skeleton_dict["entity_instances"]
+        self.instance_type = {}
         for entity in self.entity_instances:
             # Save entity types for all entities
             for name in self.entity_instances[entity]["names"]:
                 self.instance_type[name] = entity
-        self.relationship_instances = skeleton_dict["relationship_instances"]
-        for relation in self.relationship_instances:
-            self.relationship_instances[relation] = [tuple(e) for e in self.relationship_instances[relation]]
-        if not self.is_valid_skeleton(schema):
+        self._named_edges = {relation: tuple(tuple(e) for e in instance_edges) for relation, instance_edges in skeleton_dict["relationship_instances"].items()
+                             if isinstance(instance_edges, list)}
+        self._edge_positions = {}
+        self.relations = dict(schema.relations)
+        self.invalidate_index()
+        violations = self.validate_skeleton(schema)
+        if len(violations) > 0:
+            for violation in violations:
+                print(violation.message)
             print("Skeleton is invalid for the given schema, could not load from file")
             self.empty_skeleton(schema)
 
     def save(self, schema, path_to_json):
         if self.is_valid_skeleton(schema):
+            # Convert columnar attribute values to lists for JSON serialization
+            entity_instances = {}
+            for entity, instances in self.entity_instances.items():
+                entity_instances[entity] = {}
+                for key, values in instances.items():
+                    entity_instances[entity][key] = values.tolist() if isinstance(values, np.ndarray) else values
             skeleton_dict = {
-                "entity_instances": self.entity_instances,
-                "relationship_instances": self.relationship_instances
+                "entity_instances": entity_instances,
+                "relationship_instances": dict(self.relationship_instances)
             }
             with open(path_to_json, 'w') as f:
                 json.dump(skeleton_dict, f)
         else:
-            print("Skeleton is invalid for the given schema, could not write to file")                
+            print("Skeleton is invalid for the given schema, could not write to file")
+
+    def load_columnar(self, schema, path_to_dir, mmap = True):
+        """ Load a skeleton saved in the columnar format, attribute values and instance edges are memory-mapped
+
+        Args:
+            schema (RelationalSchema): schema of the skeleton
+            path_to_dir (str): directory written by save_columnar
+            mmap (bool, optional): memory-map the arrays instead of reading them into memory. Defaults to True.
+        """
+        mmap_mode = 'c' if mmap else None
+        self.empty_skeleton(schema)
+        for entity in schema.entity_classes:
+            names = np.load(os.path.join(path_to_dir, f"{entity}.names.npy")).tolist()
+            self.entity_instances[entity]["names"] = names
+            for name in names:
+                self.instance_type[name] = entity
+            for attribute in schema.attribute_classes[entity]:
+                self.entity_instances[entity][attribute] = np.load(os.path.join(path_to_dir, f"{entity}.{attribute}.npy"), mmap_mode=mmap_mode)
+
+        # Instance edges are stored as positions and stay memory-mapped, they are only read through get_relation_index
+        for relation, (entity_from, entity_to) in schema.relations.items():
+            instance_edges = np.load(os.path.join(path_to_dir, f"{relation}.edges.npy"), mmap_mode=mmap_mode)
+            self.set_relationship_instances(relation, instance_edges[:, 0], instance_edges[:, 1])
+        if not self.is_valid_skeleton(schema):
+            print("Skeleton is invalid for the given schema, could not load from directory")
+            self.empty_skeleton(schema)
+
+    def save_columnar(self, schema, path_to_dir, dtype = None):
+        """ Save the skeleton in a columnar format with one .npy file per entity attribute and one integer edge array per relation
+            Edges are int32 unless an entity has too many instances, in which case they are int64
+
+        Args:
+            schema (RelationalSchema): schema of the skeleton
+            path_to_dir (str): directory to write to, created if it does not exist
+            dtype (np.dtype, optional): type of attribute values, e.g. np.float32 to halve the size. Defaults to the type of the values.
+        """
+        if self.is_valid_skeleton(schema):
+            os.makedirs(path_to_dir, exist_ok=True)
+            for entity in schema.entity_classes:
+                np.save(os.path.join(path_to_dir, f"{entity}.names.npy"), np.array(self.entity_instances[entity]["names"], dtype=str))
+                for attribute in schema.attribute_classes[entity]:
+                    values = np.asarray(self.entity_instances[entity][attribute], dtype=dtype)
+                    np.save(os.path.join(path_to_dir, f"{entity}.{attribute}.npy"), values)
+            max_instances = max([len(instances["names"]) for instances in self.entity_instances.values()], default=0)
+            edge_dtype = np.int32 if max_instances <= np.iinfo(np.int32).max else np.int64
+            for relation in schema.relationship_classes:
+                index = self.get_relation_index(relation)
+                instance_edges = np.stack([index.source, index.target], axis=1).astype(edge_dtype)
+                np.save(os.path.join(path_to_dir, f"{relation}.edges.npy"), instance_edges)
+        else:
+            print("Skeleton is invalid for the given schema, could not write to directory")
 
     def is_valid_skeleton(self, schema):
+        return len(self.validate_skeleton(schema)) == 0
+
+    def validate_skeleton(self, schema) -> list:
+        """ Check the skeleton against the schema and collect all violations
+            Relationship instances are checked with vectorized lookups of encoded instance positions
+
+        Args:
+            schema (RelationalSchema): schema of the skeleton
+
+        Returns:
+            list: a SkeletonViolation for every failed check, empty if the skeleton is valid
+        """
+        violations = []
         for entity in schema.entity_classes:
             if entity not in self.entity_instances or not isinstance(self.entity_instances[entity], dict):
-                print(f"Entity {entity} in the schema is missing in the skeleton")
-                return False
+                violations.append(SkeletonViolation("missing_entity", entity, 1, f"Entity {entity} in the schema is missing in the skeleton"))
+                continue
             if "names" not in self.entity_instances[entity]:
-                print(f"Names are missing for entity {entity}")
-                return False
+                violations.append(SkeletonViolation("missing_names", entity, 1, f"Names are missing for entity {entity}"))
+                continue
+            num_instances = len(self.entity_instances[entity]["names"])
+            num_unique = len(self.get_instance_positions(entity).unique())
+            if num_unique != num_instances:
+                violations.append(SkeletonViolation("duplicate_names", entity, num_instances - num_unique, f"Instance names of entity {entity} are not unique"))
             for attribute in schema.attribute_classes[entity]:
+                location = f"{entity}.{attribute}"
                 if attribute not in self.entity_instances[entity]:
-                    print(f"Attribute {entity}.{attribute} in the schema is missing in the skeleton")
-                    return False
-                if not isinstance(self.entity_instances[entity][attribute], list):
-                    print(f"Values of {entity}.{attribute} are not in a list or missing")
-                    return False
-                if len(self.entity_instances[entity][attribute]) != len(self.entity_instances[entity]["names"]):
-                    print(f"Number of values of {entity}.{attribute} are not equal to the number of instance names")
-                    return False
-        all_instance_names = self.instance_type.keys()
+                    violations.append(SkeletonViolation("missing_attribute", location, 1, f"Attribute {location} in the schema is missing in the skeleton"))
+                elif not isinstance(self.entity_instances[entity][attribute], (list, np.ndarray)):
+                    violations.append(SkeletonViolation("invalid_values", location, 1, f"Values of {location} are not in a list or missing"))
+                elif len(self.entity_instances[entity][attribute]) != num_instances:
+                    num_values = len(self.entity_instances[entity][attribute])
+                    violations.append(SkeletonViolation("length_mismatch", location, abs(num_values - num_instances), f"Number of values of {location} ({num_values}) is not equal to the number of instance names ({num_instances})"))
+
+        # Relationship instances can only be encoded if all entities have names
+        # and names are only looked up for entities whose names are unique
+        if any(violation.kind in ["missing_entity", "missing_names"] for violation in violations):
+            return violations
+        duplicated = set(violation.location for violation in violations if violation.kind == "duplicate_names")
         for relation in schema.relationship_classes:
-            if relation not in self.relationship_instances or not isinstance(self.relationship_instances[relation], list):
-               return False
+            entity_from, entity_to = schema.relations[relation]
+            if relation in self._edge_positions:
+                source, target = (np.asarray(positions) for positions in self._edge_positions[relation])
+                if source.ndim != 1 or source.shape != target.shape:
+                    violations.append(SkeletonViolation("invalid_instance", relation, 1, f"Instances of relation {relation} don't have one source and one target position each"))
+                    continue
+                num_from, num_to = len(self.entity_instances[entity_from]["names"]), len(self.entity_instances[entity_to]["names"])
+                unknown = (source < 0) | (source >= num_from) | (target < 0) | (target >= num_to)
+                examples = list(zip(source[unknown][:5].tolist(), target[unknown][:5].tolist()))
+            elif relation in self._named_edges:
+                if entity_from in duplicated or entity_to in duplicated:
+                    continue
+                instance_edges = np.array(self._named_edges[relation], dtype=object)
+                if instance_edges.size > 0 and (instance_edges.ndim != 2 or instance_edges.shape[1] != 2):
+                    violations.append(SkeletonViolation("invalid_instance", relation, 1, f"Instances of relation {relation} are not all pairs of instance names"))
+                    continue
+                source, target = self._encode_relationship_instances(relation, instance_edges.reshape(-1, 2))
+                unknown = (source < 0) | (target < 0)
+                examples = [tuple(edge) for edge in instance_edges.reshape(-1, 2)[unknown][:5]]
             else:
-                for item in self.relationship_instances[relation]:
-                    if not isinstance(item, tuple) or item[0] not in all_instance_names or item[1] not in all_instance_names:
-                        return False
-        return True
+                violations.append(SkeletonViolation("missing_relation", relation, 1, f"Instances of relation {relation} are not in a list or missing"))
+                continue
+            if unknown.any():
+                violations.append(SkeletonViolation("unknown_instance", relation, int(unknown.sum()), f"{int(unknown.sum())} instances of relation {relation} refer to instances of the wrong entity or not in the skeleton, e.g. {examples}"))
+                continue
+
+            # An entity on the 'one' side of a relation can have at most one partner per instance of the other entity
+            for entity, positions, partner in [(entity_from, target, entity_to), (entity_to, source, entity_from)]:
+                if schema.cardinality[relation][entity] == "one" and len(positions) > 0:
+                    counts = np.bincount(positions)
+                    num_violating = int((counts > 1).sum())
+                    if num_violating > 0:
+                        violations.append(SkeletonViolation("cardinality", relation, num_violating, f"{num_violating} instances of {partner} are related to more than one {entity} through {relation}"))
+        return violations
+
+    def get_connected_instances(self, entity: str, positions: np.ndarray) -> dict:
+        """ Find all instances connected to the given instances through any chain of relationship instances
+
+        Args:
+            entity (str): entity of the given instances
+            positions (np.ndarray): positions of the given instances
+
+        Returns:
+            dict: key is an entity and value is a sorted array of positions of its connected instances
+        """
+        reached = {other: np.zeros(len(self.entity_instances[other]["names"]), dtype=bool) for other in self.entity_instances}
+        reached[entity][positions] = True
+        frontier = {entity: np.asarray(positions)}
+        while len(frontier) > 0:
+            next_frontier = {}
+            for relation, (entity_from, entity_to) in self.relations.items():
+                index = self.get_relation_index(relation)
+                for current, neighbor_entity, neighbor_index in [(entity_from, entity_to, index.forward), (entity_to, entity_from, index.reverse)]:
+                    if current not in frontier:
+                        continue
+                    neighbors = np.unique(neighbor_index[frontier[current]].indices)
+                    neighbors = neighbors[~reached[neighbor_entity][neighbors]]
+                    if len(neighbors) > 0:
+                        reached[neighbor_entity][neighbors] = True
+                        next_frontier[neighbor_entity] = np.union1d(next_frontier.get(neighbor_entity, neighbors), neighbors)
+            frontier = next_frontier
+        return {other: np.flatnonzero(mask) for other, mask in reached.items()}
+
+    def get_subskeleton(self, positions: dict) -> "RelationalSkeleton":
+        """ Restrict the skeleton to a subset of instances, keeping relationship instances between them
+
+        Args:
+            positions (dict): key is an entity and value is an array of positions of the instances to keep
+
+        Returns:
+            RelationalSkeleton: a new skeleton containing only the given instances
+        """
+        subskeleton = copy(self)
+        subskeleton.entity_instances = {}
+        subskeleton.instance_type = {}
+        subskeleton._named_edges = {}
+        subskeleton._edge_positions = {}
+        subskeleton.invalidate_index()
+        new_positions = {}
+        for entity, instances in self.entity_instances.items():
+            entity_positions = np.asarray(positions.get(entity, []), dtype=np.int64)
+            subskeleton.entity_instances[entity] = {}
+            for key, values in instances.items():
+                subset = np.asarray(values)[entity_positions]
+                subskeleton.entity_instances[entity][key] = subset.tolist() if isinstance(values, list) else subset
+            subskeleton.instance_type.update(dict.fromkeys(subskeleton.entity_instances[entity]["names"], entity))
+            new_positions[entity] = np.full(len(instances["names"]), -1, dtype=np.int64)
+            new_positions[entity][entity_positions] = np.arange(len(entity_positions))
+        for relation, (entity_from, entity_to) in self.relations.items():
+            index = self.get_relation_index(relation)
+            source = new_positions[entity_from][index.source]
+            target = new_positions[entity_to][index.target]
+            kept = (source >= 0) & (target >= 0)
+            subskeleton.set_relationship_instances(relation, source[kept], target[kept])
+        return subskeleton
 
     def get_attribute_vector(self, entity: str, attribute: str) -> torch.Tensor:
         """ Obtain list of instances of given attribute in given entity
@@ -87,4 +323,145 @@ class RelationalSkeleton:
             torch.Tensor: list of all instances of given attribute in the given entity
         """
         attribute_instances = self.entity_instances[entity][attribute]
-        return torch.Tensor(attribute_instances)
\ No newline at end of file
+        if isinstance(attribute_instances, np.ndarray) and attribute_instances.dtype.kind == "f":
+            # Columnar values share memory with the returned tensor and keep their precision
+            return torch.from_numpy(attribute_instances)
+        return torch.Tensor(attribute_instances)
+
+    def set_attribute_values(self, entity: str, attribute: str, values):
+        """ Set the values of an attribute, bump its version and drop the feature matrices that depend on it
+            Values changed in place must also be set again, e.g. set_attribute_values(entity, attribute, values) with the same array
+
+        Args:
+            entity (str): entity name
+            attribute (str): attribute name
+            values (np.ndarray): value of every instance of the entity, in the order of its names
+        """
+        self.entity_instances[entity][attribute] = values
+        node = (entity, attribute)
+        self.attribute_versions[node] = self.attribute_versions.get(node, 0) + 1
+        self.feature_matrices = {key: entry for key, entry in self.feature_matrices.items() if node not in entry[0]}
+
+    def get_instance_positions(self, entity: str) -> pd.Index:
+        """ Obtain the index mapping instance names of an entity to their integer positions
+
+        Args:
+            entity (str): entity name
+
+        Returns:
+            pd.Index: instance names, use get_indexer or get_loc to look up positions
+        """
+        if entity not in self.instance_positions:
+            self.instance_positions[entity] = pd.Index(self.entity_instances[entity]["names"])
+        return self.instance_positions[entity]
+
+    def get_relation_index(self, relation: str) -> RelationIndex:
+        """ Obtain integer-encoded instance edges and neighbor indexes for a relation
+            Positions in source refer to the first entity of the relation and positions in target to the second
+
+        Args:
+            relation (str): relationship class
+
+        Returns:
+            RelationIndex: source and target position arrays, and forward/reverse CSR neighbor indexes
+        """
+        if relation not in self.relation_index:
+            if relation in self._edge_positions:
+                source, target = self._edge_positions[relation]
+            else:
+                source, target = self._encode_relationship_instances(relation)
+                source, target = source.astype(np.int64), target.astype(np.int64)
+            self.relation_index[relation] = self._create_relation_index(relation, source, target)
+        return self.relation_index[relation]
+
+    def get_relationship_instances(self, relation: str) -> tuple:
+        """ Obtain the instance edges of a relation as names, decoding them from positions if they were set from positions
+
+        Args:
+            relation (str): relationship class
+
+        Returns:
+            tuple: (name, name) pair of every instance edge
+        """
+        if relation in self._named_edges:
+            return self._named_edges[relation]
+        source, target = self._edge_positions[relation]
+        entity_from, entity_to = self.relations[relation]
+        names_from = self.get_instance_positions(entity_from)[np.asarray(source)].tolist()
+        names_to = self.get_instance_positions(entity_to)[np.asarray(target)].tolist()
+        return tuple(zip(names_from, names_to))
+
+    def _encode_relationship_instances(self, relation, instance_edges = None):
+        entity_from, entity_to = self.relations[relation]
+        positions_from = self.get_instance_positions(entity_from)
+        positions_to = self.get_instance_positions(entity_to)
+        if instance_edges is None:
+            instance_edges = np.array(self._named_edges[relation], dtype=object).reshape(-1, 2)
+        source = positions_from.get_indexer(instance_edges[:, 0])
+        target = positions_to.get_indexer(instance_edges[:, 1])
+
+        # Instance edges may be stored in either direction, swap the ones that are reversed
+        reversed_edges = (source < 0) | (target < 0)
+        if entity_from != entity_to and reversed_edges.any():
+            source[reversed_edges] = positions_from.get_indexer(instance_edges[reversed_edges, 1])
+            target[reversed_edges] = positions_to.get_indexer(instance_edges[reversed_edges, 0])
+        return source, target
+
+    def _create_relation_index(self, relation, source, target):
+        entity_from, entity_to = self.relations[relation]
+        data = np.ones(len(source), dtype=bool)
+        shape = (len(self.entity_instances[entity_from]["names"]), len(self.entity_instances[entity_to]["names"]))
+        forward = sp.csr_matrix((data, (source, target)), shape=shape)
+        return RelationIndex(source, target, forward, forward.T.tocsr())
+
+    def set_relationship_instances(self, relation: str, source, target):
+        """ Set the instance edges of a relation and drop the indexes built from the old ones
+            Integer positions are kept as given, e.g. memory-mapped, and are never decoded to names unless requested
+
+        Args:
+            relation (str): relationship class
+            source (np.ndarray): positions or names of instances of the first entity of the relation
+            target (np.ndarray): positions or names of instances of the second entity of the relation
+        """
+        source, target = np.asarray(source), np.asarray(target)
+        self._named_edges.pop(relation, None)
+        self._edge_positions.pop(relation, None)
+        if source.dtype.kind in "iu" and target.dtype.kind in "iu":
+            self._edge_positions[relation] = (source, target)
+        else:
+            self._named_edges[relation] = tuple(zip(source.tolist(), target.tolist()))
+        self.relation_index.pop(relation, None)
+        self.feature_matrices = {}
+
+    def get_neighbors(self, relation: str, instance: str) -> list:
+        """ Obtain all instances connected to the given instance through a relation
+
+        Args:
+            relation (str): relationship class
+            instance (str): instance name
+
+        Returns:
+            list: names of the neighboring instances
+        """
+        entity_from, entity_to = self.relations[relation]
+        index = self.get_relation_index(relation)
+        if self.get_instance_type(instance) == entity_from:
+            neighbor_index, neighbor_entity = index.forward, entity_to
+            position = self.get_instance_positions(entity_from).get_loc(instance)
+        else:
+            neighbor_index, neighbor_entity = index.reverse, entity_from
+            position = self.get_instance_positions(entity_to).get_loc(instance)
+        neighbors = neighbor_index.indices[neighbor_index.indptr[position]:neighbor_index.indptr[position + 1]]
+        return self.get_instance_positions(neighbor_entity)[np.sort(neighbors)].tolist()
+
+def convert_skeleton_to_columnar(schema, path_to_json, path_to_dir):
+    """ Convert a skeleton from the JSON layout to the columnar format
+
+    Args:
+        schema (RelationalSchema): schema of the skeleton
+        path_to_json (str): location of the JSON skeleton
+        path_to_dir (str): directory to write the columnar skeleton to
+    """
+    skeleton = RelationalSkeleton(schema)
+    skeleton.load(schema, path_to_json)
+    skeleton.save_columnar(schema, path_to_dir)
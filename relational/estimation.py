@@ -0,0 +1,244 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from copy import copy
+
+import numpy as np
+import scipy.sparse as sp
+import torch
+
+from relational.ground_graph import GroundGraph
+from relational.sampling import RelationalSampler
+from relational.shm import attach_array, share_array
+from relational.utils import EffectEstimate, InstanceNode, Node
+
+EFFECTS = ['overall', 'isolated', 'peer']
+
+# State of each worker process, set once by the pool initializer
+_worker_state = {}
+
+def _init_ite_worker(sampler, ground_graph, descriptors, treatment_value, control_value):
+    adjacency_shape, indptr, indices = descriptors["adjacency"]
+    indices = attach_array(indices)
+    ground_graph._adjacency = sp.csr_matrix((np.ones(len(indices), dtype=bool), indices, attach_array(indptr)), shape=adjacency_shape, copy=False)
+    _worker_state["sampler"] = sampler
+    _worker_state["ground_graph"] = ground_graph
+    _worker_state["samples"] = {node: torch.from_numpy(attach_array(descriptor)) for node, descriptor in descriptors["samples"].items()}
+    _worker_state["noise"] = {node: torch.from_numpy(attach_array(descriptor)) for node, descriptor in descriptors["noise"].items()}
+    _worker_state["treatment_value"] = treatment_value
+    _worker_state["control_value"] = control_value
+
+def _estimate_ite_shard(units: list) -> list:
+    return [estimate_ite(_worker_state["sampler"], _worker_state["ground_graph"], _worker_state["samples"], _worker_state["noise"],
+                         treatment, outcome, _worker_state["treatment_value"], _worker_state["control_value"]) for treatment, outcome in units]
+
+def estimate_ite(sampler: RelationalSampler, ground_graph: GroundGraph, samples: dict, noise: dict, treatment: InstanceNode, outcome: InstanceNode, treatment_value: float = 1.0, control_value: float = 0.0) -> tuple:
+    """ Estimate the effect of setting one treatment instance on one outcome instance
+        Both interventions reuse the same samples and noise, and only descendants of the treatment are recomputed
+
+    Args:
+        sampler (RelationalSampler): sampler of the relational SCM
+        ground_graph (GroundGraph): ground graph of the structure and skeleton of the sampler, not mutated
+        samples (dict): samples returned by sampler.sample
+        noise (dict): noise returned by sampler.sample with return_noise
+        treatment (InstanceNode): an (entity, attribute, instance) tuple of strings
+        outcome (InstanceNode): an (entity, attribute, instance) tuple of strings
+        treatment_value (float, optional): value of the treatment. Defaults to 1.0.
+        control_value (float, optional): value of the control. Defaults to 0.0.
+
+    Returns:
+        tuple: the effect averaged over samples, and the time taken in seconds
+    """
+    start = time.perf_counter()
+    treatment_id = ground_graph.get_node_id(treatment)
+    affected = ground_graph.get_descendants([treatment_id])
+    affected[treatment_id] = True
+    outcome_node = Node(outcome.entity, outcome.attribute)
+    outcome_position = sampler.skeleton.get_instance_positions(outcome.entity).get_loc(outcome.instance)
+    treated = sampler.recompute(samples, noise, ground_graph, affected, {treatment: treatment_value})[outcome_node][..., outcome_position]
+    control = sampler.recompute(samples, noise, ground_graph, affected, {treatment: control_value})[outcome_node][..., outcome_position]
+    effect = (treated - control).mean().item()
+    return effect, time.perf_counter() - start
+
+def estimate_ites(sampler: RelationalSampler, ground_graph: GroundGraph, treatments: list, outcomes: list, treatment_value: float = 1.0, control_value: float = 0.0,
+                  num_samples: int = 100, num_workers: int = None, shards_per_worker: int = 4, generator: torch.Generator = None) -> tuple:
+    """ Estimate individual treatment effects for many treatment and outcome units in parallel
+        One set of samples is drawn and shared with all worker processes together with the ground graph adjacency
+        through shared memory, then the units are split into shards across a process pool.
+        Only the samples, noise and adjacency are shared, the sampler with its SCM and skeleton and the ground graph without
+        its arrays are pickled once per worker by the pool initializer
+
+    Args:
+        sampler (RelationalSampler): sampler of the relational SCM
+        ground_graph (GroundGraph): ground graph of the structure and skeleton of the sampler
+        treatments (list): list of InstanceNode treatments
+        outcomes (list): list of InstanceNode outcomes, one for each treatment
+        treatment_value (float, optional): value of the treatment. Defaults to 1.0.
+        control_value (float, optional): value of the control. Defaults to 0.0.
+        num_samples (int, optional): number of samples to average over. Defaults to 100.
+        num_workers (int, optional): number of processes, units are estimated in this process if 1. Defaults to the number of CPUs.
+        shards_per_worker (int, optional): number of shards per process to balance load. Defaults to 4.
+        generator (torch.Generator, optional): random number generator for the noise terms. Defaults to None.
+
+    Returns:
+        tuple: np.ndarray of effects and np.ndarray of seconds spent on each unit
+    """
+    samples, noise = sampler.sample(num_samples, generator, return_noise=True)
+    units = list(zip(treatments, outcomes))
+    if num_workers == 1 or len(units) <= 1:
+        results = [estimate_ite(sampler, ground_graph, samples, noise, treatment, outcome, treatment_value, control_value) for treatment, outcome in units]
+    else:
+        blocks = []
+        descriptors = {"samples": {}, "noise": {}}
+        for key, tensors in [("samples", samples), ("noise", noise)]:
+            for node, tensor in tensors.items():
+                block, descriptors[key][node] = share_array(tensor.contiguous().numpy())
+                blocks.append(block)
+        adjacency = ground_graph.adjacency
+        indptr_block, indptr = share_array(adjacency.indptr)
+        indices_block, indices = share_array(adjacency.indices)
+        blocks.extend([indptr_block, indices_block])
+        descriptors["adjacency"] = (adjacency.shape, indptr, indices)
+
+        # Heavy arrays are not pickled, workers read the adjacency from shared memory
+        light_ground_graph = copy(ground_graph)
+        light_ground_graph.sources = None
+        light_ground_graph.targets = None
+        light_ground_graph.values = None
+        light_ground_graph._adjacency = None
+        light_ground_graph._networkx = None
+        # Feature matrices cached on the skeleton aren't needed to recompute samples, so they aren't pickled either
+        light_sampler = copy(sampler)
+        light_sampler.skeleton = copy(sampler.skeleton)
+        light_sampler.skeleton.feature_matrices = {}
+        num_workers = os.cpu_count() if num_workers is None else num_workers
+        try:
+            with ProcessPoolExecutor(num_workers, initializer=_init_ite_worker,
+                                     initargs=(light_sampler, light_ground_graph, descriptors, treatment_value, control_value)) as executor:
+                num_shards = min(len(units), num_workers * shards_per_worker)
+                shards = [units[idx::num_shards] for idx in range(num_shards)]
+                shard_results = list(executor.map(_estimate_ite_shard, shards))
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+        # Shards were taken with a stride, put the results back in the order of the units
+        results = [None] * len(units)
+        for idx, shard_result in enumerate(shard_results):
+            results[idx::num_shards] = shard_result
+    effects = np.array([effect for effect, _ in results])
+    timings = np.array([seconds for _, seconds in results])
+    return effects, timings
+
+def get_peer_matrix(sampler: RelationalSampler, entity: str, relations: list) -> sp.csr_matrix:
+    """ Connect each instance of an entity to the instances reached by following a path of relationship classes
+        An instance is never its own peer
+
+    Args:
+        sampler (RelationalSampler): sampler of the relational SCM
+        entity (str): entity the path starts from
+        relations (list): relationship classes of the path, e.g. ["contains", "contains"] for towns in the same state
+
+    Returns:
+        sp.csr_matrix: boolean matrix from instances of entity to instances of the last entity of the path, or None if the path is not valid
+    """
+    schema = sampler.structure.schema
+    skeleton = sampler.skeleton
+    peers = sp.identity(len(skeleton.entity_instances[entity]["names"]), dtype=bool, format='csr')
+    current = entity
+    for relation in relations:
+        if relation not in schema.relations or current not in schema.relations[relation]:
+            print(f"Relation {relation} does not connect to entity {current}")
+            return None
+        entity_from, entity_to = schema.relations[relation]
+        index = skeleton.get_relation_index(relation)
+        if entity_from == entity_to:
+            neighbors = index.forward + index.reverse
+        elif current == entity_from:
+            neighbors, current = index.forward, entity_to
+        else:
+            neighbors, current = index.reverse, entity_from
+        peers = (peers @ neighbors).astype(bool)
+    if current == entity:
+        peers.setdiag(False)
+        peers.eliminate_zeros()
+    return peers.tocsr()
+
+def estimate_effect(sampler: RelationalSampler, treatment: Node, outcome: Node, effect: str = 'overall', treatment_value: float = 1.0, control_value: float = 0.0,
+                    peer_relations: list = None, batch_size: int = 100, max_samples: int = 10000, tolerance: float = None, unit_batch_size: int = 64,
+                    generator: torch.Generator = None) -> EffectEstimate:
+    """ Estimate the average effect of a treatment attribute on an outcome attribute by Monte Carlo
+        Every treatment configuration is a batch dimension of one forward pass, so all of them share the noise of each sample
+
+        - overall: all treatment instances set to the treatment value versus all set to the control value, averaged over outcome instances
+        - isolated: only the treatment of the outcome instance itself is set, the treatment and outcome must be of the same entity
+        - peer: only the treatments of peers of the outcome instance are set, peers are found by following peer_relations
+
+    Args:
+        sampler (RelationalSampler): sampler of the relational SCM
+        treatment (Node): treatment (entity, attribute)
+        outcome (Node): outcome (entity, attribute)
+        effect (str, optional): one of 'overall', 'isolated', 'peer'. Defaults to 'overall'.
+        treatment_value (float, optional): value of the treatment. Defaults to 1.0.
+        control_value (float, optional): value of the control, every other treatment instance is held at this value. Defaults to 0.0.
+        peer_relations (list, optional): relationship classes leading from the outcome entity to the treatment entity for peer effects. Defaults to None.
+        batch_size (int, optional): number of samples drawn at a time. Defaults to 100.
+        max_samples (int, optional): largest number of samples. Defaults to 10000.
+        tolerance (float, optional): stop once the Monte Carlo standard error is below it, otherwise draw max_samples. Defaults to None.
+        unit_batch_size (int, optional): number of outcome instances whose configurations are batched together. Defaults to 64.
+        generator (torch.Generator, optional): random number generator for the noise terms. Defaults to None.
+
+    Returns:
+        EffectEstimate: the effect, its Monte Carlo standard error and the number of samples, or None if the effect is not valid
+    """
+    if effect not in EFFECTS:
+        print(f"Effect {effect} is not valid, should be in {EFFECTS}")
+        return None
+    num_treatments = len(sampler.skeleton.entity_instances[treatment.entity]["names"])
+    num_outcomes = len(sampler.skeleton.entity_instances[outcome.entity]["names"])
+
+    # Each row of exposure holds the treatment instances that are set for one outcome instance
+    if effect == 'isolated':
+        if treatment.entity != outcome.entity:
+            print(f"Isolated effect needs the treatment {treatment} and outcome {outcome} to be of the same entity")
+            return None
+        exposure = sp.identity(num_treatments, dtype=bool, format='csr')
+    elif effect == 'peer':
+        exposure = get_peer_matrix(sampler, outcome.entity, [] if peer_relations is None else peer_relations)
+        if exposure is None:
+            return None
+        if exposure.shape[1] != num_treatments:
+            print(f"Peer relations {peer_relations} don't lead from {outcome.entity} to {treatment.entity}")
+            return None
+
+    contrasts = []
+    num_samples = 0
+    standard_error = float("inf")
+    while num_samples < max_samples and (tolerance is None or standard_error > tolerance):
+        size = min(batch_size, max_samples - num_samples)
+        if effect == 'overall':
+            values = torch.tensor([treatment_value, control_value])[:, None, None].expand(2, 1, num_treatments)
+            # Outcomes that don't depend on the treatment have no batch dimension and get the same samples in both arms
+            samples = sampler.sample(size, generator, node_values={treatment: values})[outcome].expand(2, size, num_outcomes)
+            contrast = (samples[0] - samples[1]).mean(-1)
+        else:
+            # Draw the noise once per batch of samples and reuse it for every chunk of outcome instances
+            noise = None
+            contrast = torch.zeros(size)
+            for start in range(0, num_outcomes, unit_batch_size):
+                rows = exposure[start:start + unit_batch_size].toarray()
+                values = torch.full((len(rows) + 1, 1, num_treatments), control_value)
+                values[:-1, 0] += (treatment_value - control_value) * torch.from_numpy(rows).to(values.dtype)
+                samples, noise = sampler.sample(size, generator, return_noise=True, node_values={treatment: values}, noise=noise)
+                samples = samples[outcome].expand(len(rows) + 1, size, num_outcomes)
+                positions = torch.arange(start, start + len(rows))
+                treated = samples[torch.arange(len(rows)), :, positions]
+                contrast += (treated - samples[-1][:, positions].T).sum(0)
+            contrast /= num_outcomes
+        contrasts.append(contrast)
+        num_samples += size
+        if num_samples > 1:
+            standard_error = torch.cat(contrasts).std().item() / num_samples ** 0.5
+    contrasts = torch.cat(contrasts)
+    return EffectEstimate(contrasts.mean().item(), standard_error if num_samples > 1 else float("nan"), num_samples)
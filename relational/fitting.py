@@ -0,0 +1,115 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+from relational.aggregation import flatten
+from relational.data import RelationalSkeleton
+from relational.scm import RelationalSCM
+from relational.utils import FeatureMatrix, LinearGaussian, MLPMechanism
+
+MODELS = ['linear', 'mlp']
+
+def fit_linear_gaussian(feature_matrix: FeatureMatrix, ridge: float = 0.0) -> LinearGaussian:
+    """ Fit a linear Gaussian mechanism to all instances at once with a single least squares solve
+
+    Args:
+        feature_matrix (FeatureMatrix): parent features and values of a node
+        ridge (float, optional): L2 penalty on the weights, not on the bias. Defaults to 0.0.
+
+    Returns:
+        LinearGaussian: weight of each (relation, edge) column, bias and the standard deviation of the residuals
+    """
+    features = feature_matrix.features.double()
+    target = feature_matrix.target.double()
+    num_instances, num_features = features.shape
+    design = torch.cat([features, torch.ones(num_instances, 1, dtype=torch.float64)], dim=1)
+    system, rhs = design, target
+    if ridge > 0:
+        # The penalty is solved as extra rows sqrt(ridge) * I with zero targets, the bias column gets no row
+        penalty = torch.cat([ridge ** 0.5 * torch.eye(num_features, dtype=torch.float64), torch.zeros(num_features, 1, dtype=torch.float64)], dim=1)
+        system = torch.cat([design, penalty], dim=0)
+        rhs = torch.cat([target, torch.zeros(num_features, dtype=torch.float64)])
+    coefficients = torch.linalg.lstsq(system, rhs[:, None]).solution.squeeze(-1)
+    residuals = target - design @ coefficients
+    scale = (residuals.square().sum() / max(num_instances - num_features - 1, 1)).sqrt().item()
+    weights = {(relation, edge): weight for (relation, edge, _), weight in zip(feature_matrix.columns, coefficients[:-1].tolist())}
+    return LinearGaussian(weights, coefficients[-1].item(), scale)
+
+def fit_mlp(feature_matrix: FeatureMatrix, network: torch.nn.Module, num_steps: int = 200, lr: float = 0.01) -> MLPMechanism:
+    """ Fit a network to all instances at once with full-batch Adam on the mean squared error
+
+    Args:
+        feature_matrix (FeatureMatrix): parent features and values of a node
+        network (torch.nn.Module): maps features of shape (num_instances, num_columns) to shape (num_instances, 1), trained in place
+        num_steps (int, optional): number of optimization steps. Defaults to 200.
+        lr (float, optional): learning rate. Defaults to 0.01.
+
+    Returns:
+        MLPMechanism: the network, the column of each input feature and the standard deviation of the residuals
+    """
+    features = feature_matrix.features.float()
+    target = feature_matrix.target.float()
+    optimizer = torch.optim.Adam(network.parameters(), lr=lr)
+    for _ in range(num_steps):
+        optimizer.zero_grad()
+        loss = (network(features).squeeze(-1) - target).square().mean()
+        loss.backward()
+        optimizer.step()
+    with torch.no_grad():
+        scale = (network(features).squeeze(-1) - target).square().mean().sqrt().item()
+    return MLPMechanism(network, feature_matrix.columns, scale)
+
+def fit_scm(scm: RelationalSCM, skeleton: RelationalSkeleton, model: str = 'linear', aggregation: str = 'mean', num_workers: int = None,
+            ridge: float = 0.0, hidden_size: int = 16, num_steps: int = 200, lr: float = 0.01) -> dict:
+    """ Fit the mechanism of every observed node with a noise term, all instances of a node are fit in one batch
+        Feature matrices are built once and cached on the skeleton, then the nodes are fit concurrently in a thread pool,
+        since least squares solves and network updates release the GIL
+
+    Args:
+        scm (RelationalSCM): SCM with a structure, linear mechanisms are stored in scm.mechanisms and networks in scm.neural_mechanisms,
+            which are used by the sampler but not by the Pyro and funsor models
+        skeleton (RelationalSkeleton): contains all instances and their observed values
+        model (str, optional): 'linear' for linear Gaussian mechanisms or 'mlp' for a network with one hidden layer. Defaults to 'linear'.
+        aggregation (str, optional): aggregation of parents on the many side of a relation, as used by the sampler. Defaults to 'mean'.
+        num_workers (int, optional): number of threads, nodes are fit in this thread if 1. Defaults to the executor default.
+        ridge (float, optional): L2 penalty of linear mechanisms. Defaults to 0.0.
+        hidden_size (int, optional): width of the hidden layer of networks. Defaults to 16.
+        num_steps (int, optional): number of optimization steps of networks. Defaults to 200.
+        lr (float, optional): learning rate of networks. Defaults to 0.01.
+
+    Returns:
+        dict: key is a node name and value is its fitted LinearGaussian or MLPMechanism
+    """
+    if model not in MODELS:
+        raise ValueError(f"Model {model} is not valid, should be in {MODELS}")
+    feature_matrices = flatten(scm.structure, skeleton, [aggregation])
+    nodes = [node for node in sorted(feature_matrices) if f"noise_{scm.get_name_from_node(node)}" in scm.unobserved_nodes
+             and len(skeleton.entity_instances[node.entity]["names"]) > 0]
+
+    # Networks are created here so that their initialization only uses the global random state in one thread,
+    # and nodes without parents only need a bias and a noise scale so they always get a linear mechanism
+    jobs = []
+    for node in nodes:
+        num_features = feature_matrices[node].features.shape[1]
+        if model == 'linear' or num_features == 0:
+            jobs.append((fit_linear_gaussian, feature_matrices[node], ridge))
+        else:
+            network = torch.nn.Sequential(torch.nn.Linear(num_features, hidden_size), torch.nn.Tanh(), torch.nn.Linear(hidden_size, 1))
+            jobs.append((fit_mlp, feature_matrices[node], network, num_steps, lr))
+
+    if num_workers == 1 or len(jobs) <= 1:
+        mechanisms = [function(*args) for function, *args in jobs]
+    else:
+        with ThreadPoolExecutor(num_workers) as executor:
+            mechanisms = list(executor.map(lambda job: job[0](*job[1:]), jobs))
+
+    fitted = {scm.get_name_from_node(node): mechanism for node, mechanism in zip(nodes, mechanisms)}
+    # A node has a mechanism in only one of the dicts, so refitting in the other mode replaces it
+    for node_name, mechanism in fitted.items():
+        if isinstance(mechanism, LinearGaussian):
+            scm.mechanisms[node_name] = mechanism
+            scm.neural_mechanisms.pop(node_name, None)
+        else:
+            scm.neural_mechanisms[node_name] = mechanism
+            scm.mechanisms.pop(node_name, None)
+    return fitted
@@ -0,0 +1,192 @@
+import math
+from collections import OrderedDict
+
+import funsor
+import funsor.ops as ops
+import torch
+from funsor.cnf import Contraction
+from funsor.gaussian import Gaussian
+
+from relational.aggregation import aggregate_relational_edge
+from relational.data import RelationalSkeleton
+from relational.scm import RelationalSCM
+from relational.utils import EliminationCost
+
+class FunsorLinearGaussian:
+    """
+    Exact inference for a relational SCM with linear Gaussian mechanisms.
+    Each attribute class is one real vector variable over all of its instances, with one batched Gaussian factor
+    for its mechanism, so marginals and conditionals are found by symbolic variable elimination instead of sampling.
+    """
+    def __init__(self, scm: RelationalSCM, skeleton: RelationalSkeleton, aggregation: str = 'mean') -> None:
+
+        if len(scm.neural_mechanisms) > 0:
+            raise ValueError(f"Exact inference needs linear Gaussian mechanisms, refit {sorted(scm.neural_mechanisms)} with model='linear'")
+        funsor.set_backend("torch")
+        if aggregation not in ['mean', 'sum']:
+            print(f"Aggregation {aggregation} is not linear, using mean instead")
+            aggregation = 'mean'
+        self.scm = scm
+        self.structure = scm.structure
+        self.skeleton = skeleton
+        self.aggregation = aggregation
+        self.num_instances = {entity: len(skeleton.entity_instances[entity]["names"]) for entity in skeleton.entity_instances}
+        self.factors = {}
+        self.interventions = {}
+        for node in self.structure.nodes:
+            node_name = scm.get_name_from_node(node)
+            intervention = scm.get_intervention(node_name)
+            if intervention is not None:
+                self.interventions[node_name] = intervention
+            else:
+                self.factors[node_name] = self.create_factor(node)
+        self.factors = self.substitute(self.factors, self.interventions)
+
+    def get_variable(self, node_name: str) -> funsor.Variable:
+        """ Returns the funsor variable holding the values of all instances of a node
+
+        Args:
+            node_name (str): name of the node entity.attribute
+
+        Returns:
+            funsor.Variable: real vector variable with one entry per instance
+        """
+        entity = node_name.split('.')[0]
+        return funsor.Variable(node_name, funsor.Reals[self.num_instances[entity]])
+
+    def create_factor(self, node) -> funsor.Funsor:
+        """ Create the log density of the mechanism of a node given its parents as one batched Gaussian
+            x = bias + sum_e weight_e A_e x_parent_e + scale * noise, where A_e is the aggregation matrix of edge e
+
+        Args:
+            node (Node): named tuple with the form (entity, attribute)
+
+        Returns:
+            funsor.Funsor: Gaussian factor over the node and its parents plus the normalizing constant
+        """
+        node_name = self.scm.get_name_from_node(node)
+        mechanism = self.scm.get_mechanism(node_name)
+        num_children = self.num_instances[node.entity]
+
+        # Linear maps from each parent attribute class, found by aggregating the identity matrix
+        linear_maps = OrderedDict()
+        for relation, edge in self.structure.get_incoming_edges(node.entity, node.attribute):
+            weight = mechanism.weights.get((relation, edge), 0.0)
+            if weight == 0.0:
+                continue
+            parent_name = self.scm.get_name_from_node(edge.parent)
+            identity = torch.eye(self.num_instances[edge.parent.entity])
+            linear_map = weight * aggregate_relational_edge(self.structure, self.skeleton, relation, edge, identity, self.aggregation)
+            linear_maps[parent_name] = linear_maps.get(parent_name, 0.0) + linear_map
+
+        # The log density is -0.5 * ||x @ prec_sqrt - white_vec||^2 with x the concatenation of the node and its parents
+        inputs = OrderedDict([(node_name, funsor.Reals[num_children])])
+        prec_sqrt = [torch.eye(num_children) / mechanism.scale]
+        for parent_name, linear_map in linear_maps.items():
+            inputs[parent_name] = self.get_variable(parent_name).output
+            prec_sqrt.append(-linear_map / mechanism.scale)
+        white_vec = torch.full((num_children,), mechanism.bias / mechanism.scale)
+        log_normalizer = -num_children * (math.log(mechanism.scale) + 0.5 * math.log(2 * math.pi))
+        return Gaussian(white_vec=white_vec, prec_sqrt=torch.cat(prec_sqrt, dim=0), inputs=inputs) + funsor.Tensor(torch.tensor(log_normalizer))
+
+    def substitute(self, factors: dict, values: dict) -> dict:
+        """ Substitute values of some nodes into all factors
+
+        Args:
+            factors (dict): key is a node name and value is its factor
+            values (dict): key is a node name and value is a scalar or a tensor over all instances
+
+        Returns:
+            dict: factors where the given nodes are no longer inputs
+        """
+        if len(values) == 0:
+            return factors
+        substituted = {}
+        for node_name, factor in factors.items():
+            subs = {name: funsor.Tensor(torch.as_tensor(value, dtype=torch.get_default_dtype()).expand(self.get_variable(name).output.shape))
+                    for name, value in values.items() if name in factor.inputs}
+            substituted[node_name] = factor(**subs) if len(subs) > 0 else factor
+        return substituted
+
+    def query(self, query_nodes: list, evidence: dict = None, interventions: dict = None) -> tuple:
+        """ Compute the joint log density of the query nodes by variable elimination
+            The elimination order is chosen greedily to keep the largest intermediate Gaussian small
+
+        Args:
+            query_nodes (list): names of the nodes to keep
+            evidence (dict, optional): key is a node name and value is its observed values. Defaults to None.
+            interventions (dict, optional): key is a node name and value is the value it is set to. Defaults to None.
+
+        Returns:
+            tuple: funsor over the query nodes, and EliminationCost with the order, largest factor dimension and flops
+        """
+        interventions = {} if interventions is None else interventions
+        evidence = {} if evidence is None else evidence
+
+        # Intervened nodes lose their factors and are then treated like evidence
+        factors = {name: factor for name, factor in self.factors.items() if name not in interventions}
+        factors = list(self.substitute(self.substitute(factors, interventions), evidence).values())
+
+        eliminate = set(name for factor in factors for name in factor.inputs) - set(query_nodes)
+        order = []
+        max_dim = 0
+        flops = 0
+        while len(eliminate) > 0:
+
+            # Eliminate the variable whose combined factor has the smallest dimension
+            name = min(sorted(eliminate), key=lambda name: self._get_combined_dim(factors, name))
+            dim = self._get_combined_dim(factors, name)
+            combined = [factor for factor in factors if name in factor.inputs]
+            factors = [factor for factor in factors if name not in factor.inputs]
+            factors.append(sum(combined[1:], combined[0]).reduce(ops.logaddexp, name))
+            eliminate.remove(name)
+            order.append(name)
+            max_dim = max(max_dim, dim)
+            flops += dim ** 3
+
+        log_density = sum(factors[1:], factors[0]) if len(factors) > 0 else funsor.Tensor(torch.tensor(0.0))
+        return log_density, EliminationCost(order, max_dim, flops)
+
+    def _get_combined_dim(self, factors, name):
+        names = set(input_name for factor in factors if name in factor.inputs for input_name in factor.inputs)
+        return sum(self.get_variable(input_name).output.num_elements for input_name in names)
+
+    def get_moments(self, query_nodes: list, evidence: dict = None, interventions: dict = None) -> tuple:
+        """ Compute the mean and covariance of the query nodes given evidence and interventions
+
+        Args:
+            query_nodes (list): names of the nodes to keep
+            evidence (dict, optional): key is a node name and value is its observed values. Defaults to None.
+            interventions (dict, optional): key is a node name and value is the value it is set to. Defaults to None.
+
+        Returns:
+            tuple: dict from node name to mean over instances, covariance over the concatenated query nodes in the
+                order of query_nodes, and the EliminationCost. Intervened or observed query nodes have their fixed value
+                as mean and zero covariance
+        """
+        # Fixed nodes are no longer inputs of any factor, interventions take precedence over evidence as in query
+        fixed = {**({} if evidence is None else evidence), **self.interventions, **({} if interventions is None else interventions)}
+        free_nodes = [node_name for node_name in query_nodes if node_name not in fixed]
+        log_density, cost = self.query(free_nodes, evidence, interventions)
+        sizes = {node_name: self.get_variable(node_name).output.num_elements for node_name in query_nodes}
+        offsets = [0] + torch.tensor([sizes[node_name] for node_name in query_nodes], dtype=torch.long).cumsum(0).tolist()
+        free_positions = torch.cat([torch.arange(offsets[idx], offsets[idx + 1]) for idx, node_name in enumerate(query_nodes) if node_name not in fixed]
+                                   + [torch.zeros(0, dtype=torch.long)])
+        covariance = torch.zeros(offsets[-1], offsets[-1])
+        free_means = {}
+        if len(free_nodes) > 0:
+            terms = log_density.terms if isinstance(log_density, Contraction) else [log_density]
+            gaussian = [term for term in terms if isinstance(term, Gaussian)][0]
+            gaussian = gaussian.align(tuple(free_nodes))
+            covariance[free_positions[:, None], free_positions] = gaussian._covariance.to(covariance.dtype)
+            start = 0
+            for node_name in free_nodes:
+                free_means[node_name] = gaussian._mean[start:start + sizes[node_name]]
+                start += sizes[node_name]
+        means = {}
+        for node_name in query_nodes:
+            if node_name in fixed:
+                means[node_name] = torch.as_tensor(fixed[node_name], dtype=torch.get_default_dtype()).expand(self.get_variable(node_name).output.shape).clone()
+            else:
+                means[node_name] = free_means[node_name]
+        return means, covariance, cost
@@ -1,30 +1,31 @@
 import networkx as nx
+import numpy as np
 import pandas as pd
 
 from relational.causal_structure import RelationalCausalStructure
 from relational.data import RelationalSkeleton
 from relational.utils import InstanceNode
 
-def create_adj_mat_dict(structure: RelationalCausalStructure, skeleton: RelationalSkeleton) -> dict:
+def create_adj_mat_dict(structure: RelationalCausalStructure, skeleton: RelationalSkeleton, as_dataframe: bool = False) -> dict:
     """ Creates adjacency matrices based on the relational skeleton
 
     Args:
         structure (RelationalCausalStructure): 
         skeleton (RelationalSkeleton): 
+        as_dataframe (bool, optional): return dense pd.DataFrame views indexed by instance names instead of 
+            sparse matrices, only advisable for small skeletons. Defaults to False.
 
     Returns:
-        dict: contains an adjacency matrix (pd.DataFrame) for each relationship class
+        dict: contains an adjacency matrix (scipy.sparse.csr_matrix, or pd.DataFrame if as_dataframe) for each relationship class
     """
     
     adj_mat_dict = {}
     for relation_name, entity_edge in structure.schema.relations.items():
-        num_entity1 = len(skeleton.entity_instances[entity_edge[0]]["names"])
-        num_entity2 = len(skeleton.entity_instances[entity_edge[1]]["names"])
-        adj_mat = pd.DataFrame([[False] * num_entity2] * num_entity1)
-        adj_mat.index = skeleton.entity_instances[entity_edge[0]]["names"]
-        adj_mat.columns = skeleton.entity_instances[entity_edge[1]]["names"]
-        for instance_edge in skeleton.relationship_instances[relation_name]:
-            adj_mat.loc[instance_edge[0], instance_edge[1]] = True
+        adj_mat = skeleton.get_relation_index(relation_name).forward.copy()
+        if as_dataframe:
+            names_from = skeleton.get_instance_positions(entity_edge[0])
+            names_to = skeleton.get_instance_positions(entity_edge[1])
+            adj_mat = pd.DataFrame(adj_mat.toarray(), index=names_from, columns=names_to)
         adj_mat_dict[relation_name] = adj_mat
     return adj_mat_dict
 
@@ -75,31 +76,49 @@ def create_ground_graph(structure: RelationalCausalStructure, skeleton: Relation
                    child_node_name = get_node_name(instance_name,self_edge.child.attribute)
                    ground_graph.add_edge(parent_node_name, child_node_name) 
 
-    # Set up all other edges
-    for relation_type, edge_list in skeleton.relationship_instances.items():
-        for instance_edge in edge_list:
-            # Add all edges in ground graph corresponding to each edge in the relational skeleton
-            entity_0 = skeleton.get_instance_type(instance_edge[0])
-            entity_1 = skeleton.get_instance_type(instance_edge[1])
-            # Add edges between entities
-            for relational_edge in structure.edges[relation_type]:
-                if relational_edge.parent.entity == entity_0 and relational_edge.child.entity == entity_1:
-                    parent_node_name = get_node_name(instance_edge[0],relational_edge.parent.attribute)
-                    child_node_name = get_node_name(instance_edge[1],relational_edge.child.attribute)
-                    ground_graph.add_edge(parent_node_name, child_node_name)
-                # Don't forget to consider the opposite direction, relational edges are not necessarily directed
-                if relational_edge.parent.entity == entity_1 and relational_edge.child.entity == entity_0:
-                    parent_node_name = get_node_name(instance_edge[1],relational_edge.parent.attribute)
-                    child_node_name = get_node_name(instance_edge[0],relational_edge.child.attribute)
-                    ground_graph.add_edge(parent_node_name, child_node_name)
+    # Set up all other edges as a join between relational edges and instance edges of the same relation
+    for relation_type, (entity_0, entity_1) in structure.schema.relations.items():
+        if relation_type not in structure.edges:
+            continue
+        index = skeleton.get_relation_index(relation_type)
+        names_0 = np.array(skeleton.entity_instances[entity_0]["names"], dtype=object)[index.source]
+        names_1 = np.array(skeleton.entity_instances[entity_1]["names"], dtype=object)[index.target]
+        for relational_edge in structure.edges[relation_type]:
+            if relational_edge.parent.entity == entity_0 and relational_edge.child.entity == entity_1:
+                parent_node_names = names_0 + f".{relational_edge.parent.attribute}"
+                child_node_names = names_1 + f".{relational_edge.child.attribute}"
+                ground_graph.add_edges_from(zip(parent_node_names, child_node_names))
+            # Don't forget to consider the opposite direction, relational edges are not necessarily directed
+            if relational_edge.parent.entity == entity_1 and relational_edge.child.entity == entity_0:
+                parent_node_names = names_1 + f".{relational_edge.parent.attribute}"
+                child_node_names = names_0 + f".{relational_edge.child.attribute}"
+                ground_graph.add_edges_from(zip(parent_node_names, child_node_names))
 
     return ground_graph
 
+def intervene_ground_graph(ground_graph: nx.DiGraph, interventions: dict) -> nx.DiGraph:
+    """ Intervene on instance nodes of a ground graph in place, removing only their incoming edges
+
+    Args:
+        ground_graph (nx.DiGraph): abstract ground graph
+        interventions (dict): key is an InstanceNode and value is the value it is set to
+
+    Returns:
+        nx.DiGraph: the same ground graph after the intervention
+    """
+    for node, value in interventions.items():
+        node_name = get_node_name(node.instance, node.attribute)
+        ground_graph.remove_edges_from(list(ground_graph.in_edges(node_name)))
+        ground_graph.nodes[node_name]["val"] = value
+    return ground_graph
+
 def create_subgraph_for_ITE(ground_graph: nx.DiGraph, treatment: InstanceNode, outcome: InstanceNode, cutoff = 10) -> nx.DiGraph:
     """ Obtain all nodes on the path between treatment and outcome in the abstract ground graph
+        An edge (u, v) is on a path of length at most cutoff if dist(treatment, u) + 1 + dist(v, outcome) <= cutoff,
+        so the subgraph is found with one forward and one backward breadth-first search instead of enumerating paths
 
     Args:
-        ground_graph (nx.DiGraph): abstract ground graph
+        ground_graph (nx.DiGraph): abstract ground graph, which is acyclic for acyclic relational structures
         treatment (InstanceNode): an (entity, attribute, instance) tuple of strings
         outcome (InstanceNode): an (entity, attribute, instance) tuple of strings
         cutoff (int, optional): max length of paths considered. Defaults to 10.
@@ -107,13 +126,44 @@ def create_subgraph_for_ITE(ground_graph: nx.DiGraph, treatment: InstanceNode, o
     Returns:
         nx.DiGraph: a subgraph containing all nodes on paths between treatment and outcome
     """
-    source = get_node_name(treatment.instance, treatment.attribute)
-    target = get_node_name(outcome.instance, outcome.attribute)
-    subgraph = nx.DiGraph()
-    if nx.has_path(ground_graph, source, target):
-        for path in nx.all_simple_edge_paths(ground_graph, source, target, cutoff):
-            for edge in path:
-                subgraph.add_edge(*edge)
-    else:
-        print(f"No directed path from {source} to {target}")
-    return subgraph
\ No newline at end of file
+    return create_subgraphs_for_ITE(ground_graph, [treatment], [outcome], cutoff)[0]
+
+def create_subgraphs_for_ITE(ground_graph: nx.DiGraph, treatments: list, outcomes: list, cutoff = 10) -> list:
+    """ Obtain the subgraphs between many treatment and outcome pairs, sharing traversals between pairs
+        with the same treatment or the same outcome
+
+    Args:
+        ground_graph (nx.DiGraph): abstract ground graph
+        treatments (list): list of InstanceNode treatments
+        outcomes (list): list of InstanceNode outcomes, one for each treatment
+        cutoff (int, optional): max length of paths considered. Defaults to 10.
+
+    Returns:
+        list: a subgraph (nx.DiGraph) for each treatment and outcome pair
+    """
+    forward_distances = {}
+    backward_distances = {}
+    reversed_graph = ground_graph.reverse(copy=False)
+    subgraphs = []
+    for treatment, outcome in zip(treatments, outcomes):
+        source = get_node_name(treatment.instance, treatment.attribute)
+        target = get_node_name(outcome.instance, outcome.attribute)
+
+        # Hop distances from the treatment and to the outcome are computed once per node
+        if source not in forward_distances:
+            forward_distances[source] = nx.single_source_shortest_path_length(ground_graph, source, cutoff)
+        if target not in backward_distances:
+            backward_distances[target] = nx.single_source_shortest_path_length(reversed_graph, target, cutoff)
+        forward = forward_distances[source]
+        backward = backward_distances[target]
+
+        subgraph = nx.DiGraph()
+        if target in forward:
+            for node, distance in forward.items():
+                for child in ground_graph.successors(node):
+                    if child in backward and distance + 1 + backward[child] <= cutoff:
+                        subgraph.add_edge(node, child)
+        elif not nx.has_path(ground_graph, source, target):
+            print(f"No directed path from {source} to {target}")
+        subgraphs.append(subgraph)
+    return subgraphs
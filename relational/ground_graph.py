@@ -0,0 +1,242 @@
+import networkx as nx
+import numpy as np
+import scipy.sparse as sp
+
+from relational.causal_structure import RelationalCausalStructure
+from relational.data import RelationalSkeleton
+from relational.utils import InstanceNode, Node
+
+class GroundGraph:
+    """
+    Integer-indexed ground graph where every (entity, attribute, instance) triple is a node id.
+    Node ids are dense and contiguous for each (entity, attribute) pair, and edges are stored as arrays.
+    """
+    def __init__(self, structure: RelationalCausalStructure, skeleton: RelationalSkeleton) -> None:
+
+        self.structure = structure
+        self.skeleton = skeleton
+        self.build()
+
+    def build(self):
+        """ Assign node ids and build all edges in bulk, one relational edge at a time
+        """
+
+        # Assign a contiguous block of node ids to each (entity, attribute) pair
+        self.offsets = {}
+        self.block_sizes = {}
+        self.num_nodes = 0
+        for entity in sorted(self.skeleton.entity_instances):
+            num_instances = len(self.skeleton.entity_instances[entity]["names"])
+            for attribute in sorted(self.structure.schema.attribute_classes[entity]):
+                node = Node(entity, attribute)
+                self.offsets[node] = self.num_nodes
+                self.block_sizes[node] = num_instances
+                self.num_nodes += num_instances
+        self.blocks = list(self.offsets)
+        self.block_starts = np.array([self.offsets[node] for node in self.blocks], dtype=np.int64)
+
+        # Save attribute values of all nodes in a single array indexed by node id
+        self.values = np.zeros(self.num_nodes)
+        for node in self.blocks:
+            start = self.offsets[node]
+            self.values[start:start + self.block_sizes[node]] = self.skeleton.entity_instances[node.entity][node.attribute]
+
+        sources = []
+        targets = []
+
+        # Set up self edges
+        if "self" in self.structure.edges:
+            for self_edge in self.structure.edges["self"]:
+                if self_edge.parent.entity != self_edge.child.entity:
+                    print("Edge is marked as a self-edge in skeleton but is between different entities")
+                    break
+                instance_ids = np.arange(self.block_sizes[self_edge.parent], dtype=np.int64)
+                sources.append(self.offsets[self_edge.parent] + instance_ids)
+                targets.append(self.offsets[self_edge.child] + instance_ids)
+
+        # Set up all other edges as a join between relational edges and instance edges of the same relation
+        for relation_type, (entity_0, entity_1) in self.structure.schema.relations.items():
+            if relation_type not in self.structure.edges:
+                continue
+            index = self.skeleton.get_relation_index(relation_type)
+            for relational_edge in self.structure.edges[relation_type]:
+                if relational_edge.parent.entity == entity_0 and relational_edge.child.entity == entity_1:
+                    sources.append(self.offsets[relational_edge.parent] + index.source)
+                    targets.append(self.offsets[relational_edge.child] + index.target)
+                # Don't forget to consider the opposite direction, relational edges are not necessarily directed
+                if relational_edge.parent.entity == entity_1 and relational_edge.child.entity == entity_0:
+                    sources.append(self.offsets[relational_edge.parent] + index.target)
+                    targets.append(self.offsets[relational_edge.child] + index.source)
+
+        # Remove duplicate edges so that the edge arrays match the edge set of the networkx ground graph
+        if len(sources) > 0:
+            edge_keys = np.unique(np.concatenate(sources).astype(np.int64) * self.num_nodes + np.concatenate(targets))
+            self.sources = edge_keys // max(self.num_nodes, 1)
+            self.targets = edge_keys % max(self.num_nodes, 1)
+        else:
+            self.sources = np.zeros(0, dtype=np.int64)
+            self.targets = np.zeros(0, dtype=np.int64)
+        self.num_edges = len(self.sources)
+
+        # Derived views are created lazily
+        self._adjacency = None
+        self._networkx = None
+        self._layers = None
+
+    def __copy__(self):
+        """ Shallow copy with its own values, so intervene_ on the copy leaves this ground graph unchanged
+            Edge arrays and the adjacency are shared since intervene_ replaces them instead of changing them in place
+        """
+        ground_graph = GroundGraph.__new__(GroundGraph)
+        ground_graph.__dict__.update(self.__dict__)
+        ground_graph.values = None if self.values is None else self.values.copy()
+        ground_graph._networkx = None
+        return ground_graph
+
+    def get_node_id(self, node: InstanceNode) -> int:
+        """ Returns the integer id of an instance node
+
+        Args:
+            node (InstanceNode): an (entity, attribute, instance) tuple of strings
+
+        Returns:
+            int: node id in the ground graph
+        """
+        position = self.skeleton.get_instance_positions(node.entity).get_loc(node.instance)
+        return self.offsets[Node(node.entity, node.attribute)] + position
+
+    def get_node_ids(self, entity: str, attribute: str) -> np.ndarray:
+        """ Returns the ids of all instances of an attribute in the order of the skeleton
+
+        Args:
+            entity (str): entity name
+            attribute (str): attribute name
+
+        Returns:
+            np.ndarray: node ids of all instances of the attribute
+        """
+        node = Node(entity, attribute)
+        return np.arange(self.offsets[node], self.offsets[node] + self.block_sizes[node], dtype=np.int64)
+
+    def get_instance_node(self, node_id: int) -> InstanceNode:
+        """ Returns the instance node corresponding to an integer id
+
+        Args:
+            node_id (int): node id in the ground graph
+
+        Returns:
+            InstanceNode: an (entity, attribute, instance) tuple of strings
+        """
+        node = self.blocks[np.searchsorted(self.block_starts, node_id, side='right') - 1]
+        instance = self.skeleton.entity_instances[node.entity]["names"][node_id - self.offsets[node]]
+        return InstanceNode(node.entity, node.attribute, instance)
+
+    @property
+    def adjacency(self) -> sp.csr_matrix:
+        """ Sparse adjacency matrix of the ground graph, rows are parents and columns are children
+        """
+        if self._adjacency is None:
+            data = np.ones(self.num_edges, dtype=bool)
+            self._adjacency = sp.csr_matrix((data, (self.sources, self.targets)), shape=(self.num_nodes, self.num_nodes))
+        return self._adjacency
+
+    def intervene_(self, interventions: dict) -> np.ndarray:
+        """ Set instance nodes to values in place and remove only their incoming edges
+            Cached layers stay valid because removing edges never breaks a topological order
+
+        Args:
+            interventions (dict): key is an InstanceNode and value is the value it is set to
+
+        Returns:
+            np.ndarray: ids of the intervened nodes
+        """
+        node_ids = np.array([self.get_node_id(node) for node in interventions], dtype=np.int64)
+        self.values[node_ids] = list(interventions.values())
+        is_intervened = np.zeros(self.num_nodes, dtype=bool)
+        is_intervened[node_ids] = True
+        removed = is_intervened[self.targets]
+        if self._networkx is not None:
+            self._networkx.remove_edges_from([(self.get_node_name(source), self.get_node_name(target)) for source, target in zip(self.sources[removed], self.targets[removed])])
+            for node_id, value in zip(node_ids, interventions.values()):
+                self._networkx.nodes[self.get_node_name(node_id)]["val"] = value
+        self.sources = self.sources[~removed]
+        self.targets = self.targets[~removed]
+        self.num_edges = len(self.sources)
+        if self._adjacency is not None:
+            self._adjacency = self._adjacency.multiply(~is_intervened[np.newaxis, :]).tocsr()
+            self._adjacency.eliminate_zeros()
+        return node_ids
+
+    def get_descendants(self, node_ids: np.ndarray) -> np.ndarray:
+        """ Find all descendants of the given nodes, excluding the nodes themselves unless they are reachable
+
+        Args:
+            node_ids (np.ndarray): ids of the nodes
+
+        Returns:
+            np.ndarray: boolean mask over node ids
+        """
+        descendants = np.zeros(self.num_nodes, dtype=bool)
+        frontier = np.unique(node_ids)
+        while len(frontier) > 0:
+            children = np.unique(self.adjacency[frontier].indices)
+            frontier = children[~descendants[children]]
+            descendants[frontier] = True
+        return descendants
+
+    def get_node_name(self, node_id: int) -> str:
+        """ Returns the name instance.attribute of a node as used in networkx ground graphs
+
+        Args:
+            node_id (int): node id in the ground graph
+
+        Returns:
+            str: node name
+        """
+        node = self.get_instance_node(node_id)
+        return f"{node.instance}.{node.attribute}"
+
+    def get_topological_layers(self) -> list:
+        """ Obtain a layer schedule of the ground graph, computed once and cached
+            Each layer is found in bulk by removing all edges out of the previous layer
+
+        Returns:
+            list: list of arrays of node ids whose parents are all in earlier layers, or None if there is a cycle
+        """
+        if self._layers is None:
+            num_parents = np.bincount(self.targets, minlength=self.num_nodes)
+            layer = np.flatnonzero(num_parents == 0)
+            layers = []
+            while len(layer) > 0:
+                layers.append(layer)
+                children = self.adjacency[layer].indices
+                num_parents = num_parents - np.bincount(children, minlength=self.num_nodes)
+                children = np.unique(children)
+                layer = children[num_parents[children] == 0]
+            if sum(len(layer) for layer in layers) < self.num_nodes:
+                print("Ground graph has a cycle")
+                return None
+            self._layers = layers
+        return self._layers
+
+    def is_acyclic(self) -> bool:
+        """
+        Check if the ground graph has no directed cycles
+        """
+        return self.get_topological_layers() is not None
+
+    def to_networkx(self) -> nx.DiGraph:
+        """ Export to a networkx graph with the same node names and values as create_ground_graph
+
+        Returns:
+            nx.DiGraph: the ground graph with nodes named instance.attribute
+        """
+        if self._networkx is None:
+            node_names = []
+            for node in self.blocks:
+                node_names.extend(f"{instance}.{node.attribute}" for instance in self.skeleton.entity_instances[node.entity]["names"])
+            ground_graph = nx.DiGraph()
+            ground_graph.add_nodes_from((name, {"val": value}) for name, value in zip(node_names, self.values.tolist()))
+            ground_graph.add_edges_from(zip([node_names[i] for i in self.sources], [node_names[i] for i in self.targets]))
+            self._networkx = ground_graph
+        return self._networkx
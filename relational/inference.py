@@ -0,0 +1,151 @@
+import time
+
+import numpy as np
+import pyro
+import scipy.sparse as sp
+import torch
+from scipy.sparse.csgraph import connected_components
+
+from relational.data import RelationalSkeleton
+from relational.pyro_model import compile_pyro_model, get_observations
+from relational.scm import RelationalSCM
+
+class RelationalMinibatchSVI:
+    """
+    Stochastic variational inference on minibatches of root entity instances, e.g. states.
+    Every instance is owned by the one root instance it is connected to through relationship instances. Each step subsamples
+    root instances with a pyro.plate, keeps the instances they own, and rescales the log likelihood by the number of roots over
+    the batch size, which is unbiased because the instances of different roots never overlap.
+    """
+    def __init__(self, scm: RelationalSCM, skeleton: RelationalSkeleton, root_entity: str, subsample_size: int, guide = None, optim = None, loss = None, aggregation: str = 'mean') -> None:
+
+        self.scm = scm
+        self.skeleton = skeleton
+        self.root_entity = root_entity
+        self.num_roots = len(skeleton.entity_instances[root_entity]["names"])
+        self.subsample_size = min(subsample_size, self.num_roots)
+        self.aggregation = aggregation
+
+        # The model is compiled and the observations are collected once, each minibatch only indexes into them
+        self.batch_model = compile_pyro_model(scm, skeleton, aggregation)
+        self.observations = get_observations(scm, skeleton)
+        self.owned_instances = self.get_owned_instances()
+
+        self.guide = pyro.infer.autoguide.AutoNormal(self.model) if guide is None else guide
+        optim = pyro.optim.Adam({"lr": 0.01}) if optim is None else optim
+        loss = pyro.infer.Trace_ELBO() if loss is None else loss
+        self.svi = pyro.infer.SVI(self.model, self.guide, optim, loss)
+        self.num_instances = 0
+
+    def get_owned_instances(self) -> dict:
+        """ Find the instances owned by every root instance from the connected components of the skeleton
+
+        Raises:
+            ValueError: if some root instances are connected to each other or some instances aren't connected to a root,
+                since the rescaled likelihood of minibatches would then be biased
+
+        Returns:
+            dict: key is an entity and value is a tuple of the positions of its instances sorted by owner and
+                the offset of the instances of each root in them
+        """
+        offsets = {}
+        num_nodes = 0
+        for entity, instances in self.skeleton.entity_instances.items():
+            offsets[entity] = num_nodes
+            num_nodes += len(instances["names"])
+        rows, cols = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+        for relation, (entity_from, entity_to) in self.skeleton.relations.items():
+            index = self.skeleton.get_relation_index(relation)
+            rows.append(np.asarray(index.source, dtype=np.int64) + offsets[entity_from])
+            cols.append(np.asarray(index.target, dtype=np.int64) + offsets[entity_to])
+        rows, cols = np.concatenate(rows), np.concatenate(cols)
+        adjacency = sp.coo_matrix((np.ones(len(rows), dtype=bool), (rows, cols)), shape=(num_nodes, num_nodes))
+        num_components, labels = connected_components(adjacency, directed=False)
+
+        root_labels = labels[offsets[self.root_entity]:offsets[self.root_entity] + self.num_roots]
+        roots_per_component = np.bincount(root_labels, minlength=num_components)
+        if (roots_per_component > 1).any():
+            raise ValueError(f"{int(roots_per_component[roots_per_component > 1].sum())} instances of {self.root_entity} are connected to other instances of {self.root_entity}, so their minibatches would overlap")
+        if (roots_per_component[labels] == 0).any():
+            raise ValueError(f"{int((roots_per_component[labels] == 0).sum())} instances are not connected to any instance of {self.root_entity}, so no minibatch would contain them")
+        owner_of_component = np.zeros(num_components, dtype=np.int64)
+        owner_of_component[root_labels] = np.arange(self.num_roots)
+
+        owned_instances = {}
+        for entity, instances in self.skeleton.entity_instances.items():
+            owners = owner_of_component[labels[offsets[entity]:offsets[entity] + len(instances["names"])]]
+            order = np.argsort(owners, kind="stable")
+            owned_instances[entity] = (order, np.searchsorted(owners[order], np.arange(self.num_roots + 1)))
+        return owned_instances
+
+    def get_batch_positions(self, root_positions: torch.Tensor) -> dict:
+        """ Positions of the instances owned by the given root instances
+
+        Args:
+            root_positions (torch.Tensor): positions of the root instances
+
+        Returns:
+            dict: key is an entity and value is a sorted array of positions
+        """
+        root_positions = np.asarray(root_positions)
+        positions = {}
+        for entity, (order, offsets) in self.owned_instances.items():
+            slices = [order[offsets[root]:offsets[root + 1]] for root in root_positions]
+            positions[entity] = np.sort(np.concatenate(slices)) if len(slices) > 0 else np.zeros(0, dtype=np.int64)
+        return positions
+
+    def get_minibatch(self, root_positions: torch.Tensor) -> RelationalSkeleton:
+        """ Restrict the skeleton to the given root instances and the instances they own
+
+        Args:
+            root_positions (torch.Tensor): positions of the root instances
+
+        Returns:
+            RelationalSkeleton: skeleton of the minibatch
+        """
+        return self.skeleton.get_subskeleton(self.get_batch_positions(root_positions))
+
+    def model(self):
+        with pyro.plate(f"{self.root_entity}_subsample", self.num_roots, subsample_size=self.subsample_size) as root_positions:
+            pass
+        positions = self.get_batch_positions(root_positions)
+        batch_skeleton = self.skeleton.get_subskeleton(positions)
+        self.num_instances = sum(len(entity_positions) for entity_positions in positions.values())
+        data = {}
+        for node in self.scm.structure.nodes:
+            node_name = self.scm.get_name_from_node(node)
+            data[node_name] = self.observations[node_name][torch.from_numpy(positions[node.entity])]
+        return self.batch_model(data, batch_skeleton, likelihood_scale=self.num_roots / len(root_positions))
+
+    def step(self) -> float:
+        """ Take one SVI step on a new minibatch
+
+        Returns:
+            float: estimate of the loss on the full dataset
+        """
+        return self.svi.step()
+
+    def train(self, num_epochs: int, verbose: bool = True) -> list:
+        """ Train for a number of epochs, each epoch takes enough steps to see every root instance once in expectation
+
+        Args:
+            num_epochs (int): number of epochs
+            verbose (bool, optional): print loss and throughput after each epoch. Defaults to True.
+
+        Returns:
+            list: a dict for each epoch with the mean loss and the number of instances processed per second
+        """
+        steps_per_epoch = -(-self.num_roots // self.subsample_size)
+        history = []
+        for epoch in range(num_epochs):
+            start = time.perf_counter()
+            total_loss = 0.0
+            total_instances = 0
+            for _ in range(steps_per_epoch):
+                total_loss += self.step()
+                total_instances += self.num_instances
+            elapsed = time.perf_counter() - start
+            history.append({"epoch": epoch, "loss": total_loss / steps_per_epoch, "instances_per_second": total_instances / elapsed})
+            if verbose:
+                print(f"Epoch {epoch}: loss = {history[-1]['loss']:.4f}, {history[-1]['instances_per_second']:.1f} instances/sec")
+        return history
@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+
+from relational.data import RelationalSkeleton
+from relational.schema import RelationalSchema
+
+def iter_table_chunks(path: str, chunksize: int = 100000, columns: list = None):
+    """ Iterate over a CSV or Parquet table in chunks of rows
+
+    Args:
+        path (str): location of a .csv or .parquet file
+        chunksize (int, optional): number of rows per chunk. Defaults to 100000.
+        columns (list, optional): columns to read, all columns are read if None. Defaults to None.
+
+    Yields:
+        pd.DataFrame: the next chunk of rows
+    """
+    if str(path).endswith(".parquet"):
+        # Parquet support is optional and only needs pyarrow when used
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        for chunk in pd.read_csv(path, chunksize=chunksize, usecols=columns):
+            yield chunk
+
+def get_relation_columns(schema: RelationalSchema, relation: str) -> tuple:
+    """ Names of the columns of instance names in the table of a relation
+        Columns are named after the entities of the relation, or entity_from and entity_to if both entities are the same
+
+    Args:
+        schema (RelationalSchema): schema of the skeleton
+        relation (str): relationship class
+
+    Returns:
+        tuple: column of the first entity and column of the second entity of the relation
+    """
+    entity_from, entity_to = schema.relations[relation]
+    if entity_from == entity_to:
+        return f"{entity_from}_from", f"{entity_to}_to"
+    return entity_from, entity_to
+
+def load_skeleton_from_tables(schema: RelationalSchema, entity_tables: dict, relationship_tables: dict, chunksize: int = 100000, name_column: str = "name", dtype = None) -> RelationalSkeleton:
+    """ Stream entity and relationship tables into a relational skeleton, validating each chunk against the schema
+        Entity tables have a name column and one column per attribute in the schema
+        Relationship tables have one column of instance names per entity, see get_relation_columns
+        The schema keeps one cardinality per entity of a relation, so for a relation between an entity and itself only the cardinality
+        of its second side is known and the 'one' side of a one_to_many or many_to_one self-relation is not checked
+        Only the parsing of a chunk is bounded by chunksize, the names, values and relation positions of the skeleton are kept in memory,
+        so very large skeletons should be saved with save_columnar once and loaded memory-mapped afterwards
+
+    Args:
+        schema (RelationalSchema): schema of the skeleton
+        entity_tables (dict): key is an entity class and value is the path to its table
+        relationship_tables (dict): key is a relationship class and value is the path to its table
+        chunksize (int, optional): number of rows read at a time. Defaults to 100000.
+        name_column (str, optional): column of entity tables containing instance names. Defaults to "name".
+        dtype (np.dtype, optional): type of attribute values, e.g. np.float32 to halve memory. Defaults to the dtype of each column.
+
+    Returns:
+        RelationalSkeleton: the skeleton, which is left empty if any chunk is invalid
+    """
+    skeleton = RelationalSkeleton(schema)
+
+    # Entities are ingested first so that relationship instances can be encoded as positions
+    for entity in schema.entity_classes:
+        if entity not in entity_tables:
+            print(f"Table for entity {entity} in the schema is missing")
+            skeleton.empty_skeleton(schema)
+            return skeleton
+        attributes = sorted(schema.attribute_classes[entity])
+        names = []
+        value_chunks = {attribute: [] for attribute in attributes}
+        for chunk in iter_table_chunks(entity_tables[entity], chunksize):
+            missing_columns = [column for column in [name_column] + attributes if column not in chunk.columns]
+            if len(missing_columns) > 0:
+                print(f"Columns {missing_columns} are missing in the table for entity {entity}")
+                skeleton.empty_skeleton(schema)
+                return skeleton
+            chunk_names = chunk[name_column].astype(str).tolist()
+            instance_types = dict.fromkeys(chunk_names, entity)
+            if len(instance_types) != len(chunk_names) or not skeleton.instance_type.keys().isdisjoint(instance_types):
+                print(f"Instance names of entity {entity} are not unique in the skeleton")
+                skeleton.empty_skeleton(schema)
+                return skeleton
+            skeleton.instance_type.update(instance_types)
+            names.extend(chunk_names)
+            for attribute in attributes:
+                value_chunks[attribute].append(chunk[attribute].to_numpy(dtype=dtype))
+        skeleton.entity_instances[entity]["names"] = names
+        for attribute in attributes:
+            skeleton.entity_instances[entity][attribute] = np.concatenate(value_chunks[attribute]) if len(value_chunks[attribute]) > 0 else np.zeros(0, dtype=dtype or np.float64)
+            value_chunks[attribute] = None
+
+    # Relationship instances are encoded chunk by chunk and only integer positions are kept in memory
+    for relation in schema.relationship_classes:
+        if relation not in relationship_tables:
+            print(f"Table for relation {relation} in the schema is missing")
+            skeleton.empty_skeleton(schema)
+            return skeleton
+        entity_from, entity_to = schema.relations[relation]
+        column_from, column_to = get_relation_columns(schema, relation)
+        positions_from = skeleton.get_instance_positions(entity_from)
+        positions_to = skeleton.get_instance_positions(entity_to)
+
+        # Partners of every instance on a 'one' side are counted as chunks arrive, to catch cardinality violations early
+        partner_counts = {}
+        if schema.cardinality[relation][entity_from] == "one":
+            partner_counts[column_to] = np.zeros(len(positions_to), dtype=np.int32)
+        if schema.cardinality[relation][entity_to] == "one":
+            partner_counts[column_from] = np.zeros(len(positions_from), dtype=np.int32)
+        source_chunks = []
+        target_chunks = []
+        for chunk in iter_table_chunks(relationship_tables[relation], chunksize):
+            if column_from not in chunk.columns or column_to not in chunk.columns:
+                print(f"Table for relation {relation} should have columns {column_from} and {column_to}")
+                skeleton.empty_skeleton(schema)
+                return skeleton
+            source = positions_from.get_indexer(chunk[column_from].astype(str))
+            target = positions_to.get_indexer(chunk[column_to].astype(str))
+            if (source < 0).any() or (target < 0).any():
+                unknown = chunk[(source < 0) | (target < 0)].iloc[0].tolist()
+                print(f"Relationship instance {tuple(unknown)} of {relation} refers to instances not in the skeleton")
+                skeleton.empty_skeleton(schema)
+                return skeleton
+            for column, positions in [(column_from, source), (column_to, target)]:
+                if column in partner_counts:
+                    np.add.at(partner_counts[column], positions, 1)
+                    if (partner_counts[column][positions] > 1).any():
+                        print(f"Instance {chunk[column].iloc[np.argmax(partner_counts[column][positions] > 1)]} is related to more than one instance through {relation}, which is not allowed by the schema")
+                        skeleton.empty_skeleton(schema)
+                        return skeleton
+            source_chunks.append(source.astype(np.int64))
+            target_chunks.append(target.astype(np.int64))
+        source = np.concatenate(source_chunks) if len(source_chunks) > 0 else np.zeros(0, dtype=np.int64)
+        target = np.concatenate(target_chunks) if len(target_chunks) > 0 else np.zeros(0, dtype=np.int64)
+        skeleton.set_relationship_instances(relation, source, target)
+
+    return skeleton
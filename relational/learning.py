@@ -0,0 +1,391 @@
+import itertools
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+
+from relational.aggregation import aggregate_relational_edge, get_edge_positions
+from relational.causal_structure import RelationalCausalStructure
+from relational.data import RelationalSkeleton
+from relational.schema import RelationalSchema
+from relational.shm import attach_array, share_array
+from relational.utils import Edge, Node, RelationalFeature
+
+# State of each worker process, set once by the pool initializer
+_worker_state = {}
+
+def fisher_z_test(x: np.ndarray, y: np.ndarray, z: np.ndarray = None) -> float:
+    """ Test if x and y are independent given z with the Fisher z-transform of their partial correlation
+
+    Args:
+        x (np.ndarray): values of shape (num_instances,)
+        y (np.ndarray): values of shape (num_instances,)
+        z (np.ndarray, optional): values to condition on, of shape (num_instances, num_conditions). Defaults to None.
+
+    Returns:
+        float: p-value of the null hypothesis that x and y are independent given z
+    """
+    z = np.zeros((len(x), 0)) if z is None else z
+    design = np.concatenate([np.ones((len(x), 1)), z], axis=1)
+    residuals = np.stack([x, y], axis=1) - design @ np.linalg.lstsq(design, np.stack([x, y], axis=1), rcond=None)[0]
+    scale = np.linalg.norm(residuals, axis=0)
+    dof = len(x) - z.shape[1] - 3
+    if dof <= 0 or (scale < 1e-12 * np.sqrt(len(x))).any():
+        return 1.0
+    r = np.clip(residuals[:, 0] @ residuals[:, 1] / (scale[0] * scale[1]), -1 + 1e-12, 1 - 1e-12)
+    statistic = math.sqrt(dof) * abs(math.atanh(r))
+    return math.erfc(statistic / math.sqrt(2))
+
+def compute_relational_feature(structure: RelationalCausalStructure, skeleton: RelationalSkeleton, feature: RelationalFeature) -> np.ndarray:
+    """ Compute the values of a feature for every instance of its entity
+
+    Args:
+        structure (RelationalCausalStructure): structure whose schema contains the relation of the feature
+        skeleton (RelationalSkeleton): contains all instances
+        feature (RelationalFeature): an attribute of the entity itself for relation 'self', an aggregate of the attribute of
+            related instances, or with aggregation 'siblings' the mean attribute of the other instances sharing a partner
+
+    Returns:
+        np.ndarray: values of shape (num_instances,)
+    """
+    node = feature.node
+    if feature.relation == "self":
+        return skeleton.get_attribute_vector(node.entity, node.attribute).double().numpy()
+    if feature.aggregation == "siblings":
+        entity_from, entity_to = structure.schema.relations[feature.relation]
+        partner = entity_to if node.entity == entity_from else entity_from
+        values = skeleton.get_attribute_vector(node.entity, node.attribute).double()
+        sums = aggregate_relational_edge(structure, skeleton, feature.relation, Edge(node, Node(partner, node.attribute)), values, 'sum')
+        counts = aggregate_relational_edge(structure, skeleton, feature.relation, Edge(node, Node(partner, node.attribute)), values, 'count')
+        partner_positions, positions = get_edge_positions(structure, skeleton, feature.relation, Edge(Node(partner, node.attribute), node))
+        sibling_sums = torch.zeros_like(values).index_copy(-1, positions, sums[partner_positions]) - values
+        sibling_counts = torch.zeros_like(values).index_copy(-1, positions, counts[partner_positions]) - 1
+        return (sibling_sums / sibling_counts.clamp(min=1)).numpy()
+    edge = Edge(node, Node(feature.entity, node.attribute))
+    return aggregate_relational_edge(structure, skeleton, feature.relation, edge, aggregation=feature.aggregation).double().numpy()
+
+def _run_ci_tests(structure: RelationalCausalStructure, skeleton: RelationalSkeleton, features: dict, tests: list) -> list:
+    """ Run conditional independence tests, computing each feature once and keeping it in features
+    """
+    def get(feature):
+        if feature not in features:
+            features[feature] = compute_relational_feature(structure, skeleton, feature)
+        return features[feature]
+
+    p_values = []
+    for x, y, z in tests:
+        conditions = np.stack([get(feature) for feature in sorted(z)], axis=1) if len(z) > 0 else None
+        p_values.append(fisher_z_test(get(x), get(y), conditions))
+    return p_values
+
+def _init_learning_worker():
+    _worker_state["features"] = {}
+
+def _run_ci_test_shard(shard: tuple) -> list:
+    # Workers only attach to the features computed by the parent, so they never need the skeleton
+    tests, descriptors = shard
+    features = _worker_state["features"]
+    for feature, descriptor in descriptors.items():
+        if feature not in features:
+            features[feature] = attach_array(descriptor)
+    return _run_ci_tests(None, None, features, tests)
+
+class RelationalStructureLearner:
+    """
+    Learns a relational causal structure from a skeleton in the style of relational causal discovery (RCD).
+    Candidate dependencies are all pairs of attributes of the same entity or of entities in a relation. Adjacencies are
+    found with PC-style conditional independence tests on aggregated relational features, run in batches across a
+    process pool, and are then oriented by bivariate orientation over sibling instances, collider detection and propagation.
+    Features are computed once in this process and shared with the workers through shared memory, and tests are checked
+    against the cache of p-values here before they are sent, so workers only run new tests.
+    """
+    def __init__(self, schema: RelationalSchema, skeleton: RelationalSkeleton, alpha: float = 0.05, max_depth: int = 2,
+                 aggregation: str = 'mean', num_workers: int = None, shards_per_worker: int = 4) -> None:
+
+        self.schema = schema
+        self.skeleton = skeleton
+        self.alpha = alpha
+        self.max_depth = max_depth
+        self.aggregation = aggregation
+        self.num_workers = num_workers
+        self.shards_per_worker = shards_per_worker
+
+        # Feature computations only need the schema, so an empty structure is used
+        self.empty_structure = RelationalCausalStructure(schema)
+
+        # Key is (frozenset of the two tested features, frozenset of conditions) and value is the p-value
+        self.ci_cache = {}
+        self.features = {}
+        self.shared_features = {}
+        self.blocks = []
+        self.num_tests = 0
+
+    def get_candidates(self) -> list:
+        """ Enumerate all candidate dependencies, each an unordered pair of attributes related by 'self' or a relation
+
+        Returns:
+            list: list of (relation, Node, Node) tuples
+        """
+        candidates = []
+        for entity in sorted(self.schema.entity_classes):
+            for first, second in itertools.combinations(sorted(self.schema.attribute_classes[entity]), 2):
+                candidates.append(("self", Node(entity, first), Node(entity, second)))
+        for relation in sorted(self.schema.relationship_classes):
+            entity_from, entity_to = self.schema.relations[relation]
+            for first in sorted(self.schema.attribute_classes[entity_from]):
+                for second in sorted(self.schema.attribute_classes[entity_to]):
+                    candidates.append((relation, Node(entity_from, first), Node(entity_to, second)))
+        return candidates
+
+    def get_feature(self, relation: str, node: Node, entity: str) -> RelationalFeature:
+        """ Feature of a node seen from an entity through a relation, or the node itself for 'self'
+        """
+        return RelationalFeature(relation, node, entity, "value" if relation == "self" else self.aggregation)
+
+    def get_perspective_features(self, entity: str) -> list:
+        """ All attributes of an entity and the aggregates of its current adjacencies, e.g. to condition on
+
+        Args:
+            entity (str): entity whose instances the features are computed for
+
+        Returns:
+            list: sorted list of RelationalFeature
+        """
+        features = set(self.get_feature("self", Node(entity, attribute), entity) for attribute in self.schema.attribute_classes[entity])
+        for relation, first, second in self.adjacencies:
+            for node, other in [(first, second), (second, first)]:
+                if other.entity == entity:
+                    features.add(self.get_feature(relation, node, entity))
+        return sorted(features)
+
+    def run_tests(self, tests: list, executor: ProcessPoolExecutor = None) -> list:
+        """ Run conditional independence tests that are not in the cache yet and return the p-values of all tests
+
+        Args:
+            tests (list): list of (feature, feature, conditions) tuples, all features of the same entity
+            executor (ProcessPoolExecutor, optional): pool to run the tests in, tests run in this process if None. Defaults to None.
+
+        Returns:
+            list: p-value of each test
+        """
+        keys = [(frozenset([x, y]), frozenset(z)) for x, y, z in tests]
+        missing = list(dict.fromkeys(key for key in keys if key not in self.ci_cache))
+        missing_tests = [(*sorted(pair), conditions) for pair, conditions in missing]
+        self.num_tests += len(missing_tests)
+        if executor is None or len(missing_tests) <= 1:
+            p_values = _run_ci_tests(self.empty_structure, self.skeleton, self.features, missing_tests)
+        else:
+            num_shards = min(len(missing_tests), self.num_workers * self.shards_per_worker)
+            shards = []
+            for idx in range(num_shards):
+                shard = missing_tests[idx::num_shards]
+                shard_features = set(feature for x, y, z in shard for feature in (x, y, *z))
+                shards.append((shard, {feature: self.share_feature(feature) for feature in shard_features}))
+            p_values = [None] * len(missing_tests)
+            for idx, shard_p_values in enumerate(executor.map(_run_ci_test_shard, shards)):
+                p_values[idx::num_shards] = shard_p_values
+        self.ci_cache.update(zip(missing, p_values))
+        return [self.ci_cache[key] for key in keys]
+
+    def share_feature(self, feature: RelationalFeature) -> tuple:
+        """ Compute a feature if needed and copy it into shared memory once, the blocks are released at the end of learn
+
+        Args:
+            feature (RelationalFeature): feature to share
+
+        Returns:
+            tuple: descriptor to attach to the shared values from a worker
+        """
+        if feature not in self.shared_features:
+            if feature not in self.features:
+                self.features[feature] = compute_relational_feature(self.empty_structure, self.skeleton, feature)
+            block, self.shared_features[feature] = share_array(self.features[feature])
+            self.blocks.append(block)
+        return self.shared_features[feature]
+
+    def find_separating_sets(self, pairs: list, executor: ProcessPoolExecutor = None, depths: list = None) -> list:
+        """ Search for sets of features that make each pair of features independent, running all tests of a depth in one batch
+
+        Args:
+            pairs (list): list of (feature, feature, candidate conditions) tuples, all features of the same entity
+            executor (ProcessPoolExecutor, optional): pool to run the tests in. Defaults to None.
+            depths (list, optional): sizes of condition sets to try. Defaults to 0 up to max_depth.
+
+        Returns:
+            list: the first separating frozenset of conditions for each pair, or None if the pair was not separated
+        """
+        depths = range(self.max_depth + 1) if depths is None else depths
+        separating_sets = [None] * len(pairs)
+        for depth in depths:
+            tests, owners = [], []
+            for idx, (x, y, candidates) in enumerate(pairs):
+                if separating_sets[idx] is None:
+                    for conditions in itertools.combinations(sorted(set(candidates) - {x, y}), depth):
+                        tests.append((x, y, conditions))
+                        owners.append(idx)
+            for idx, (x, y, conditions), p_value in zip(owners, tests, self.run_tests(tests, executor)):
+                if separating_sets[idx] is None and p_value > self.alpha:
+                    separating_sets[idx] = frozenset(conditions)
+        return separating_sets
+
+    def learn(self) -> RelationalCausalStructure:
+        """ Learn the relational causal structure, edges that could not be oriented are kept in self.undirected
+
+        Returns:
+            RelationalCausalStructure: structure with all oriented edges
+        """
+        self.adjacencies = self.get_candidates()
+        self.sepsets = {}
+        self.num_workers = os.cpu_count() if self.num_workers is None else self.num_workers
+        if self.num_workers == 1:
+            self.find_adjacencies(None)
+            self.orient(None)
+        else:
+            try:
+                with ProcessPoolExecutor(self.num_workers, initializer=_init_learning_worker) as executor:
+                    self.find_adjacencies(executor)
+                    self.orient(executor)
+            finally:
+                for block in self.blocks:
+                    block.close()
+                    block.unlink()
+                self.blocks = []
+                self.shared_features = {}
+
+        return self.get_structure()
+
+    def get_structure(self) -> RelationalCausalStructure:
+        """ Add the oriented edges to a new structure, orientations it rejects, e.g. because they close a cycle, are kept in self.rejected
+
+        Returns:
+            RelationalCausalStructure: structure with all accepted oriented edges
+        """
+        structure = RelationalCausalStructure(self.schema)
+        self.rejected = []
+        for relation, parent, child in sorted(self.oriented):
+            structure.add_edge(relation, parent, child)
+            if Edge(parent, child) not in structure.edges.get(relation, set()):
+                self.rejected.append((relation, parent, child))
+        if len(self.rejected) > 0:
+            print(f"{len(self.rejected)} oriented edges were rejected by the structure: {self.rejected}")
+        return structure
+
+    def find_adjacencies(self, executor: ProcessPoolExecutor = None):
+        """ Remove candidate dependencies whose features are independent given aggregates of the other adjacencies,
+            from the perspective of either endpoint. Adjacencies are only updated after each depth, as in PC-stable.
+        """
+        for depth in range(self.max_depth + 1):
+            pairs, owners = [], []
+            for candidate in self.adjacencies:
+                relation, first, second = candidate
+                for node, other in [(first, second), (second, first)]:
+                    perspective_features = [feature for feature in self.get_perspective_features(other.entity) if feature.node != other]
+                    pairs.append((self.get_feature(relation, node, other.entity), self.get_feature("self", other, other.entity), perspective_features))
+                    owners.append(candidate)
+            removed = set()
+            for candidate, separating_set in zip(owners, self.find_separating_sets(pairs, executor, [depth])):
+                if separating_set is not None and candidate not in removed:
+                    removed.add(candidate)
+                    self.sepsets[candidate] = separating_set
+            self.adjacencies = [candidate for candidate in self.adjacencies if candidate not in removed]
+
+    def orient(self, executor: ProcessPoolExecutor = None):
+        """ Orient the adjacencies into self.oriented as (relation, parent, child) tuples and keep the rest in self.undirected
+        """
+        self.oriented = set()
+        self.non_colliders = set()
+
+        # Relational bivariate orientation: instances on the 'many' side sharing one partner are dependent through the
+        # partner unless it is a collider, so separating them without the partner orients the edge into the partner
+        pairs, owners = [], []
+        for candidate in self.adjacencies:
+            relation, first, second = candidate
+            if relation == "self" or first.entity == second.entity:
+                continue
+            for one, many in [(first, second), (second, first)]:
+                if self.schema.cardinality[relation][one.entity] == "one" and self.schema.cardinality[relation][many.entity] == "many":
+                    pairs.append((self.get_feature("self", many, many.entity), RelationalFeature(relation, many, many.entity, "siblings"),
+                                  self.get_perspective_features(many.entity)))
+                    owners.append((candidate, one, many))
+        for (candidate, one, many), separating_set in zip(owners, self.find_separating_sets(pairs, executor)):
+            if separating_set is None:
+                continue
+            if self.get_feature(candidate[0], one, many.entity) in separating_set:
+                self.oriented.add((candidate[0], one, many))
+            else:
+                self.oriented.add((candidate[0], many, one))
+
+        # Collider detection on unshielded triples A - B - C seen from the entity of B
+        undirected = [candidate for candidate in self.adjacencies if not self.is_oriented(candidate)]
+        pairs, owners = [], []
+        for (relation_a, *nodes_a), (relation_c, *nodes_c) in itertools.combinations(self.adjacencies, 2):
+            for middle in set(nodes_a) & set(nodes_c):
+                node_a = nodes_a[1 - nodes_a.index(middle)]
+                node_c = nodes_c[1 - nodes_c.index(middle)]
+                if node_a == node_c or self.is_adjacent(node_a, node_c):
+                    continue
+                feature_a = self.get_feature(relation_a, node_a, middle.entity)
+                feature_c = self.get_feature(relation_c, node_c, middle.entity)
+                pairs.append((feature_a, feature_c, self.get_perspective_features(middle.entity)))
+                owners.append(((relation_a, node_a), middle, (relation_c, node_c)))
+        for (end_a, middle, end_c), separating_set in zip(owners, self.find_separating_sets(pairs, executor)):
+            if separating_set is None:
+                continue
+            if self.get_feature("self", middle, middle.entity) in separating_set:
+                self.non_colliders.add((end_a, middle, end_c))
+                self.non_colliders.add((end_c, middle, end_a))
+                continue
+            for relation, node in [end_a, end_c]:
+                candidate = self.get_candidate(relation, node, middle)
+                if candidate in undirected and not self.is_oriented(candidate):
+                    self.oriented.add((relation, node, middle))
+
+        # Propagate orientations away from non-colliders and to avoid cycles
+        changed = True
+        while changed:
+            changed = False
+            for candidate in self.adjacencies:
+                if self.is_oriented(candidate):
+                    continue
+                relation, first, second = candidate
+                for node, other in [(first, second), (second, first)]:
+                    into_node = [(parent_relation, parent) for parent_relation, parent, child in self.oriented if child == node]
+                    known_non_collider = any(((parent_relation, parent), node, (relation, other)) in self.non_colliders for parent_relation, parent in into_node)
+                    if known_non_collider or self.has_directed_path(node, other):
+                        self.oriented.add((relation, node, other))
+                        changed = True
+                        break
+        self.undirected = [candidate for candidate in self.adjacencies if not self.is_oriented(candidate)]
+
+    def get_candidate(self, relation: str, node: Node, other: Node) -> tuple:
+        """ Find the adjacency between two nodes through a relation
+        """
+        for candidate in [(relation, node, other), (relation, other, node)]:
+            if candidate in self.adjacencies:
+                return candidate
+        return None
+
+    def is_oriented(self, candidate: tuple) -> bool:
+        relation, first, second = candidate
+        return (relation, first, second) in self.oriented or (relation, second, first) in self.oriented
+
+    def is_adjacent(self, node: Node, other: Node) -> bool:
+        return any({first, second} == {node, other} for _, first, second in self.adjacencies)
+
+    def has_directed_path(self, node: Node, descendant: Node) -> bool:
+        """ Check if there is a directed path of oriented edges from node to descendant
+        """
+        children = {}
+        for _, parent, child in self.oriented:
+            children.setdefault(parent, set()).add(child)
+        stack, visited = [node], set([node])
+        while len(stack) > 0:
+            current = stack.pop()
+            if current == descendant:
+                return True
+            for child in children.get(current, set()) - visited:
+                visited.add(child)
+                stack.append(child)
+        return False
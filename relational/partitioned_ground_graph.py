@@ -0,0 +1,335 @@
+import json
+import os
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+
+from relational.causal_structure import RelationalCausalStructure
+from relational.data import RelationalSkeleton
+from relational.utils import GroundGraphPartition, Node
+
+def _find_roots(parents: np.ndarray, nodes: np.ndarray) -> np.ndarray:
+    """ Find the root of every node in a union-find forest by pointer jumping, and point the nodes directly at their roots
+
+    Args:
+        parents (np.ndarray): parent of every node, roots are their own parent
+        nodes (np.ndarray): nodes to find the roots of
+
+    Returns:
+        np.ndarray: root of every node
+    """
+    roots = parents[nodes]
+    while True:
+        grandparents = parents[roots]
+        if np.array_equal(grandparents, roots):
+            break
+        roots = grandparents
+    parents[nodes] = roots
+    return roots
+
+def get_instance_partitions(skeleton: RelationalSkeleton, root_entity: str, roots_per_partition: int, chunk_size: int = 1000000,
+                            max_partition_size: int = None) -> dict:
+    """ Assign every instance to a partition so that connected instances are always in the same partition
+        Connected components are found with a union-find forest over all instances, and relationship instances are
+        merged into it in chunks, so only one integer per instance and one chunk of edges are in memory at a time.
+        Each component goes to the partition of its first root instance.
+
+        Partitions can only be as small as the components of the skeleton allow. Relations shared between roots, e.g. a
+        person living in one state and working in another, or many-to-many relations join the components of their roots, so
+        in the worst case every instance is in one partition. Such partitions are reported. Components without a root
+        instance are packed into extra partitions of at most max_partition_size instances, a single component larger
+        than that gets a partition of its own and is reported as well.
+
+    Args:
+        skeleton (RelationalSkeleton): contains all instances
+        root_entity (str): entity whose instances are grouped into partitions, e.g. state
+        roots_per_partition (int): number of consecutive root instances per partition
+        chunk_size (int, optional): number of relationship instances merged at once. Defaults to 1000000.
+        max_partition_size (int, optional): number of instances per partition above which partitions are reported, and up to
+            which components without a root are packed together. Defaults to the size of the largest partition with roots.
+
+    Returns:
+        dict: key is an entity and value is the partition of each of its instances, partitions are numbered from 0
+    """
+    offsets = {}
+    num_instances = 0
+    for entity in sorted(skeleton.entity_instances):
+        offsets[entity] = num_instances
+        num_instances += len(skeleton.entity_instances[entity]["names"])
+    parents = np.arange(num_instances, dtype=np.int64)
+    for relation, (entity_from, entity_to) in skeleton.relations.items():
+        index = skeleton.get_relation_index(relation)
+        for start in range(0, len(index.source), chunk_size):
+            sources = _find_roots(parents, offsets[entity_from] + np.asarray(index.source[start:start + chunk_size], dtype=np.int64))
+            targets = _find_roots(parents, offsets[entity_to] + np.asarray(index.target[start:start + chunk_size], dtype=np.int64))
+
+            # Components of the roots touched by the chunk, every root is pointed at the smallest root of its component
+            roots, local = np.unique(np.concatenate([sources, targets]), return_inverse=True)
+            chunk_graph = sp.coo_matrix((np.ones(len(sources), dtype=bool), (local[:len(sources)], local[len(sources):])), shape=(len(roots), len(roots)))
+            num_chunk_components, chunk_labels = connected_components(chunk_graph, directed=False)
+            component_roots = np.full(num_chunk_components, num_instances, dtype=np.int64)
+            np.minimum.at(component_roots, chunk_labels, roots)
+            parents[roots] = component_roots[chunk_labels]
+    _, labels = np.unique(_find_roots(parents, np.arange(num_instances, dtype=np.int64)), return_inverse=True)
+    del parents
+    num_components = int(labels.max()) + 1 if num_instances > 0 else 0
+
+    num_roots = len(skeleton.entity_instances[root_entity]["names"])
+    root_labels = labels[offsets[root_entity]:offsets[root_entity] + num_roots]
+    num_root_partitions = -(-num_roots // roots_per_partition)
+    component_partitions = np.full(num_components, num_root_partitions, dtype=np.int64)
+    np.minimum.at(component_partitions, root_labels, np.arange(num_roots) // roots_per_partition)
+    component_sizes = np.bincount(labels, minlength=num_components)
+
+    # Components without a root are packed in order into partitions of at most max_partition_size instances
+    if max_partition_size is None:
+        root_partition_sizes = np.bincount(component_partitions, weights=component_sizes, minlength=num_root_partitions + 1)[:num_root_partitions]
+        max_partition_size = max(int(root_partition_sizes.max(initial=0)), 1)
+    rootless = np.flatnonzero(component_partitions == num_root_partitions)
+    cumulative_sizes = np.cumsum(component_sizes[rootless])
+    start, partition = 0, num_root_partitions
+    while start < len(rootless):
+        previous_size = cumulative_sizes[start - 1] if start > 0 else 0
+        end = max(int(np.searchsorted(cumulative_sizes, previous_size + max_partition_size, side='right')), start + 1)
+        component_partitions[rootless[start:end]] = partition
+        start, partition = end, partition + 1
+
+    # Partitions whose roots were all claimed by earlier partitions are dropped
+    _, component_partitions = np.unique(component_partitions, return_inverse=True)
+    num_partitions = int(component_partitions.max()) + 1 if num_components > 0 else 0
+    partition_sizes = np.bincount(component_partitions, weights=component_sizes, minlength=num_partitions).astype(np.int64)
+    partition_roots = np.bincount(component_partitions[root_labels], minlength=num_partitions)
+    for idx in np.flatnonzero(partition_roots > roots_per_partition):
+        print(f"Partition {idx} holds {partition_roots[idx]} {root_entity} instances instead of at most {roots_per_partition}, "
+              f"since relationship instances connect them")
+    for idx in np.flatnonzero((partition_sizes > max_partition_size) & (partition_roots <= roots_per_partition)):
+        print(f"Partition {idx} holds {partition_sizes[idx]} instances, more than {max_partition_size}, since connected instances cannot be split")
+    instance_partitions = component_partitions[labels].astype(np.int32)
+    return {entity: instance_partitions[offsets[entity]:offsets[entity] + len(skeleton.entity_instances[entity]["names"])] for entity in offsets}
+
+def build_partitioned_ground_graph(structure: RelationalCausalStructure, skeleton: RelationalSkeleton, root_entity: str, path_to_dir: str,
+                                   roots_per_partition: int = 1000, chunk_size: int = 1000000, max_partition_size: int = None) -> "PartitionedGroundGraph":
+    """ Build the ground graph partition by partition and write it to disk, without holding all of it in memory
+        Node ids are the same as in GroundGraph. Each partition owns whole connected components of instances, so every
+        edge is within one partition. Instance edges are streamed in chunks and appended to the files of their partitions,
+        then each partition is deduplicated on its own. Besides one chunk of edges, one integer per instance and one partition
+        are held in memory, relation indexes and attribute values can be memory-mapped with RelationalSkeleton.load_columnar.
+        Values keep their dtype. See get_instance_partitions for how partitions grow when relations connect many roots.
+
+    Args:
+        structure (RelationalCausalStructure): contains schema and edges
+        skeleton (RelationalSkeleton): contains all instances
+        root_entity (str): entity whose instances are grouped into partitions, e.g. state
+        path_to_dir (str): directory to write to, created if it does not exist
+        roots_per_partition (int, optional): number of consecutive root instances per partition. Defaults to 1000.
+        chunk_size (int, optional): number of instance edges processed at once. Defaults to 1000000.
+        max_partition_size (int, optional): number of instances per partition, see get_instance_partitions. Defaults to None.
+
+    Returns:
+        PartitionedGroundGraph: handle to the partitions on disk
+    """
+    os.makedirs(path_to_dir, exist_ok=True)
+    for name in os.listdir(path_to_dir):
+        if name.endswith(".edges.tmp"):
+            os.remove(os.path.join(path_to_dir, name))
+    instance_partitions = get_instance_partitions(skeleton, root_entity, roots_per_partition, chunk_size, max_partition_size)
+    num_partitions = max([int(partitions.max()) + 1 for partitions in instance_partitions.values() if len(partitions) > 0], default=0)
+
+    # Same contiguous blocks of node ids as GroundGraph
+    offsets = {}
+    num_nodes = 0
+    for entity in sorted(skeleton.entity_instances):
+        for attribute in sorted(structure.schema.attribute_classes[entity]):
+            offsets[Node(entity, attribute)] = num_nodes
+            num_nodes += len(skeleton.entity_instances[entity]["names"])
+
+    # Owned instances of every partition, found with one stable sort per entity
+    partition_positions = [{} for _ in range(num_partitions)]
+    for entity, partitions in instance_partitions.items():
+        np.save(os.path.join(path_to_dir, f"partitions.{entity}.npy"), partitions)
+        order = np.argsort(partitions, kind='stable')
+        for idx, positions in enumerate(np.split(order, np.cumsum(np.bincount(partitions, minlength=num_partitions))[:-1])):
+            partition_positions[idx][entity] = positions.astype(np.int64)
+
+    # Memory-mapped values stay on disk and only the positions of each partition are read, values of all partitions
+    # have the common dtype of all attributes so that no precision is lost
+    def take(values, positions):
+        if isinstance(values, np.ndarray):
+            return values[positions]
+        return np.asarray([values[position] for position in positions.tolist()])
+
+    dtypes = [values.dtype if isinstance(values, np.ndarray) else np.asarray(values[:1]).dtype
+              for values in (skeleton.entity_instances[node.entity][node.attribute] for node in offsets)]
+    dtype = np.result_type(*dtypes) if len(dtypes) > 0 else np.float64
+    for idx, positions in enumerate(partition_positions):
+        for entity, entity_positions in positions.items():
+            np.save(os.path.join(path_to_dir, f"partition_{idx}.{entity}.positions.npy"), entity_positions)
+        node_ids, values = [], []
+        for node, offset in offsets.items():
+            node_ids.append(offset + positions[node.entity])
+            values.append(take(skeleton.entity_instances[node.entity][node.attribute], positions[node.entity]).astype(dtype, copy=False))
+        np.save(os.path.join(path_to_dir, f"partition_{idx}.node_ids.npy"), np.concatenate(node_ids) if len(node_ids) > 0 else np.zeros(0, dtype=np.int64))
+        np.save(os.path.join(path_to_dir, f"partition_{idx}.values.npy"), np.concatenate(values) if len(values) > 0 else np.zeros(0, dtype=dtype))
+
+    # Stream instance edges of every relational edge in chunks and append them to the partition of their child
+    def append_edges(parent, child, parent_positions, child_positions):
+        partitions = instance_partitions[child.entity][child_positions]
+        order = np.argsort(partitions, kind='stable')
+        edges = np.stack([offsets[parent] + parent_positions, offsets[child] + child_positions], axis=1).astype(np.int64)[order]
+        counts = np.bincount(partitions, minlength=num_partitions)
+        for idx, partition_edges in enumerate(np.split(edges, np.cumsum(counts)[:-1])):
+            if len(partition_edges) > 0:
+                with open(os.path.join(path_to_dir, f"partition_{idx}.edges.tmp"), 'ab') as f:
+                    partition_edges.tofile(f)
+
+    for relation, edge_list in structure.edges.items():
+        for edge in edge_list:
+            if relation == "self":
+                num_instances = len(skeleton.entity_instances[edge.child.entity]["names"])
+                for start in range(0, num_instances, chunk_size):
+                    positions = np.arange(start, min(start + chunk_size, num_instances), dtype=np.int64)
+                    append_edges(edge.parent, edge.child, positions, positions)
+                continue
+            entity_0, entity_1 = structure.schema.relations[relation]
+            index = skeleton.get_relation_index(relation)
+            for start in range(0, len(index.source), chunk_size):
+                source = np.asarray(index.source[start:start + chunk_size], dtype=np.int64)
+                target = np.asarray(index.target[start:start + chunk_size], dtype=np.int64)
+                if edge.parent.entity == entity_0 and edge.child.entity == entity_1:
+                    append_edges(edge.parent, edge.child, source, target)
+                if edge.parent.entity == entity_1 and edge.child.entity == entity_0:
+                    append_edges(edge.parent, edge.child, target, source)
+
+    # Remove duplicate edges of each partition, only one partition is in memory at a time
+    num_edges = []
+    for idx in range(num_partitions):
+        path = os.path.join(path_to_dir, f"partition_{idx}.edges.tmp")
+        edges = np.fromfile(path, dtype=np.int64).reshape(-1, 2) if os.path.exists(path) else np.zeros((0, 2), dtype=np.int64)
+        edges = np.unique(edges, axis=0)
+        np.save(os.path.join(path_to_dir, f"partition_{idx}.sources.npy"), edges[:, 0])
+        np.save(os.path.join(path_to_dir, f"partition_{idx}.targets.npy"), edges[:, 1])
+        num_edges.append(len(edges))
+        if os.path.exists(path):
+            os.remove(path)
+
+    manifest = {
+        "root_entity": root_entity,
+        "num_nodes": num_nodes,
+        "num_edges": num_edges,
+        "blocks": [[node.entity, node.attribute, offset, len(skeleton.entity_instances[node.entity]["names"])] for node, offset in offsets.items()],
+    }
+    with open(os.path.join(path_to_dir, "manifest.json"), 'w') as f:
+        json.dump(manifest, f, indent=4)
+    return PartitionedGroundGraph(path_to_dir)
+
+class PartitionedGroundGraph:
+    """
+    Handle to a ground graph written to disk by build_partitioned_ground_graph.
+    Partitions are memory-mapped one at a time, and node ids are global ids with the same layout as GroundGraph.
+    """
+    def __init__(self, path_to_dir: str) -> None:
+
+        self.path_to_dir = path_to_dir
+        with open(os.path.join(path_to_dir, "manifest.json"), 'r') as f:
+            manifest = json.load(f)
+        self.root_entity = manifest["root_entity"]
+        self.num_nodes = manifest["num_nodes"]
+        self.partition_num_edges = manifest["num_edges"]
+        self.num_edges = sum(self.partition_num_edges)
+        self.num_partitions = len(self.partition_num_edges)
+        self.offsets = {}
+        self.block_sizes = {}
+        for entity, attribute, offset, size in manifest["blocks"]:
+            self.offsets[Node(entity, attribute)] = offset
+            self.block_sizes[Node(entity, attribute)] = size
+        self.blocks = list(self.offsets)
+        self.block_starts = np.array([self.offsets[node] for node in self.blocks], dtype=np.int64)
+        self.instance_partitions = {node.entity: np.load(os.path.join(path_to_dir, f"partitions.{node.entity}.npy"), mmap_mode='r') for node in self.blocks}
+
+    def __len__(self) -> int:
+        return self.num_partitions
+
+    def __iter__(self):
+        for idx in range(self.num_partitions):
+            yield self.get_partition(idx)
+
+    def get_partition(self, idx: int) -> GroundGraphPartition:
+        """ Memory-map one partition
+
+        Args:
+            idx (int): index of the partition
+
+        Returns:
+            GroundGraphPartition: sorted global ids and values of the nodes it owns, its edges as global ids,
+                and the positions of its instances of every entity
+        """
+        def load(name):
+            return np.load(os.path.join(self.path_to_dir, f"partition_{idx}.{name}.npy"), mmap_mode='r')
+
+        positions = {node.entity: load(f"{node.entity}.positions") for node in self.blocks}
+        return GroundGraphPartition(idx, load("node_ids"), load("values"), load("sources"), load("targets"), positions)
+
+    def get_node_id(self, entity: str, attribute: str, position: int) -> int:
+        """ Returns the global id of the instance at a position of an attribute, as in GroundGraph
+        """
+        return self.offsets[Node(entity, attribute)] + position
+
+    def get_node_partitions(self, node_ids: np.ndarray) -> np.ndarray:
+        """ Find the partition that owns each node
+
+        Args:
+            node_ids (np.ndarray): global node ids
+
+        Returns:
+            np.ndarray: partition of each node
+        """
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        block_idx = np.searchsorted(self.block_starts, node_ids, side='right') - 1
+        partitions = np.zeros(len(node_ids), dtype=np.int64)
+        for idx in np.unique(block_idx):
+            node = self.blocks[idx]
+            selected = block_idx == idx
+            partitions[selected] = self.instance_partitions[node.entity][node_ids[selected] - self.offsets[node]]
+        return partitions
+
+    def get_descendants(self, node_ids: np.ndarray) -> np.ndarray:
+        """ Find all descendants of the given nodes, only loading the partitions that own them
+
+        Args:
+            node_ids (np.ndarray): global node ids
+
+        Returns:
+            np.ndarray: sorted global ids of the descendants, excluding the nodes themselves unless they are reachable
+        """
+        node_ids = np.unique(np.asarray(node_ids, dtype=np.int64))
+        partitions = self.get_node_partitions(node_ids)
+        descendants = []
+        for idx in np.unique(partitions):
+            # Node ids of a partition are sorted, so edges are mapped to local ids by binary search
+            partition = self.get_partition(idx)
+            partition_ids = np.asarray(partition.node_ids)
+            sources = np.searchsorted(partition_ids, partition.sources)
+            targets = np.searchsorted(partition_ids, partition.targets)
+            adjacency = sp.csr_matrix((np.ones(len(sources), dtype=bool), (sources, targets)), shape=(len(partition_ids), len(partition_ids)))
+            reached = np.zeros(len(partition_ids), dtype=bool)
+            frontier = np.searchsorted(partition_ids, node_ids[partitions == idx])
+            while len(frontier) > 0:
+                children = np.unique(adjacency[frontier].indices)
+                frontier = children[~reached[children]]
+                reached[frontier] = True
+            descendants.append(partition_ids[reached])
+        return np.sort(np.concatenate(descendants)) if len(descendants) > 0 else np.zeros(0, dtype=np.int64)
+
+    def iter_subskeletons(self, skeleton: RelationalSkeleton):
+        """ Iterate over the skeleton restricted to the instances of each partition, e.g. to sample one partition at a time
+            Partitions own whole connected components, so sampling each subskeleton is the same as sampling the full skeleton
+
+        Args:
+            skeleton (RelationalSkeleton): skeleton the partitioned ground graph was built from
+
+        Yields:
+            RelationalSkeleton: subskeleton of a partition
+        """
+        for idx in range(self.num_partitions):
+            yield skeleton.get_subskeleton(self.get_partition(idx).positions)
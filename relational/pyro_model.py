@@ -0,0 +1,85 @@
+import pyro
+import pyro.distributions as dist
+import torch
+
+from relational.aggregation import aggregate_relational_edge
+from relational.data import RelationalSkeleton
+from relational.scm import RelationalSCM
+
+def get_observations(scm: RelationalSCM, skeleton: RelationalSkeleton) -> dict:
+    """ Collect the attribute values of the skeleton keyed by the names of sample sites in the compiled model
+
+    Args:
+        scm (RelationalSCM): relational SCM built from a structure
+        skeleton (RelationalSkeleton): contains all instances
+
+    Returns:
+        dict: key is a node name entity.attribute and value is a tensor over all instances
+    """
+    return {scm.get_name_from_node(node): skeleton.get_attribute_vector(node.entity, node.attribute) for node in scm.structure.nodes}
+
+def compile_pyro_model(scm: RelationalSCM, skeleton: RelationalSkeleton, aggregation: str = 'mean', learn_parameters: bool = True, likelihood_scale: float = 1.0):
+    """ Compile a relational SCM into a Pyro model with one plated sample site per (entity, attribute)
+        Relational parents are gathered and aggregated with index tensors, so the number of sample sites
+        depends on the number of attribute classes and not on the number of instances
+
+    Args:
+        scm (RelationalSCM): relational SCM built from a structure
+        skeleton (RelationalSkeleton): contains all instances
+        aggregation (str, optional): aggregation of parents on the many side of a relation. Defaults to 'mean'.
+        learn_parameters (bool, optional): place standard normal priors on weights and biases and a half-normal prior on noise scales,
+            otherwise use the linear mechanisms stored in the SCM, which cannot have networks. Defaults to True.
+        likelihood_scale (float, optional): factor applied to the log density of all attribute values, e.g. to rescale
+            a minibatch to the full dataset. Defaults to 1.0.
+
+    Returns:
+        callable: a Pyro model taking an optional dict of observations keyed by node name and returning all values,
+            a subskeleton of the skeleton (e.g. a minibatch) and its likelihood scale can be passed to each call instead
+    """
+    if not learn_parameters and len(scm.neural_mechanisms) > 0:
+        raise ValueError(f"Pyro models only use linear Gaussian mechanisms, refit {sorted(scm.neural_mechanisms)} with model='linear'")
+    structure = scm.structure
+    order = structure.get_topological_order()
+    if order is None:
+        print("Relational structure has a cycle, cannot compile the SCM")
+        order = []
+    compiled_skeleton, compiled_scale = skeleton, likelihood_scale
+
+    def model(data: dict = None, skeleton: RelationalSkeleton = None, likelihood_scale: float = None) -> dict:
+        data = {} if data is None else data
+        skeleton = compiled_skeleton if skeleton is None else skeleton
+        likelihood_scale = compiled_scale if likelihood_scale is None else likelihood_scale
+        num_instances = {entity: len(skeleton.entity_instances[entity]["names"]) for entity in skeleton.entity_instances}
+        values = {}
+        plates = {entity: pyro.plate(f"{entity}_plate", num_instances[entity], dim=-1) for entity in num_instances}
+        for node in order:
+            node_name = scm.get_name_from_node(node)
+
+            # Intervened nodes are constant for all instances, a tensor of values is a batch dimension left of the entity plate
+            intervention = scm.get_intervention(node_name)
+            if intervention is not None:
+                values[node] = torch.as_tensor(intervention, dtype=torch.get_default_dtype())[..., None] + torch.zeros(num_instances[node.entity])
+                continue
+
+            incoming_edges = structure.get_incoming_edges(node.entity, node.attribute)
+            if learn_parameters:
+                bias = pyro.sample(f"bias_{node_name}", dist.Normal(0., 1.))
+                scale = pyro.sample(f"scale_{node_name}", dist.HalfNormal(1.))
+                weights = {key: pyro.sample(f"weight_{key[0]}_{scm.get_name_from_node(key[1].parent)}_{node_name}", dist.Normal(0., 1.)) for key in incoming_edges}
+            else:
+                mechanism = scm.get_mechanism(node_name)
+                bias, scale, weights = mechanism.bias, mechanism.scale, mechanism.weights
+
+            # Parameters are sampled outside the entity plates, so they are scalars or already have a size 1 dimension at the
+            # entity plate (dim=-1) with vectorized particles to its left, and broadcast against instances without reshaping
+            loc = torch.as_tensor(bias, dtype=torch.get_default_dtype()) + torch.zeros(num_instances[node.entity])
+            for relation, edge in incoming_edges:
+                weight = weights.get((relation, edge), 0.0)
+                parent_values = aggregate_relational_edge(structure, skeleton, relation, edge, values[edge.parent], aggregation)
+                loc = loc + torch.as_tensor(weight, dtype=torch.get_default_dtype()) * parent_values
+
+            with plates[node.entity], pyro.poutine.scale(scale=likelihood_scale):
+                values[node] = pyro.sample(node_name, dist.Normal(loc, torch.as_tensor(scale, dtype=torch.get_default_dtype())), obs=data.get(node_name))
+        return values
+
+    return model
@@ -0,0 +1,191 @@
+from copy import copy
+
+import numpy as np
+import torch
+
+from relational.aggregation import aggregate_relational_edge, get_edge_positions, segment_reduce
+from relational.data import RelationalSkeleton
+from relational.ground_graph import GroundGraph
+from relational.scm import RelationalSCM
+from relational.utils import MLPMechanism, Node
+
+class RelationalSampler:
+    """
+    Forward sampler for a relational SCM with linear Gaussian mechanisms, or networks fit with fit_scm, over a relational skeleton.
+    Every (entity, attribute) pair is sampled for all instances at once, in topological order of the relational structure.
+    """
+    def __init__(self, scm: RelationalSCM, skeleton: RelationalSkeleton, aggregation: str = 'mean') -> None:
+
+        if scm.structure is None:
+            raise ValueError("SCM has no relational structure, create it with create_from_structure or pass the structure to load")
+        self.scm = scm
+        self.structure = scm.structure
+        self.skeleton = skeleton
+        self.aggregation = aggregation
+
+        # The order only depends on the relational structure and is cached there
+        self.order = self.structure.get_topological_order()
+        if self.order is None:
+            print("Relational structure has a cycle, cannot sample from the SCM")
+            self.order = []
+
+    def sample(self, num_samples: int = 1, generator: torch.Generator = None, return_noise: bool = False, node_values: dict = None, noise: dict = None) -> dict:
+        """ Draw samples of every attribute of every instance in the skeleton
+
+        Args:
+            num_samples (int, optional): number of samples. Defaults to 1.
+            generator (torch.Generator, optional): random number generator for the noise terms. Defaults to None.
+            return_noise (bool, optional): also return the standard normal noise of every node, e.g. for resample. Defaults to False.
+            node_values (dict, optional): key is a Node and value is a tensor of shape (..., num_samples or 1, num_instances) that
+                sets every instance of the node, leading dimensions are batch dimensions sharing the same noise. Defaults to None.
+            noise (dict, optional): noise returned by an earlier call to reuse instead of drawing new noise. Defaults to None.
+
+        Returns:
+            dict: key is a Node and value is a tensor of shape (num_samples, num_instances), with leading
+                dimensions for batched interventions, all of which share the same noise
+        """
+        node_values = {} if node_values is None else node_values
+        samples = {}
+        noise = {} if noise is None else dict(noise)
+        for node in self.order:
+            node_name = self.scm.get_name_from_node(node)
+            num_instances = len(self.skeleton.entity_instances[node.entity]["names"])
+            if node in node_values:
+                value = torch.as_tensor(node_values[node], dtype=torch.get_default_dtype())
+                samples[node] = value.expand(value.shape[:-2] + (num_samples, num_instances))
+                continue
+
+            # Intervened nodes are constant for all samples and instances, a tensor of values adds leading batch dimensions
+            intervention = self.scm.get_intervention(node_name)
+            if intervention is not None:
+                intervention = torch.as_tensor(intervention, dtype=torch.get_default_dtype())
+                samples[node] = intervention[..., None, None].expand(intervention.shape + (num_samples, num_instances))
+                continue
+
+            if node not in noise:
+                noise[node] = torch.randn(num_samples, num_instances, generator=generator)
+            if node_name in self.scm.neural_mechanisms:
+                samples[node] = self.get_neural_value(self.scm.neural_mechanisms[node_name], samples, noise[node])
+                continue
+            mechanism = self.scm.get_mechanism(node_name)
+            value = mechanism.bias + mechanism.scale * noise[node]
+            for relation, edge in self.structure.get_incoming_edges(node.entity, node.attribute):
+                weight = mechanism.weights.get((relation, edge), 0.0)
+                if weight != 0.0:
+                    value = value + weight * aggregate_relational_edge(self.structure, self.skeleton, relation, edge, samples[edge.parent], self.aggregation)
+            samples[node] = value
+        if return_noise:
+            return samples, noise
+        return samples
+
+    def get_neural_value(self, mechanism: MLPMechanism, samples: dict, noise: torch.Tensor) -> torch.Tensor:
+        """ Evaluate a fitted network on the aggregated parent values of all instances of a node and add its noise
+            Columns are aggregated as they were when fitting, see aggregation.get_feature_matrix
+
+        Args:
+            mechanism (MLPMechanism): network, the (relation, edge, aggregation) of each input column and the noise scale
+            samples (dict): samples of the parents of the node
+            noise (torch.Tensor): standard normal noise of shape (num_samples, num_instances)
+
+        Returns:
+            torch.Tensor: values of shape (..., num_samples, num_instances)
+        """
+        features = [aggregate_relational_edge(self.structure, self.skeleton, relation, edge, samples[edge.parent], 'mean' if aggregation == "value" else aggregation)
+                    for relation, edge, aggregation in mechanism.columns]
+        features = torch.broadcast_tensors(*features)
+        dtype = next(mechanism.network.parameters()).dtype
+        with torch.no_grad():
+            value = mechanism.network(torch.stack(features, dim=-1).to(dtype)).squeeze(-1).to(noise.dtype)
+        return value + mechanism.scale * noise
+
+    def resample(self, samples: dict, noise: dict, ground_graph: GroundGraph, interventions: dict) -> dict:
+        """ Intervene on individual instances and recompute only their descendants, keeping the noise of every instance
+            The ground graph is mutated in place by removing the incoming edges of the intervened instances
+
+        Args:
+            samples (dict): samples returned by sample
+            noise (dict): noise returned by sample with return_noise
+            ground_graph (GroundGraph): ground graph of the structure and skeleton of the sampler
+            interventions (dict): key is an InstanceNode and value is the value it is set to
+
+        Returns:
+            dict: new samples, tensors of unaffected nodes are shared with the given samples
+        """
+        intervened_ids = ground_graph.intervene_(interventions)
+        affected = ground_graph.get_descendants(intervened_ids)
+        affected[intervened_ids] = True
+        return self.recompute(samples, noise, ground_graph, affected, interventions)
+
+    def recompute(self, samples: dict, noise: dict, ground_graph: GroundGraph, affected: np.ndarray, interventions: dict) -> dict:
+        """ Recompute the given instance nodes from their parents and noise, without mutating the ground graph
+
+        Args:
+            samples (dict): samples returned by sample
+            noise (dict): noise returned by sample with return_noise
+            ground_graph (GroundGraph): ground graph used to map node ids to instances
+            affected (np.ndarray): boolean mask over node ids of the ground graph, including the intervened nodes
+            interventions (dict): key is an InstanceNode and value is the value it is set to
+
+        Returns:
+            dict: new samples, tensors of unaffected nodes are shared with the given samples
+        """
+        intervened = {}
+        for instance_node, value in interventions.items():
+            node = Node(instance_node.entity, instance_node.attribute)
+            position = self.skeleton.get_instance_positions(node.entity).get_loc(instance_node.instance)
+            intervened.setdefault(node, {})[position] = value
+
+        new_samples = dict(samples)
+        for node in self.order:
+            node_affected = torch.as_tensor(affected[ground_graph.get_node_ids(node.entity, node.attribute)])
+            if not node_affected.any() or self.scm.get_intervention(self.scm.get_name_from_node(node)) is not None:
+                continue
+            num_instances = len(node_affected)
+            value = samples[node].clone()
+
+            # Recompute affected instances from the instance edges into them only, networks are evaluated on all instances
+            affected_positions = torch.nonzero(node_affected).squeeze(-1)
+            node_name = self.scm.get_name_from_node(node)
+            if node_name in self.scm.neural_mechanisms:
+                update = self.get_neural_value(self.scm.neural_mechanisms[node_name], new_samples, noise[node])[..., affected_positions]
+                incoming_edges = []
+            else:
+                mechanism = self.scm.get_mechanism(node_name)
+                update = mechanism.bias + mechanism.scale * noise[node][..., affected_positions]
+                incoming_edges = self.structure.get_incoming_edges(node.entity, node.attribute)
+            for relation, edge in incoming_edges:
+                weight = mechanism.weights.get((relation, edge), 0.0)
+                if weight != 0.0:
+                    parent_positions, child_positions = get_edge_positions(self.structure, self.skeleton, relation, edge)
+                    selected = node_affected[child_positions]
+                    parent_values = new_samples[edge.parent][..., parent_positions[selected]]
+                    aggregate = segment_reduce(parent_values, child_positions[selected], num_instances, self.aggregation)
+                    update = update + weight * aggregate[..., affected_positions]
+            value = value.expand(update.shape[:-1] + (num_instances,)).clone()
+            value[..., affected_positions] = update
+
+            # Intervened instances take their assigned values
+            if node in intervened:
+                positions = torch.tensor(list(intervened[node].keys()))
+                value[..., positions] = torch.tensor(list(intervened[node].values()), dtype=value.dtype)
+            new_samples[node] = value
+        return new_samples
+
+    def sample_skeleton(self, generator: torch.Generator = None) -> RelationalSkeleton:
+        """ Draw one sample and return it as a skeleton with the same instances and relationship instances
+
+        Args:
+            generator (torch.Generator, optional): random number generator for the noise terms. Defaults to None.
+
+        Returns:
+            RelationalSkeleton: a copy of the skeleton with sampled attribute values
+        """
+        samples = self.sample(1, generator)
+        skeleton = copy(self.skeleton)
+        skeleton.entity_instances = {}
+        skeleton.feature_matrices = {}
+        for entity, instances in self.skeleton.entity_instances.items():
+            skeleton.entity_instances[entity] = {"names": instances["names"]}
+            for attribute in self.structure.schema.attribute_classes[entity]:
+                skeleton.entity_instances[entity][attribute] = samples[Node(entity, attribute)][0].numpy()
+        return skeleton
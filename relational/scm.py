@@ -1,7 +1,7 @@
 from relational.causal_structure import RelationalCausalStructure
 from relational.schema import RelationalSchema
+from relational.utils import LinearGaussian
 from typing import Any
-from copy import deepcopy
 import json
 
 class RelationalSCM:
@@ -11,20 +11,28 @@ class RelationalSCM:
         self.observed_nodes = set()
         self.unobserved_nodes = set()
         self.functions = {}
+        self.structure = None
+        self.mechanisms = {}
+        self.neural_mechanisms = {}
 
-    def load(self, path_to_json: str):
+    def load(self, path_to_json: str, structure: RelationalCausalStructure = None):
         """Load an SCM from file
+            The file only holds the functions, so the relational structure needed by samplers and models is passed separately
 
         Args:
             path_to_json (str): path to the JSON file
+            structure (RelationalCausalStructure, optional): structure the SCM was created from. Defaults to None.
         """
         with open(path_to_json) as f:
             scm = json.load(f)
             self.observed_nodes = set(scm["observed_nodes"])
             self.unobserved_nodes = set(scm["unobserved_nodes"])
             self.functions = {}
-            for node, parents in scm["functions"]:
+            for node, parents in scm["functions"].items():
                 self.functions[node] = set(parents)
+        self.structure = structure
+        if structure is not None and set(self.get_name_from_node(node) for node in structure.nodes) != self.observed_nodes:
+            print("Nodes of the relational structure don't match the observed nodes of the SCM")
 
     def create_from_structure(self, structure: RelationalCausalStructure):
         """ Build a relational SCM from a given relational causal structure
@@ -33,6 +41,8 @@ class RelationalSCM:
             structure (RelationalCausalStructure): causal structure to load
         """
 
+        self.structure = structure
+
         # Create set of symbols (strings) for each node in structure
         self.observed_nodes = set([self.get_name_from_node(node) for node in structure.nodes])
 
@@ -46,6 +56,60 @@ class RelationalSCM:
             node_parents.add(f"noise_{self.get_name_from_node(node)}")
             self.functions[self.get_name_from_node(node)] = node_parents
     
+    def init_linear_gaussian(self, generator = None):
+        """ Assign a linear Gaussian mechanism to every node with standard normal weights, zero bias and unit noise scale
+            Parents reached through relations are aggregated before weighting, so there is one weight per incoming edge
+
+        Args:
+            generator (torch.Generator, optional): random number generator for the weights. Defaults to None.
+        """
+        import torch
+
+        for node in self.structure.nodes:
+            incoming_edges = self.structure.get_incoming_edges(node.entity, node.attribute)
+            weights = torch.randn(len(incoming_edges), generator=generator).tolist()
+            self.mechanisms[self.get_name_from_node(node)] = LinearGaussian(dict(zip(incoming_edges, weights)), 0.0, 1.0)
+
+    def fit(self, skeleton, model: str = 'linear', aggregation: str = 'mean', num_workers: int = None, **kwargs) -> dict:
+        """ Learn the mechanism of every observed node from the values in a skeleton, see fitting.fit_scm
+
+        Args:
+            skeleton (RelationalSkeleton): contains all instances and their observed values
+            model (str, optional): 'linear' or 'mlp'. Defaults to 'linear'.
+            aggregation (str, optional): aggregation of parents on the many side of a relation. Defaults to 'mean'.
+            num_workers (int, optional): number of threads fitting nodes concurrently. Defaults to the executor default.
+
+        Returns:
+            dict: key is a node name and value is its fitted mechanism
+        """
+        from relational.fitting import fit_scm
+
+        return fit_scm(self, skeleton, model, aggregation, num_workers, **kwargs)
+
+    def get_mechanism(self, node_name: str) -> LinearGaussian:
+        """ Returns the mechanism of a node, nodes without one only depend on their noise term
+
+        Args:
+            node_name (str): name of the node
+
+        Returns:
+            LinearGaussian: weights of each (relation, edge) tuple, bias and noise scale
+        """
+        return self.mechanisms.get(node_name, LinearGaussian({}, 0.0, 1.0))
+
+    def get_intervention(self, node_name: str):
+        """ Returns the value assigned to a node by an intervention, or None if the node is not intervened on
+
+        Args:
+            node_name (str): name of the node
+
+        Returns:
+            float: value of the intervention
+        """
+        if f"noise_{node_name}" in self.unobserved_nodes or node_name not in self.functions:
+            return None
+        return next(iter(self.functions[node_name]))
+
     def get_name_from_node(self, node):
         """Returns a string of the form entity_attribute from node tuples
 
@@ -58,22 +122,20 @@ class RelationalSCM:
         return f"{node.entity}.{node.attribute}"
 
     def intervene(self, node_name: str, value: float):
-        """ Return a new SCM with the given node set to the given value and all parents removed
+        """ Return a view of the SCM with the given node set to the given value and all parents removed
+            The view only stores the intervention and shares everything else with this SCM
 
         Args:
             node (str): name of the node to intervene on, which will be an attribute of an entity
-            value (float): value to set the node to
-        """
-
-        intervened_scm = deepcopy(self)
-
-        # Remove the exogenous noise term for the given node
-        intervened_scm.unobserved_nodes.remove(f"noise_{node_name}")
+            value (float): value to set the node to, or a tensor of values to evaluate in one batched pass
 
-        # Remove all parents of the given node and only assign the given value
-        intervened_scm.functions[node_name] = set([value])
-
-        return intervened_scm
+        Returns:
+            InterventionOverlay: the intervened SCM, or None if the node is not in the SCM
+        """
+        if node_name not in self.observed_nodes:
+            print(f"Node {node_name} is not in the SCM, cannot intervene")
+            return None
+        return InterventionOverlay(self, {node_name: value})
 
     def intervene_(self, node_name: str, value: float):
         """ Intervene in place on the given SCM
@@ -82,9 +144,12 @@ class RelationalSCM:
             node (str): name of the node to intervene on, which will be an attribute of an entity
             value (float): value to set the node to
         """
+        if node_name not in self.observed_nodes:
+            print(f"Node {node_name} is not in the SCM, cannot intervene")
+            return
 
-        # Remove the exogenous noise term for the given node
-        self.unobserved_nodes.remove(f"noise_{node_name}")
+        # Remove the exogenous noise term for the given node, which is already gone if it was intervened on before
+        self.unobserved_nodes.discard(f"noise_{node_name}")
 
         # Remove all parents of the given node and only assign the given value
         self.functions[node_name] = set([value])
@@ -104,4 +169,81 @@ class RelationalSCM:
         scm_dict["functions"] = scm_functions
 
         with open(path_to_json, 'w') as f:
-            json.dump(scm_dict, f, indent=4)
\ No newline at end of file
+            json.dump(scm_dict, f, indent=4)
+
+class InterventionOverlay:
+    """
+    Intervened view of a relational SCM holding only the do-assignments.
+    Only the structure, mechanisms and read-only helpers are shared with the base SCM, which can itself be an overlay to stack
+    interventions. Methods that change an SCM, like create_from_structure or fit, have to be called on the base SCM.
+    """
+    SHARED_ATTRIBUTES = ["structure", "mechanisms", "neural_mechanisms", "observed_nodes", "get_mechanism", "get_name_from_node"]
+
+    def __init__(self, base, interventions: dict = None) -> None:
+
+        self.base = base
+        self.interventions = {} if interventions is None else dict(interventions)
+
+    def __getattr__(self, name: str) -> Any:
+        if name not in InterventionOverlay.SHARED_ATTRIBUTES:
+            raise AttributeError(f"InterventionOverlay has no attribute {name}, only {InterventionOverlay.SHARED_ATTRIBUTES} are read from the base SCM")
+        return getattr(self.base, name)
+
+    @property
+    def functions(self) -> dict:
+        functions = dict(self.base.functions)
+        for node_name, value in self.interventions.items():
+            functions[node_name] = set([value])
+        return functions
+
+    @property
+    def unobserved_nodes(self) -> set:
+        return self.base.unobserved_nodes - set(f"noise_{node_name}" for node_name in self.interventions)
+
+    def get_intervention(self, node_name: str):
+        """ Returns the value assigned to a node by an intervention in this overlay or its base, or None
+
+        Args:
+            node_name (str): name of the node
+
+        Returns:
+            float: value of the intervention
+        """
+        if node_name in self.interventions:
+            return self.interventions[node_name]
+        return self.base.get_intervention(node_name)
+
+    def intervene(self, node_name: str, value: float):
+        """ Return a new overlay stacked on this one with an additional intervention
+
+        Args:
+            node (str): name of the node to intervene on, which will be an attribute of an entity
+            value (float): value to set the node to, or a tensor of values to evaluate in one batched pass
+
+        Returns:
+            InterventionOverlay: the intervened SCM, or None if the node is not in the SCM
+        """
+        if node_name not in self.observed_nodes:
+            print(f"Node {node_name} is not in the SCM, cannot intervene")
+            return None
+        return InterventionOverlay(self, {node_name: value})
+
+    def intervene_(self, node_name: str, value: float):
+        """ Add an intervention to this overlay in place
+
+        Args:
+            node (str): name of the node to intervene on, which will be an attribute of an entity
+            value (float): value to set the node to, or a tensor of values to evaluate in one batched pass
+        """
+        if node_name not in self.observed_nodes:
+            print(f"Node {node_name} is not in the SCM, cannot intervene")
+            return
+        self.interventions[node_name] = value
+
+    def save(self, path_to_json: str):
+        """ Save the intervened SCM to a json file, with the interventions of this overlay and its bases applied
+
+        Args:
+            path_to_json (str): path to the json file
+        """
+        RelationalSCM.save(self, path_to_json)
@@ -0,0 +1,36 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Blocks attached in this process, kept open for as long as the process uses the arrays viewing them
+_attached_blocks = []
+
+def share_array(array: np.ndarray) -> tuple:
+    """ Copy an array into a new shared memory block
+        The caller owns the block and has to close and unlink it once no process uses it anymore
+
+    Args:
+        array (np.ndarray): array to share
+
+    Returns:
+        tuple: the shared memory block and a (name, shape, dtype) descriptor to attach to it from other processes
+    """
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+    shared[...] = array
+    return block, (block.name, array.shape, array.dtype.str)
+
+def attach_array(descriptor: tuple) -> np.ndarray:
+    """ Attach to a shared array, e.g. in a worker process, which must not write to it
+
+    Args:
+        descriptor (tuple): (name, shape, dtype) descriptor from share_array
+
+    Returns:
+        np.ndarray: view of the shared array
+    """
+    name, shape, dtype = descriptor
+    block = shared_memory.SharedMemory(name=name)
+    # The block is owned and unlinked by the process that shared it, attached processes only keep it open
+    _attached_blocks.append(block)
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
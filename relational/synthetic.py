@@ -0,0 +1,97 @@
+import numpy as np
+
+from relational.data import RelationalSkeleton
+from relational.schema import RelationalSchema
+
+def get_num_instances(schema: RelationalSchema, num_instances: dict, fan_out: dict = None) -> dict:
+    """ Complete the number of instances of every entity by following relations from entities with a known number
+        An entity on the 'many' side of a one-to-many relation has fan_out times as many instances as the entity on the 'one' side,
+        and the entities of one-to-one and many-to-many relations have the same number of instances
+
+    Args:
+        schema (RelationalSchema): schema of the skeleton
+        num_instances (dict): key is an entity and value is its number of instances, for at least one entity
+        fan_out (dict, optional): key is a relation and value is the mean number of instances on its 'many' side per instance
+            on its 'one' side. Defaults to 1 for every relation.
+
+    Returns:
+        dict: key is an entity and value is its number of instances, or None if some entity is not connected to a known one
+    """
+    fan_out = {} if fan_out is None else fan_out
+    num_instances = dict(num_instances)
+    updated = True
+    while updated:
+        updated = False
+        for relation, (entity_from, entity_to) in schema.relations.items():
+            cardinality = schema.cardinality[relation]
+            for known, unknown in [(entity_from, entity_to), (entity_to, entity_from)]:
+                if known not in num_instances or unknown in num_instances:
+                    continue
+                if cardinality[known] == "one" and cardinality[unknown] == "many":
+                    num_instances[unknown] = int(round(num_instances[known] * fan_out.get(relation, 1)))
+                elif cardinality[known] == "many" and cardinality[unknown] == "one":
+                    num_instances[unknown] = max(1, int(round(num_instances[known] / fan_out.get(relation, 1))))
+                else:
+                    num_instances[unknown] = num_instances[known]
+                updated = True
+    missing = schema.entity_classes - set(num_instances)
+    if len(missing) > 0:
+        print(f"Number of instances of {sorted(missing)} cannot be found from the given entities")
+        return None
+    return num_instances
+
+def generate_skeleton(schema: RelationalSchema, num_instances: dict, fan_out: dict = None, distributions: dict = None, seed: int = None) -> RelationalSkeleton:
+    """ Generate a random skeleton that respects the cardinality of every relation, e.g. to benchmark at large scale
+
+        - one-to-many: each instance on the 'many' side is related to one uniformly chosen instance on the 'one' side
+        - one-to-one: instances of both entities are matched at random until one entity runs out
+        - many-to-many: each instance of the first entity is related to fan_out uniformly chosen instances of the second
+
+    Args:
+        schema (RelationalSchema): schema of the skeleton
+        num_instances (dict): key is an entity and value is its number of instances, missing entities are found with get_num_instances
+        fan_out (dict, optional): key is a relation and value is its fan-out, see get_num_instances. Defaults to 1 for one-to-many
+            relations and 2 for many-to-many relations.
+        distributions (dict, optional): key is a node name entity.attribute and value is a function of a np.random.Generator and a size
+            returning the attribute values. Defaults to standard normal values.
+        seed (int, optional): seed of the random number generator. Defaults to None.
+
+    Returns:
+        RelationalSkeleton: a valid skeleton with instance names entity_position, or None if the number of instances can't be found
+    """
+    fan_out = {} if fan_out is None else fan_out
+    distributions = {} if distributions is None else distributions
+    num_instances = get_num_instances(schema, num_instances, fan_out)
+    if num_instances is None:
+        return None
+    rng = np.random.default_rng(seed)
+
+    skeleton = RelationalSkeleton(schema)
+    for entity in sorted(schema.entity_classes):
+        # Names are only needed to look up instances, the types of instances are found from the name indexes on demand
+        skeleton.entity_instances[entity]["names"] = [f"{entity}_{position}" for position in range(num_instances[entity])]
+        for attribute in sorted(schema.attribute_classes[entity]):
+            distribution = distributions.get(f"{entity}.{attribute}", lambda rng, size: rng.standard_normal(size))
+            # Attribute values are float32, the default dtype of torch, so get_attribute_vector shares their memory without a
+            # conversion and large synthetic skeletons take half the memory
+            skeleton.entity_instances[entity][attribute] = np.asarray(distribution(rng, num_instances[entity]), dtype=np.float32)
+
+    # Relations are drawn as integer positions and handed to the skeleton as they are, no instance pairs are built
+    for relation in sorted(schema.relationship_classes):
+        entity_from, entity_to = schema.relations[relation]
+        cardinality = schema.cardinality[relation]
+        num_from, num_to = num_instances[entity_from], num_instances[entity_to]
+        if cardinality[entity_from] == "one" and cardinality[entity_to] == "many":
+            source, target = rng.integers(num_from, size=num_to), np.arange(num_to)
+        elif cardinality[entity_from] == "many" and cardinality[entity_to] == "one":
+            source, target = np.arange(num_from), rng.integers(num_to, size=num_from)
+        elif cardinality[entity_from] == "one":
+            size = min(num_from, num_to)
+            source, target = rng.permutation(num_from)[:size], rng.permutation(num_to)[:size]
+        else:
+            # Duplicate draws are removed, so instances can have slightly fewer partners than the fan-out
+            source = np.repeat(np.arange(num_from), int(fan_out.get(relation, 2)))
+            edge_keys = np.unique(source * num_to + rng.integers(num_to, size=len(source)))
+            source, target = edge_keys // num_to, edge_keys % num_to
+        skeleton.set_relationship_instances(relation, source.astype(np.int64), target.astype(np.int64))
+    return skeleton
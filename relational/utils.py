@@ -1,10 +1,16 @@
-import json
-from collections import namedtuple 
-import torch
-import numpy as np
-import pandas as pd
-import networkx as nx
+from collections import namedtuple
 
 Edge = namedtuple('Edge', 'parent child')
 Node = namedtuple('Node', 'entity attribute')
-InstanceNode = namedtuple('InstanceNode', 'entity attribute instance')
\ No newline at end of file
+InstanceNode = namedtuple('InstanceNode', 'entity attribute instance')
+RelationIndex = namedtuple('RelationIndex', 'source target forward reverse')
+SkeletonViolation = namedtuple('SkeletonViolation', 'kind location count message')
+LinearGaussian = namedtuple('LinearGaussian', 'weights bias scale')
+EliminationCost = namedtuple('EliminationCost', 'order max_dim flops')
+EffectEstimate = namedtuple('EffectEstimate', 'effect standard_error num_samples')
+RelationalVariable = namedtuple('RelationalVariable', 'path attribute')
+IntersectionVariable = namedtuple('IntersectionVariable', 'first second')
+RelationalFeature = namedtuple('RelationalFeature', 'relation node entity aggregation')
+FeatureMatrix = namedtuple('FeatureMatrix', 'features columns target')
+MLPMechanism = namedtuple('MLPMechanism', 'network columns scale')
+GroundGraphPartition = namedtuple('GroundGraphPartition', 'index node_ids values sources targets positions')
\ No newline at end of file
@@ -0,0 +1,47 @@
+from relational import *
+
+def test_relational_paths():
+
+    schema = RelationalSchema()
+    schema.load('tests/example/covid_schema.json')
+
+    # Towns can reach sibling towns through their state, but states can't reach other states through one town
+    paths = get_relational_paths(schema, "town", 2)
+    assert set(paths) == {("town",), ("town", "contains", "state"), ("town", "resides", "business"),
+                          ("town", "contains", "state", "contains", "town")}, f"Unexpected paths {paths}"
+    assert not is_valid_relational_path(schema, ("state", "contains", "town", "contains", "state")), "A town has only one state"
+    assert is_valid_relational_path(schema, ("business", "resides", "town", "resides", "business")), "A town has many businesses"
+
+    # Extending a path may backtrack along it
+    extended_paths = extend_relational_path(schema, ("town", "contains", "state"), ("state", "contains", "town"))
+    assert extended_paths == [("town", "contains", "state", "contains", "town"), ("town",)], f"Unexpected extensions {extended_paths}"
+
+def test_d_separation():
+
+    schema = RelationalSchema()
+    schema.load('tests/example/covid_schema.json')
+    structure = RelationalCausalStructure(schema)
+    structure.load('tests/example/covid_structure.json')
+    agg = structure.get_abstract_ground_graph("town", 2)
+    assert structure.get_abstract_ground_graph("town", 2) is agg, "Abstract ground graph should be cached"
+
+    state_policy = (("town", "contains", "state"), "policy")
+    town_policy = (("town",), "policy")
+    occupancy = (("town", "resides", "business"), "occupancy")
+    sibling_policy = (("town", "contains", "state", "contains", "town"), "policy")
+    assert agg.graph.has_edge(RelationalVariable(*state_policy), RelationalVariable(*town_policy)), "Missing dependency"
+    assert agg.graph.has_edge(RelationalVariable(*state_policy), RelationalVariable(*sibling_policy)), "Missing dependency of sibling towns"
+    assert IntersectionVariable(RelationalVariable(*town_policy), RelationalVariable(*sibling_policy)) in agg.graph, "Missing intersection variable"
+
+    # The state policy only reaches business occupancy through the town policy, also through its intersection with sibling towns
+    assert not agg.d_separated([state_policy], [occupancy]), "State policy and occupancy should be dependent"
+    assert agg.d_separated([state_policy], [occupancy], [town_policy]), "Town policy should separate state policy and occupancy"
+    assert agg.d_separated([occupancy], [state_policy], [town_policy]), "d-separation should be symmetric"
+    assert len(agg.d_separation_cache) == 2, "Symmetric queries should share a cache entry"
+    assert not agg.d_separated([sibling_policy], [occupancy]), "Sibling towns share the state policy"
+    assert not agg.d_separated([state_policy], [occupancy], [town_policy, (("town",), "prevalence")]), "Conditioning on a collider should connect"
+    assert agg.d_separated([state_policy], [(("town", "resides", "business", "resides", "town"), "policy")]) is None, "Unknown variables should be rejected"
+
+    # Adding an edge invalidates the cached graph
+    structure.add_edge("self", ("town", "policy"), ("town", "prevalence"))
+    assert structure.get_abstract_ground_graph("town", 2) is not agg, "Abstract ground graph should be rebuilt"
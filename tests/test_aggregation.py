@@ -0,0 +1,71 @@
+import numpy as np
+import torch
+from relational import *
+
+def test_relational_aggregates():
+
+    schema = RelationalSchema()
+    schema.load('tests/example/covid_schema.json')
+    structure = RelationalCausalStructure(schema)
+    structure.load('tests/example/covid_structure.json')
+    skeleton = RelationalSkeleton(schema)
+    skeleton.load(schema, 'tests/example/covid_skeleton.json')
+    aggregates = compute_relational_aggregates(structure, skeleton)
+
+    # Businesses are on the many side of resides, so their occupancy is reduced for each town
+    occupancy = skeleton.get_attribute_vector("business", "occupancy")
+    business_edge = aggregates[("resides", Edge(Node("business", "occupancy"), Node("town", "prevalence")))]
+    towns = {"t1": [0, 1], "t2": [2], "t3": [3, 4]}
+    for idx, businesses in enumerate(towns.values()):
+        assert torch.isclose(business_edge["mean"][idx], occupancy[businesses].mean()), f"Wrong mean occupancy for town {idx}"
+        assert torch.isclose(business_edge["sum"][idx], occupancy[businesses].sum()), f"Wrong total occupancy for town {idx}"
+        assert torch.isclose(business_edge["max"][idx], occupancy[businesses].max()), f"Wrong max occupancy for town {idx}"
+        assert business_edge["count"][idx] == len(businesses), f"Wrong number of businesses for town {idx}"
+
+    # States are on the one side of contains, so each town gets the policy of its state
+    policy = skeleton.get_attribute_vector("state", "policy")
+    state_edge = aggregates[("contains", Edge(Node("state", "policy"), Node("town", "policy")))]
+    for aggregation in ["mean", "sum", "max"]:
+        assert torch.equal(state_edge[aggregation], policy[[0, 0, 1]]), f"Wrong {aggregation} of state policy for towns"
+
+    # Aggregation is batched over leading dimensions
+    batched_occupancy = torch.stack([occupancy, 2 * occupancy])
+    batched_mean = aggregate_relational_edge(structure, skeleton, "resides", Edge(Node("business", "occupancy"), Node("town", "prevalence")), batched_occupancy)
+    assert torch.allclose(batched_mean, torch.stack([business_edge["mean"], 2 * business_edge["mean"]])), "Batched aggregation doesn't match"
+
+def test_flatten():
+
+    schema = RelationalSchema()
+    schema.load('tests/example/covid_schema.json')
+    structure = RelationalCausalStructure(schema)
+    structure.load('tests/example/covid_structure.json')
+    skeleton = RelationalSkeleton(schema)
+    skeleton.load(schema, 'tests/example/covid_skeleton.json')
+    feature_matrices = flatten(structure, skeleton, ['mean', 'count'])
+
+    # State policy is on the one side so it has one column, business occupancy is aggregated into one column per aggregation
+    prevalence = feature_matrices[Node("town", "prevalence")]
+    assert prevalence.features.shape == (3, 3), f"Wrong shape {prevalence.features.shape} of the town prevalence features"
+    assert [aggregation for _, _, aggregation in prevalence.columns] == ["value", "mean", "count"], f"Wrong columns {prevalence.columns}"
+    assert torch.equal(prevalence.features[:, 0], skeleton.get_attribute_vector("state", "policy")[[0, 0, 1]]), "Wrong state policy column"
+    assert torch.equal(prevalence.features[:, 2], torch.tensor([2.0, 1.0, 2.0])), "Wrong number of businesses per town"
+    assert torch.equal(prevalence.target, skeleton.get_attribute_vector("town", "prevalence")), "Wrong target values"
+    assert feature_matrices[Node("state", "policy")].features.shape == (2, 0), "Nodes without parents have no columns"
+
+    # Matrices are cached until the values they depend on are set again
+    assert flatten(structure, skeleton, ['mean', 'count'])[Node("town", "prevalence")] is prevalence, "Feature matrix should be cached"
+    policy_matrix = feature_matrices[Node("town", "policy")]
+    skeleton.set_attribute_values("business", "occupancy", [2 * value for value in skeleton.entity_instances["business"]["occupancy"]])
+    new_feature_matrices = flatten(structure, skeleton, ['mean', 'count'])
+    assert new_feature_matrices[Node("town", "policy")] is policy_matrix, "Matrices that don't use occupancy should stay cached"
+    assert torch.allclose(new_feature_matrices[Node("town", "prevalence")].features[:, 1], 2 * prevalence.features[:, 1]), "Matrix should be rebuilt from the new occupancy"
+
+    # Values changed in place are noticed once they are set again, even though the object is the same
+    occupancy = np.asarray(skeleton.entity_instances["business"]["occupancy"], dtype=np.float64)
+    skeleton.set_attribute_values("business", "occupancy", occupancy)
+    before = flatten(structure, skeleton, ('mean',))[Node("town", "prevalence")]
+    occupancy *= 3
+    assert flatten(structure, skeleton, ('mean',))[Node("town", "prevalence")] is before, "In-place changes are only noticed once set again"
+    skeleton.set_attribute_values("business", "occupancy", occupancy)
+    after = flatten(structure, skeleton, ('mean',))[Node("town", "prevalence")]
+    assert torch.allclose(after.features[:, 1], 3 * before.features[:, 1]), "Matrix should be rebuilt after setting in-place changed values"
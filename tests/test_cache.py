@@ -0,0 +1,66 @@
+import json
+import shutil
+from relational import *
+
+def test_artifact_cache(tmp_path):
+
+    for name in ["covid_schema.json", "covid_structure.json", "covid_skeleton.json"]:
+        shutil.copy(f"tests/example/{name}", tmp_path / name)
+    schema_path = str(tmp_path / "covid_schema.json")
+    structure_path = str(tmp_path / "covid_structure.json")
+    skeleton_path = str(tmp_path / "covid_skeleton.json")
+
+    # Loading twice returns the same cached objects, and derived artifacts reuse the cached inputs
+    cache = ArtifactCache(cache_dir=str(tmp_path / "cache"))
+    structure = load_structure(schema_path, structure_path, cache, shared=True)
+    assert load_structure(schema_path, structure_path, cache, shared=True) is structure, "Structure should be cached"
+    assert structure.schema is load_schema(schema_path, cache, shared=True), "Structure should use the cached schema"
+    ground_graph = load_ground_graph(schema_path, structure_path, skeleton_path, cache, shared=True)
+    skeleton = load_skeleton(schema_path, skeleton_path, cache, shared=True)
+    assert ground_graph.skeleton is skeleton, "Ground graph should use the cached skeleton"
+    assert load_scm(schema_path, structure_path, cache, shared=True).structure is structure, "SCM should use the cached structure"
+    assert set(load_adjacency(schema_path, structure_path, skeleton_path, cache)) == {"contains", "resides"}, "Missing adjacency matrices"
+
+    # Callers get copies, so changing them doesn't change what later callers get
+    copied_structure = load_structure(schema_path, structure_path, cache)
+    copied_structure.add_edge("self", Node("town", "policy"), Node("town", "prevalence"))
+    assert copied_structure.edges != structure.edges and load_structure(schema_path, structure_path, cache).edges == structure.edges, "Structure edges leaked"
+    copied_scm = load_scm(schema_path, structure_path, cache)
+    copied_scm.intervene_("town.policy", 1.0)
+    assert load_scm(schema_path, structure_path, cache).get_intervention("town.policy") is None, "Intervention leaked"
+    copied_ground_graph = load_ground_graph(schema_path, structure_path, skeleton_path, cache)
+    copied_ground_graph.intervene_({InstanceNode("town", "policy", "t1"): 5.0})
+    assert ground_graph.num_edges > copied_ground_graph.num_edges, "Intervention on the ground graph leaked"
+    assert not (load_ground_graph(schema_path, structure_path, skeleton_path, cache).values == 5.0).any(), "Values of the ground graph leaked"
+    copied_skeleton = load_skeleton(schema_path, skeleton_path, cache)
+    copied_skeleton.set_relationship_instances("contains", [0], [0])
+    assert len(skeleton.relationship_instances["contains"]) == 3, "Relationship instances of the skeleton leaked"
+    adjacency = load_adjacency(schema_path, structure_path, skeleton_path, cache)["contains"]
+    copied_adjacency = load_adjacency(schema_path, structure_path, skeleton_path, cache)
+    copied_adjacency["contains"][0, 1] = not copied_adjacency["contains"][0, 1]
+    assert (copied_adjacency["contains"] != adjacency).nnz == 1, "Adjacency matrix should be changed"
+    assert (load_adjacency(schema_path, structure_path, skeleton_path, cache)["contains"] != adjacency).nnz == 0, "Adjacency matrices leaked"
+
+    # A new cache reads the pickled objects from disk and shares the cached inputs again
+    disk_cache = ArtifactCache(cache_dir=str(tmp_path / "cache"))
+    disk_ground_graph = load_ground_graph(schema_path, structure_path, skeleton_path, disk_cache, shared=True)
+    assert disk_cache.disk_hits == 4 and disk_cache.misses == 0, "Ground graph should be read from disk with its schema, structure and skeleton"
+    assert disk_ground_graph.num_edges == ground_graph.num_edges, "Pickled ground graph doesn't match"
+    assert disk_ground_graph.skeleton is load_skeleton(schema_path, skeleton_path, disk_cache, shared=True), "Pickled ground graph should use the cached skeleton"
+
+    # Changing a file invalidates everything created from it
+    with open(structure_path) as f:
+        edges = json.load(f)
+    edges["resides"] = edges["resides"][:1]
+    with open(structure_path, "w") as f:
+        json.dump(edges, f)
+    new_structure = load_structure(schema_path, structure_path, cache, shared=True)
+    assert new_structure is not structure and len(new_structure.edges["resides"]) == 1, "Changed structure should be loaded again"
+    assert new_structure.schema is structure.schema, "Unchanged schema should stay cached"
+    assert load_ground_graph(schema_path, structure_path, skeleton_path, cache).num_edges < ground_graph.num_edges, "Ground graph should be rebuilt"
+
+    # Least recently used objects are evicted from memory
+    small_cache = ArtifactCache(maxsize=1)
+    schema = load_schema(schema_path, small_cache, shared=True)
+    load_skeleton(schema_path, skeleton_path, small_cache)
+    assert load_schema(schema_path, small_cache, shared=True) is not schema, "Schema should have been evicted"
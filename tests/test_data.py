@@ -0,0 +1,100 @@
+import json
+import numpy as np
+import pytest
+import torch
+from relational import *
+
+def test_relation_index():
+
+    schema = RelationalSchema()
+    schema.load('tests/example/covid_schema.json')
+    skeleton = RelationalSkeleton(schema)
+    skeleton.load(schema, 'tests/example/covid_skeleton.json')
+
+    # Integer-encoded instance edges should decode back to the relationship instances
+    for relation, (entity_from, entity_to) in schema.relations.items():
+        index = skeleton.get_relation_index(relation)
+        names_from = skeleton.get_instance_positions(entity_from)
+        names_to = skeleton.get_instance_positions(entity_to)
+        decoded = tuple(zip(names_from[index.source], names_to[index.target]))
+        assert decoded == skeleton.relationship_instances[relation], f"Relation index for {relation} doesn't match relationship instances"
+
+    # Neighbor lookups in both directions
+    assert skeleton.get_neighbors("contains", "s1") == ["t1", "t2"], f"Wrong towns in s1: {skeleton.get_neighbors('contains', 's1')}"
+    assert skeleton.get_neighbors("contains", "t3") == ["s2"], f"Wrong state for t3: {skeleton.get_neighbors('contains', 't3')}"
+    assert skeleton.get_neighbors("resides", "t3") == ["b4", "b5"], f"Wrong businesses in t3: {skeleton.get_neighbors('resides', 't3')}"
+
+    # Relationship instances are read-only and changing them through the skeleton updates the relation index
+    with pytest.raises(TypeError):
+        skeleton.relationship_instances["contains"] = []
+    skeleton.set_relationship_instances("contains", *zip(*skeleton.relationship_instances["contains"][1:]))
+    assert skeleton.get_neighbors("contains", "s1") == ["t2"], f"Relation index was not updated: {skeleton.get_neighbors('contains', 's1')}"
+    skeleton.set_relationship_instances("contains", [0, 0], [0, 1])
+    assert skeleton.relationship_instances["contains"] == (("s1", "t1"), ("s1", "t2")), "Positions should decode to names"
+
+def test_columnar_skeleton(tmp_path):
+
+    schema = RelationalSchema()
+    schema.load('tests/example/covid_schema.json')
+    skeleton = RelationalSkeleton(schema)
+    skeleton.load(schema, 'tests/example/covid_skeleton.json')
+
+    # Convert the JSON skeleton and load it back memory-mapped
+    convert_skeleton_to_columnar(schema, 'tests/example/covid_skeleton.json', tmp_path)
+    columnar_skeleton = RelationalSkeleton(schema)
+    columnar_skeleton.load_columnar(schema, tmp_path)
+    assert columnar_skeleton.is_valid_skeleton(schema), "Columnar skeleton is not valid"
+    assert columnar_skeleton.relationship_instances == skeleton.relationship_instances, "Relationship instances don't match the JSON skeleton"
+    for entity in schema.entity_classes:
+        assert columnar_skeleton.entity_instances[entity]["names"] == skeleton.entity_instances[entity]["names"], f"Names of {entity} don't match the JSON skeleton"
+        for attribute in schema.attribute_classes[entity]:
+            values = columnar_skeleton.entity_instances[entity][attribute]
+            assert values.tolist() == skeleton.entity_instances[entity][attribute], f"Values of {entity}.{attribute} lost precision"
+            vector = columnar_skeleton.get_attribute_vector(entity, attribute)
+            assert torch.equal(vector.float(), skeleton.get_attribute_vector(entity, attribute)), f"Values of {entity}.{attribute} don't match the JSON skeleton"
+            assert vector.data_ptr() == values.ctypes.data, f"Values of {entity}.{attribute} were copied"
+
+    # Relations stay memory-mapped integer arrays and are never decoded to names to build the relation index
+    for relation in schema.relations:
+        index = columnar_skeleton.get_relation_index(relation)
+        assert isinstance(index.source.base, np.memmap) and isinstance(index.target.base, np.memmap), f"Instance edges of {relation} were copied"
+        assert columnar_skeleton.get_neighbors(relation, skeleton.relationship_instances[relation][0][0]) == skeleton.get_neighbors(relation, skeleton.relationship_instances[relation][0][0]), f"Relation index of {relation} doesn't match the JSON skeleton"
+
+def test_validate_skeleton():
+
+    schema = RelationalSchema()
+    schema.load('tests/example/covid_schema.json')
+    skeleton = RelationalSkeleton(schema)
+    skeleton.load(schema, 'tests/example/covid_skeleton.json')
+    assert skeleton.validate_skeleton(schema) == [], "Example skeleton should not have violations"
+
+    # Break the skeleton in several ways and check that all violations are reported
+    skeleton.entity_instances["town"]["policy"] = skeleton.entity_instances["town"]["policy"][:2]
+    contains = skeleton.relationship_instances["contains"] + (("s2", "t1"), ("s3", "t2"))
+    skeleton.set_relationship_instances("contains", *zip(*contains))
+    violations = skeleton.validate_skeleton(schema)
+    assert not skeleton.is_valid_skeleton(schema), "Broken skeleton should be invalid"
+    assert set(violation.kind for violation in violations) == {"length_mismatch", "unknown_instance"}, f"Unexpected violations {violations}"
+
+    # Each town can be contained in only one state
+    skeleton.set_relationship_instances("contains", *zip(*contains[:-1]))
+    violations = skeleton.validate_skeleton(schema)
+    assert [violation.kind for violation in violations] == ["length_mismatch", "cardinality"], f"Unexpected violations {violations}"
+    assert violations[1].location == "contains" and violations[1].count == 1, f"Unexpected cardinality violation {violations[1]}"
+
+def test_load_duplicate_names(tmp_path, capsys):
+
+    schema = RelationalSchema()
+    schema.load('tests/example/covid_schema.json')
+    with open('tests/example/covid_skeleton.json') as f:
+        skeleton_dict = json.load(f)
+    town_names = skeleton_dict["entity_instances"]["town"]["names"]
+    town_names[1] = town_names[0]
+    with open(tmp_path / "skeleton.json", 'w') as f:
+        json.dump(skeleton_dict, f)
+
+    # Duplicate names are reported instead of failing to encode the relations of the entity
+    skeleton = RelationalSkeleton(schema)
+    skeleton.load(schema, tmp_path / "skeleton.json")
+    assert "Instance names of entity town are not unique" in capsys.readouterr().out, "Duplicate names should be reported"
+    assert len(skeleton.entity_instances["town"]["names"]) == 0, "Skeleton with duplicate names should be empty"
@@ -0,0 +1,71 @@
+import numpy as np
+import torch
+from relational import *
+
+def test_estimate_ites():
+
+    schema = RelationalSchema()
+    schema.load('tests/example/covid_schema.json')
+    structure = RelationalCausalStructure(schema)
+    structure.load('tests/example/covid_structure.json')
+    skeleton = RelationalSkeleton(schema)
+    skeleton.load(schema, 'tests/example/covid_skeleton.json')
+    scm = RelationalSCM()
+    scm.create_from_structure(structure)
+    scm.init_linear_gaussian(torch.Generator().manual_seed(0))
+    sampler = RelationalSampler(scm, skeleton)
+    ground_graph = GroundGraph(structure, skeleton)
+
+    # Effect of each town policy on its own prevalence goes through the mean occupancy of its businesses
+    towns = skeleton.entity_instances["town"]["names"]
+    treatments = [InstanceNode("town", "policy", town) for town in towns]
+    outcomes = [InstanceNode("town", "prevalence", town) for town in towns]
+    occupancy_weight = scm.get_mechanism("business.occupancy").weights[("resides", Edge(Node("town", "policy"), Node("business", "occupancy")))]
+    prevalence_weight = scm.get_mechanism("town.prevalence").weights[("resides", Edge(Node("business", "occupancy"), Node("town", "prevalence")))]
+
+    serial_effects, serial_timings = estimate_ites(sampler, ground_graph, treatments, outcomes, num_workers=1, generator=torch.Generator().manual_seed(0))
+    parallel_effects, parallel_timings = estimate_ites(sampler, ground_graph, treatments, outcomes, num_workers=2, generator=torch.Generator().manual_seed(0))
+    assert np.allclose(serial_effects, occupancy_weight * prevalence_weight, atol=1e-5), f"Effects {serial_effects} don't match {occupancy_weight * prevalence_weight}"
+    assert np.allclose(parallel_effects, serial_effects, atol=1e-6), f"Parallel effects {parallel_effects} don't match serial effects {serial_effects}"
+    assert len(parallel_timings) == len(towns) and (parallel_timings > 0).all(), "Timing should be reported for every unit"
+
+def test_estimate_effect():
+
+    schema = RelationalSchema()
+    schema.load('tests/example/covid_schema.json')
+    structure = RelationalCausalStructure(schema)
+    structure.load('tests/example/covid_structure.json')
+    skeleton = RelationalSkeleton(schema)
+    skeleton.load(schema, 'tests/example/covid_skeleton.json')
+    scm = RelationalSCM()
+    scm.create_from_structure(structure)
+    scm.init_linear_gaussian(torch.Generator().manual_seed(0))
+    sampler = RelationalSampler(scm, skeleton)
+    generator = torch.Generator().manual_seed(0)
+    occupancy_weight = scm.get_mechanism("business.occupancy").weights[("resides", Edge(Node("town", "policy"), Node("business", "occupancy")))]
+    prevalence_weight = scm.get_mechanism("town.prevalence").weights[("resides", Edge(Node("business", "occupancy"), Node("town", "prevalence")))]
+
+    # With common random numbers the noise cancels in linear mechanisms
+    overall = estimate_effect(sampler, Node("town", "policy"), Node("town", "prevalence"), 'overall', max_samples=200, generator=generator)
+    assert abs(overall.effect - occupancy_weight * prevalence_weight) < 1e-5, f"Overall effect {overall.effect} doesn't match {occupancy_weight * prevalence_weight}"
+    assert overall.num_samples == 200 and overall.standard_error < 1e-5, "Standard error should vanish with common random numbers"
+    isolated = estimate_effect(sampler, Node("town", "policy"), Node("town", "prevalence"), 'isolated', max_samples=200, unit_batch_size=2, generator=generator)
+    assert abs(isolated.effect - overall.effect) < 1e-5, "Towns only affect their own prevalence"
+
+    # Towns in the same state don't affect each other, but a town affects the businesses that reside in it
+    peer = estimate_effect(sampler, Node("town", "policy"), Node("town", "prevalence"), 'peer', peer_relations=["contains", "contains"], max_samples=200, generator=generator)
+    assert abs(peer.effect) < 1e-5, f"Peer effect between towns should be zero, got {peer.effect}"
+    peer = estimate_effect(sampler, Node("town", "policy"), Node("business", "occupancy"), 'peer', peer_relations=["resides"], max_samples=200, generator=generator)
+    assert abs(peer.effect - occupancy_weight) < 1e-5, f"Peer effect {peer.effect} doesn't match {occupancy_weight}"
+
+    # Sampling stops early once the tolerance is reached
+    estimate = estimate_effect(sampler, Node("state", "policy"), Node("town", "prevalence"), tolerance=0.01, batch_size=50, max_samples=1000, generator=generator)
+    assert estimate.num_samples == 50, f"Sampling should stop after the first batch, drew {estimate.num_samples} samples"
+    assert estimate_effect(sampler, Node("town", "policy"), Node("business", "occupancy"), 'isolated') is None, "Isolated effect needs the same entity"
+
+    # Outcomes that are not descendants of the treatment have no effect
+    for effect in ['overall', 'isolated']:
+        estimate = estimate_effect(sampler, Node("town", "prevalence"), Node("town", "policy"), effect, max_samples=20, generator=generator)
+        assert estimate.effect == 0.0 and estimate.standard_error == 0.0, f"{effect} effect on a non-descendant should be zero, got {estimate}"
+    estimate = estimate_effect(sampler, Node("town", "prevalence"), Node("state", "policy"), max_samples=20, generator=generator)
+    assert estimate.effect == 0.0 and estimate.standard_error == 0.0, f"Overall effect on a non-descendant should be zero, got {estimate}"
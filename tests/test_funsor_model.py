@@ -0,0 +1,41 @@
+import torch
+from relational import *
+
+def test_funsor_linear_gaussian():
+
+    schema = RelationalSchema()
+    schema.load('tests/example/covid_schema.json')
+    structure = RelationalCausalStructure(schema)
+    structure.load('tests/example/covid_structure.json')
+    skeleton = RelationalSkeleton(schema)
+    skeleton.load(schema, 'tests/example/covid_skeleton.json')
+    scm = RelationalSCM()
+    scm.create_from_structure(structure)
+    scm.init_linear_gaussian(torch.Generator().manual_seed(0))
+
+    # Exact interventional moments should match Monte Carlo estimates from the sampler
+    engine = FunsorLinearGaussian(scm, skeleton)
+    means, covariance, cost = engine.get_moments(["town.prevalence"], interventions={"state.policy": 1.0})
+    samples = RelationalSampler(scm.intervene("state.policy", 1.0), skeleton).sample(50000, torch.Generator().manual_seed(0))[Node("town", "prevalence")]
+    assert torch.allclose(means["town.prevalence"], samples.mean(0), atol=0.05), f"Mean {means['town.prevalence']} doesn't match Monte Carlo estimate {samples.mean(0)}"
+    assert torch.allclose(covariance, torch.cov(samples.T), atol=0.1), f"Covariance {covariance} doesn't match Monte Carlo estimate {torch.cov(samples.T)}"
+    assert sorted(cost.order) == ["business.occupancy", "town.policy"], f"Unexpected elimination order {cost.order}"
+
+    # Conditioning on all other nodes leaves the mechanism of the query node
+    evidence = {name: skeleton.get_attribute_vector(*name.split('.')) for name in ["state.policy", "town.policy", "business.occupancy"]}
+    means, covariance, cost = engine.get_moments(["town.prevalence"], evidence=evidence)
+    mechanism = scm.get_mechanism("town.prevalence")
+    loc = mechanism.bias + sum(weight * aggregate_relational_edge(structure, skeleton, relation, edge) for (relation, edge), weight in mechanism.weights.items())
+    assert torch.allclose(means["town.prevalence"], loc, atol=1e-5), f"Conditional mean {means['town.prevalence']} doesn't match mechanism {loc}"
+    assert torch.allclose(covariance, mechanism.scale ** 2 * torch.eye(3), atol=1e-5), "Conditional covariance should be the noise covariance"
+    assert cost.order == [], "Nothing should be eliminated"
+
+    # Intervened and observed query nodes keep their value with zero covariance
+    means, covariance, _ = engine.get_moments(["state.policy", "town.prevalence", "town.policy"], evidence={"town.policy": evidence["town.policy"]},
+                                              interventions={"state.policy": 1.0})
+    assert torch.equal(means["state.policy"], torch.ones(2)) and torch.equal(means["town.policy"], evidence["town.policy"]), "Fixed nodes should keep their values"
+    free_means, free_covariance, _ = engine.get_moments(["town.prevalence"], evidence={"town.policy": evidence["town.policy"]}, interventions={"state.policy": 1.0})
+    assert torch.allclose(means["town.prevalence"], free_means["town.prevalence"]), "Fixed query nodes should not change the moments of the others"
+    assert torch.allclose(covariance[2:5, 2:5], free_covariance) and covariance[:2].abs().sum() == 0 and covariance[5:].abs().sum() == 0, "Fixed nodes should have zero covariance"
+    means, covariance, _ = engine.get_moments(["state.policy"], interventions={"state.policy": 1.0})
+    assert torch.equal(means["state.policy"], torch.ones(2)) and torch.equal(covariance, torch.zeros(2, 2)), "A query of only fixed nodes should have zero covariance"
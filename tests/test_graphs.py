@@ -0,0 +1,47 @@
+import networkx as nx
+from relational import *
+
+def test_adj_mat_dict():
+
+    schema = RelationalSchema()
+    schema.load('tests/example/covid_schema.json')
+    structure = RelationalCausalStructure(schema)
+    structure.load('tests/example/covid_structure.json')
+    skeleton = RelationalSkeleton(schema)
+    skeleton.load(schema, 'tests/example/covid_skeleton.json')
+
+    # Sparse and dense adjacency matrices should agree with the relationship instances
+    adj_mat_dict = create_adj_mat_dict(structure, skeleton)
+    adj_df_dict = create_adj_mat_dict(structure, skeleton, as_dataframe=True)
+    for relation, instance_edges in skeleton.relationship_instances.items():
+        assert adj_mat_dict[relation].nnz == len(instance_edges), f"Wrong number of edges in adjacency matrix for {relation}"
+        assert (adj_mat_dict[relation].toarray() == adj_df_dict[relation].values).all(), f"Sparse and dense adjacency matrices for {relation} don't match"
+        for instance_edge in instance_edges:
+            assert adj_df_dict[relation].loc[instance_edge[0], instance_edge[1]], f"Edge {instance_edge} missing from adjacency matrix for {relation}"
+
+def test_subgraph_for_ITE():
+
+    schema = RelationalSchema()
+    schema.load('tests/example/covid_schema.json')
+    structure = RelationalCausalStructure(schema)
+    structure.load('tests/example/covid_structure.json')
+    skeleton = RelationalSkeleton(schema)
+    skeleton.load(schema, 'tests/example/covid_skeleton.json')
+    ground_graph = create_ground_graph(structure, skeleton)
+
+    # Compare against enumerating all simple paths for every pair of connected nodes
+    treatments, outcomes, ref_edge_sets = [], [], []
+    for node_name in ground_graph.nodes:
+        instance, attribute = node_name.split('.')
+        for descendant in nx.descendants(ground_graph, node_name):
+            for cutoff in [2, 10]:
+                ref_edge_set = set(edge for path in nx.all_simple_edge_paths(ground_graph, node_name, descendant, cutoff) for edge in path)
+                subgraph = create_subgraph_for_ITE(ground_graph, InstanceNode(skeleton.get_instance_type(instance), attribute, instance), InstanceNode(None, descendant.split('.')[1], descendant.split('.')[0]), cutoff)
+                assert set(subgraph.edges) == ref_edge_set, f"Subgraph from {node_name} to {descendant} with cutoff {cutoff} doesn't match simple paths"
+            treatments.append(InstanceNode(skeleton.get_instance_type(instance), attribute, instance))
+            outcomes.append(InstanceNode(None, descendant.split('.')[1], descendant.split('.')[0]))
+            ref_edge_sets.append(set(subgraph.edges))
+
+    # Batched extraction should give the same subgraphs
+    subgraphs = create_subgraphs_for_ITE(ground_graph, treatments, outcomes)
+    assert [set(subgraph.edges) for subgraph in subgraphs] == ref_edge_sets, "Batched subgraphs don't match"
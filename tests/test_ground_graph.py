@@ -0,0 +1,114 @@
+import numpy as np
+from relational import *
+
+def test_ground_graph():
+
+    schema = RelationalSchema()
+    schema.load('tests/example/covid_schema.json')
+    structure = RelationalCausalStructure(schema)
+    structure.load('tests/example/covid_structure.json')
+    skeleton = RelationalSkeleton(schema)
+    skeleton.load(schema, 'tests/example/covid_skeleton.json')
+
+    # Integer-indexed ground graph should export to the same graph as create_ground_graph
+    ground_graph = GroundGraph(structure, skeleton)
+    ref_ground_graph = create_ground_graph(structure, skeleton)
+    nx_ground_graph = ground_graph.to_networkx()
+    assert ground_graph.num_nodes == ref_ground_graph.number_of_nodes(), f"Expected {ref_ground_graph.number_of_nodes()} nodes but found {ground_graph.num_nodes}"
+    assert set(nx_ground_graph.edges) == set(ref_ground_graph.edges), "Edges don't match the reference ground graph"
+    for node_name, val in ref_ground_graph.nodes(data="val"):
+        assert nx_ground_graph.nodes[node_name]["val"] == val, f"Value of {node_name} doesn't match the reference ground graph"
+
+    # Node ids should round trip to instance nodes
+    for node_id in range(ground_graph.num_nodes):
+        assert ground_graph.get_node_id(ground_graph.get_instance_node(node_id)) == node_id, f"Node id {node_id} doesn't round trip"
+
+def test_ground_graph_layers():
+
+    schema = RelationalSchema()
+    schema.load('tests/example/covid_schema.json')
+    structure = RelationalCausalStructure(schema)
+    structure.load('tests/example/covid_structure.json')
+    skeleton = RelationalSkeleton(schema)
+    skeleton.load(schema, 'tests/example/covid_skeleton.json')
+    ground_graph = GroundGraph(structure, skeleton)
+
+    # Every node is in exactly one layer and after all of its parents
+    layers = ground_graph.get_topological_layers()
+    layer_of_node = np.full(ground_graph.num_nodes, -1)
+    for idx, layer in enumerate(layers):
+        layer_of_node[layer] = idx
+    assert (layer_of_node >= 0).all(), "Some nodes are missing from the layers"
+    assert (layer_of_node[ground_graph.sources] < layer_of_node[ground_graph.targets]).all(), "Parents should be in earlier layers than children"
+
+def test_partitioned_ground_graph(tmp_path):
+
+    schema = RelationalSchema()
+    schema.load('tests/example/covid_schema.json')
+    structure = RelationalCausalStructure(schema)
+    structure.load('tests/example/covid_structure.json')
+    skeleton = generate_skeleton(schema, {"state": 10}, fan_out={"contains": 3, "resides": 4}, seed=0)
+    ground_graph = GroundGraph(structure, skeleton)
+
+    # Partitions hold every node and edge of the ground graph exactly once, streamed in small chunks
+    partitioned = build_partitioned_ground_graph(structure, skeleton, "state", str(tmp_path), roots_per_partition=3, chunk_size=7)
+    assert len(partitioned) == 4, f"Expected 4 partitions but found {len(partitioned)}"
+    assert partitioned.num_nodes == ground_graph.num_nodes and partitioned.num_edges == ground_graph.num_edges, "Wrong size of the partitioned ground graph"
+    node_ids = np.concatenate([partition.node_ids for partition in partitioned])
+    assert np.array_equal(np.sort(node_ids), np.arange(ground_graph.num_nodes)), "Every node should be owned by one partition"
+    values = np.zeros(ground_graph.num_nodes)
+    for partition in partitioned:
+        values[partition.node_ids] = partition.values
+    assert np.allclose(values, ground_graph.values), "Node values don't match the ground graph"
+    edges = set()
+    for partition in PartitionedGroundGraph(str(tmp_path)):
+        edges.update(zip(partition.sources.tolist(), partition.targets.tolist()))
+    assert edges == set(zip(ground_graph.sources.tolist(), ground_graph.targets.tolist())), "Edges don't match the ground graph"
+
+    # Traversals only read the partitions of the given nodes
+    node_id = partitioned.get_node_id("state", "policy", 4)
+    assert np.array_equal(partitioned.get_descendants([node_id]), np.flatnonzero(ground_graph.get_descendants([node_id]))), "Descendants don't match the ground graph"
+
+    # Subskeletons of the partitions cover the skeleton
+    subskeletons = list(partitioned.iter_subskeletons(skeleton))
+    assert sum(GroundGraph(structure, subskeleton).num_edges for subskeleton in subskeletons) == ground_graph.num_edges, "Subskeletons should keep all edges"
+
+def test_instance_partitions(tmp_path, capsys):
+
+    schema = RelationalSchema()
+    schema.load('tests/example/covid_schema.json')
+    structure = RelationalCausalStructure(schema)
+    structure.load('tests/example/covid_structure.json')
+    skeleton = generate_skeleton(schema, {"state": 10}, fan_out={"contains": 3, "resides": 4}, seed=0)
+
+    # Towns without a state form components without a root, which are packed into partitions of bounded size
+    index = skeleton.get_relation_index("contains")
+    kept = np.asarray(index.target) >= 9
+    skeleton.set_relationship_instances("contains", np.asarray(index.source)[kept], np.asarray(index.target)[kept])
+    partitions = get_instance_partitions(skeleton, "state", 1, chunk_size=1, max_partition_size=10)
+    town_partitions = partitions["town"]
+    for relation, (entity_from, entity_to) in skeleton.relations.items():
+        index = skeleton.get_relation_index(relation)
+        assert np.array_equal(partitions[entity_from][index.source], partitions[entity_to][index.target]), f"Instances of {relation} should share a partition"
+    sizes = sum(np.bincount(entity_partitions, minlength=town_partitions.max() + 1) for entity_partitions in partitions.values())
+    assert np.all(sizes[len(np.unique(partitions["state"])):] <= 10), f"Partitions without a root are too large {sizes}"
+    assert len(np.unique(town_partitions[:9])) == 5, "Nine towns with four businesses each should be packed two by two"
+    assert "instead of at most" not in capsys.readouterr().out, "No states should be merged"
+
+    # A relationship instance shared between two roots merges their partitions, which is reported
+    source, target = np.asarray(skeleton.get_relation_index("contains").source), np.asarray(skeleton.get_relation_index("contains").target)
+    other_state = (source[target == 9][0] + 1) % 10
+    skeleton.set_relationship_instances("contains", np.append(source, other_state), np.append(target, 9))
+    partitions = get_instance_partitions(skeleton, "state", 1)
+    assert partitions["state"][other_state] == partitions["state"][source[target == 9][0]], "States sharing a town should share a partition"
+    assert "holds 2 state instances" in capsys.readouterr().out, "Merged partitions should be reported"
+
+    # Values keep their precision
+    policy = np.random.default_rng(0).normal(size=10)
+    skeleton.set_attribute_values("state", "policy", policy)
+    partitioned = build_partitioned_ground_graph(structure, skeleton, "state", str(tmp_path), roots_per_partition=3)
+    values = np.zeros(partitioned.num_nodes)
+    for partition in partitioned:
+        assert partition.values.dtype == np.float64, f"Values should be stored as float64 but are {partition.values.dtype}"
+        values[partition.node_ids] = partition.values
+    assert np.array_equal(values[partitioned.offsets[Node("state", "policy")] + np.arange(10)], policy), "Values should be stored losslessly"
@@ -0,0 +1,22 @@
+import subprocess
+import sys
+
+HEAVY_MODULES = ["torch", "numpy", "pandas", "networkx", "scipy", "pyro", "funsor"]
+
+def test_lazy_imports():
+
+    # A schema-only import runs in a fresh interpreter so earlier tests haven't loaded anything yet
+    code = ("import sys; from relational import RelationalSchema, RelationalCausalStructure, RelationalSCM; "
+            f"print(','.join(module for module in {HEAVY_MODULES} if module in sys.modules))")
+    loaded = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout.strip()
+    assert loaded == "", f"Importing the schema should not import {loaded}"
+
+    # Other names are still resolved on first use
+    import relational
+    assert relational.GroundGraph.__module__ == "relational.ground_graph", "Lazy export resolves to the wrong module"
+    assert set(relational.__all__) <= set(dir(relational)), "All exports should be listed by dir"
+
+    # Structure learning shares features through relational.shm without importing the ITE estimation
+    code = "import sys; import relational.learning; print('relational.estimation' in sys.modules, 'relational.sampling' in sys.modules)"
+    loaded = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout.strip()
+    assert loaded == "False False", "Importing the structure learner should not import the estimation or the sampler"
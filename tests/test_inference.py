@@ -0,0 +1,43 @@
+import pyro
+import pytest
+import torch
+from relational import *
+
+def test_minibatch_svi():
+
+    schema = RelationalSchema()
+    schema.load('tests/example/covid_schema.json')
+    structure = RelationalCausalStructure(schema)
+    structure.load('tests/example/covid_structure.json')
+    skeleton = RelationalSkeleton(schema)
+    skeleton.load(schema, 'tests/example/covid_skeleton.json')
+    scm = RelationalSCM()
+    scm.create_from_structure(structure)
+
+    # A minibatch contains the subsampled states with their towns and businesses
+    pyro.clear_param_store()
+    svi = RelationalMinibatchSVI(scm, skeleton, "state", subsample_size=1)
+    batch_skeleton = svi.get_minibatch(torch.tensor([0]))
+    assert batch_skeleton.is_valid_skeleton(schema), "Minibatch skeleton is not valid"
+    assert batch_skeleton.entity_instances["town"]["names"] == ["t1", "t2"], "Minibatch should contain the towns of s1"
+    assert batch_skeleton.entity_instances["business"]["names"] == ["b1", "b2", "b3"], "Minibatch should contain the businesses of s1"
+    assert batch_skeleton.relationship_instances["resides"] == (("t1", "b1"), ("t1", "b2"), ("t2", "b3")), "Minibatch should keep relationship instances"
+
+    # Observations are rescaled by the number of states over the batch size
+    trace = pyro.poutine.trace(svi.model).get_trace()
+    assert trace.nodes["town.prevalence"]["scale"] == 2.0, f"Likelihood scale should be 2 but found {trace.nodes['town.prevalence']['scale']}"
+    assert trace.nodes["weight_resides_business.occupancy_town.prevalence"]["scale"] == 1.0, "Global parameters should not be rescaled"
+
+    history = svi.train(2, verbose=False)
+    assert len(history) == 2 and all(epoch["instances_per_second"] > 0 for epoch in history), f"Unexpected training history {history}"
+
+    # Towns of the same state share instances, so minibatches of towns would overlap
+    with pytest.raises(ValueError):
+        RelationalMinibatchSVI(scm, skeleton, "town", subsample_size=1)
+
+    # A batch of all roots observes every instance without rescaling
+    full_svi = RelationalMinibatchSVI(scm, skeleton, "state", subsample_size=2)
+    trace = pyro.poutine.trace(full_svi.model).get_trace()
+    for node_name, values in get_observations(scm, skeleton).items():
+        assert trace.nodes[node_name]["scale"] == 1.0, f"Full batch of {node_name} should not be rescaled"
+        assert torch.equal(trace.nodes[node_name]["value"], values), f"Full batch should observe all values of {node_name}"
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+from relational import *
+
+@pytest.mark.parametrize("extension", ["csv", "parquet"])
+def test_load_skeleton_from_tables(tmp_path, extension):
+
+    schema = RelationalSchema()
+    schema.load('tests/example/covid_schema.json')
+    skeleton = RelationalSkeleton(schema)
+    skeleton.load(schema, 'tests/example/covid_skeleton.json')
+    if extension == "parquet":
+        pytest.importorskip("pyarrow")
+
+    # Export the example skeleton as entity and relationship tables
+    entity_tables = {}
+    relationship_tables = {}
+    for entity, instances in skeleton.entity_instances.items():
+        table = pd.DataFrame({"name": instances["names"], **{attribute: instances[attribute] for attribute in schema.attribute_classes[entity]}})
+        entity_tables[entity] = tmp_path / f"{entity}.{extension}"
+        getattr(table, f"to_{extension}")(entity_tables[entity], index=False)
+    for relation, (entity_from, entity_to) in schema.relations.items():
+        table = pd.DataFrame(skeleton.relationship_instances[relation], columns=[entity_from, entity_to])
+        relationship_tables[relation] = tmp_path / f"{relation}.{extension}"
+        getattr(table, f"to_{extension}")(relationship_tables[relation], index=False)
+
+    # Stream the tables back in small chunks
+    loaded_skeleton = load_skeleton_from_tables(schema, entity_tables, relationship_tables, chunksize=2)
+    assert loaded_skeleton.is_valid_skeleton(schema), "Skeleton loaded from tables is not valid"
+    assert loaded_skeleton.relationship_instances == skeleton.relationship_instances, "Relationship instances don't match the JSON skeleton"
+    for entity in schema.entity_classes:
+        for attribute in schema.attribute_classes[entity]:
+            assert torch.allclose(loaded_skeleton.get_attribute_vector(entity, attribute).float(), skeleton.get_attribute_vector(entity, attribute)), f"Values of {entity}.{attribute} don't match the JSON skeleton"
+
+def test_load_skeleton_from_tables_validation(tmp_path):
+
+    schema = RelationalSchema()
+    schema.add_entity("person", "age")
+    schema.add_entity("city", "size")
+    schema.add_relation("lives", "city", "person", "one_to_many")
+    schema.add_relation("follows", "person", "person", "many_to_many")
+    entity_tables = {"person": tmp_path / "person.csv", "city": tmp_path / "city.csv"}
+    relationship_tables = {"lives": tmp_path / "lives.csv", "follows": tmp_path / "follows.csv"}
+    pd.DataFrame({"name": ["p1", "p2", "p3"], "age": [30, 40, 50]}).to_csv(entity_tables["person"], index=False)
+    pd.DataFrame({"name": ["c1", "c2"], "size": [1.5, 2.5]}).to_csv(entity_tables["city"], index=False)
+    pd.DataFrame({"city": ["c1", "c1", "c2"], "person": ["p1", "p2", "p3"]}).to_csv(relationship_tables["lives"], index=False)
+
+    # A relation between an entity and itself has a from and a to column
+    assert get_relation_columns(schema, "follows") == ("person_from", "person_to"), "Self-relations need distinct columns"
+    pd.DataFrame({"person_from": ["p1", "p2", "p3"], "person_to": ["p2", "p3", "p1"]}).to_csv(relationship_tables["follows"], index=False)
+    skeleton = load_skeleton_from_tables(schema, entity_tables, relationship_tables, chunksize=2)
+    assert skeleton.is_valid_skeleton(schema), "Skeleton with a self-relation is not valid"
+    assert skeleton.relationship_instances["follows"] == (("p1", "p2"), ("p2", "p3"), ("p3", "p1")), "Wrong instances of the self-relation"
+
+    # A person living in two cities is caught in the chunk that breaks the cardinality
+    pd.DataFrame({"city": ["c1", "c1", "c2"], "person": ["p1", "p2", "p1"]}).to_csv(relationship_tables["lives"], index=False)
+    skeleton = load_skeleton_from_tables(schema, entity_tables, relationship_tables, chunksize=2)
+    assert len(skeleton.entity_instances["person"]["names"]) == 0, "Skeleton violating the cardinality should be empty"
+
+    # Values keep the dtype of their column unless one is given
+    pd.DataFrame({"city": ["c1", "c1", "c2"], "person": ["p1", "p2", "p3"]}).to_csv(relationship_tables["lives"], index=False)
+    pd.DataFrame({"name": ["c1", "c2"], "size": [0.1, 1 / 3]}).to_csv(entity_tables["city"], index=False)
+    skeleton = load_skeleton_from_tables(schema, entity_tables, relationship_tables)
+    assert skeleton.entity_instances["city"]["size"].dtype == np.float64 and skeleton.entity_instances["city"]["size"][1] == 1 / 3, "Values should be lossless"
+    assert load_skeleton_from_tables(schema, entity_tables, relationship_tables, dtype=np.float32).entity_instances["city"]["size"].dtype == np.float32, "Wrong dtype"
+
+    # Self-relations only keep the cardinality of their second side, so a person with two mentors is not caught
+    schema.add_relation("mentors", "person", "person", "one_to_many")
+    assert schema.cardinality["mentors"] == {"person": "many"}, "Self-relations should have one cardinality"
+    relationship_tables["mentors"] = tmp_path / "mentors.csv"
+    pd.DataFrame({"person_from": ["p1", "p3"], "person_to": ["p2", "p2"]}).to_csv(relationship_tables["mentors"], index=False)
+    skeleton = load_skeleton_from_tables(schema, entity_tables, relationship_tables)
+    assert len(skeleton.relationship_instances["mentors"]) == 2, "The one side of a self-relation is not checked"
@@ -0,0 +1,47 @@
+import numpy as np
+import torch
+from relational import *
+
+def test_fisher_z_test():
+
+    rng = np.random.default_rng(0)
+    z = rng.standard_normal(2000)
+    x = z + rng.standard_normal(2000)
+    y = z + rng.standard_normal(2000)
+    assert fisher_z_test(x, y) < 0.01, "x and y should be dependent through z"
+    assert fisher_z_test(x, y, z[:, None]) > 0.01, "x and y should be independent given z"
+    assert fisher_z_test(x, np.zeros(2000)) == 1.0, "Constant values are independent of everything"
+
+def test_structure_learning():
+
+    schema = RelationalSchema()
+    schema.load('tests/example/covid_schema.json')
+    structure = RelationalCausalStructure(schema)
+    structure.load('tests/example/covid_structure.json')
+    scm = RelationalSCM()
+    scm.create_from_structure(structure)
+    for node in structure.nodes:
+        incoming_edges = structure.get_incoming_edges(node.entity, node.attribute)
+        scm.mechanisms[scm.get_name_from_node(node)] = LinearGaussian({key: 2.0 if node.attribute == "policy" else 1.0 for key in incoming_edges}, 0.0, 1.0)
+    skeleton = generate_skeleton(schema, {"business": 10000}, fan_out={"contains": 10, "resides": 10}, seed=0)
+    skeleton = RelationalSampler(scm, skeleton).sample_skeleton(torch.Generator().manual_seed(0))
+
+    # The covid structure is recovered and fully oriented
+    learner = RelationalStructureLearner(schema, skeleton, num_workers=1)
+    learned_structure = learner.learn()
+    assert learned_structure.edges == structure.edges, f"Learned edges {learned_structure.edges} don't match"
+    assert learner.undirected == [], "All edges should be oriented"
+    assert learner.rejected == [], "No orientation should be rejected"
+    assert ("self", Node("town", "policy"), Node("town", "prevalence")) in learner.sepsets, "Town policy and prevalence should be separated"
+
+    # Tests run in a process pool give the same structure, and learning again only reads cached tests
+    parallel_learner = RelationalStructureLearner(schema, skeleton, num_workers=2)
+    assert parallel_learner.learn().edges == structure.edges, "Structure learned in parallel doesn't match"
+    num_tests = parallel_learner.num_tests
+    parallel_learner.learn()
+    assert parallel_learner.num_tests == num_tests, "Cached tests should not be run again"
+
+    # Orientations that would close a cycle are reported instead of silently dropped
+    learner.oriented.add(("resides", Node("town", "prevalence"), Node("business", "occupancy")))
+    assert learner.get_structure().edges == structure.edges, "Structure should only contain the accepted edges"
+    assert learner.rejected == [("resides", Node("town", "prevalence"), Node("business", "occupancy"))], f"Unexpected rejected edges {learner.rejected}"
@@ -0,0 +1,69 @@
+import pyro
+import torch
+from relational import *
+
+def test_compile_pyro_model():
+
+    schema = RelationalSchema()
+    schema.load('tests/example/covid_schema.json')
+    structure = RelationalCausalStructure(schema)
+    structure.load('tests/example/covid_structure.json')
+    skeleton = RelationalSkeleton(schema)
+    skeleton.load(schema, 'tests/example/covid_skeleton.json')
+    scm = RelationalSCM()
+    scm.create_from_structure(structure)
+    scm.init_linear_gaussian(torch.Generator().manual_seed(0))
+    data = get_observations(scm, skeleton)
+
+    # One vectorized sample site per attribute class, with the log joint matching the linear Gaussian mechanisms
+    model = compile_pyro_model(scm, skeleton, learn_parameters=False)
+    trace = pyro.poutine.trace(model).get_trace(data)
+    sample_sites = [name for name, site in trace.nodes.items() if site["type"] == "sample" and not name.endswith("_plate")]
+    assert sorted(sample_sites) == sorted(data), f"Unexpected sample sites {sample_sites}"
+    observed = {node: skeleton.get_attribute_vector(node.entity, node.attribute) for node in structure.nodes}
+    ref_log_prob = 0.0
+    for node in structure.nodes:
+        mechanism = scm.get_mechanism(scm.get_name_from_node(node))
+        loc = mechanism.bias + sum(weight * aggregate_relational_edge(structure, skeleton, relation, edge, observed[edge.parent]) for (relation, edge), weight in mechanism.weights.items())
+        ref_log_prob += torch.distributions.Normal(loc, mechanism.scale).log_prob(observed[node]).sum()
+    assert torch.isclose(trace.log_prob_sum(), ref_log_prob), f"Log joint {trace.log_prob_sum()} doesn't match reference {ref_log_prob}"
+
+    # SVI over the learnable parameters with vectorized particles
+    pyro.clear_param_store()
+    model = compile_pyro_model(scm, skeleton)
+    guide = pyro.infer.autoguide.AutoNormal(model)
+    svi = pyro.infer.SVI(model, guide, pyro.optim.Adam({"lr": 0.01}), pyro.infer.Trace_ELBO(num_particles=4, vectorize_particles=True))
+    for _ in range(2):
+        loss = svi.step(data)
+    assert torch.isfinite(torch.tensor(loss)), "ELBO should be finite"
+
+def test_pyro_model_batch_shapes():
+
+    schema = RelationalSchema()
+    schema.load('tests/example/covid_schema.json')
+    structure = RelationalCausalStructure(schema)
+    structure.load('tests/example/covid_structure.json')
+    skeleton = RelationalSkeleton(schema)
+    skeleton.load(schema, 'tests/example/covid_skeleton.json')
+    scm = RelationalSCM()
+    scm.create_from_structure(structure)
+    scm.init_linear_gaussian(torch.Generator().manual_seed(0))
+    data = get_observations(scm, skeleton)
+    num_instances = {entity: len(instances["names"]) for entity, instances in skeleton.entity_instances.items()}
+
+    # Vectorized particles add one dimension left of the entity plate
+    model = compile_pyro_model(scm, skeleton)
+    def vectorized_model():
+        with pyro.plate("particles", 4, dim=-2):
+            return model(data)
+    trace = pyro.poutine.trace(vectorized_model).get_trace()
+    for node in structure.nodes:
+        batch_shape = trace.nodes[scm.get_name_from_node(node)]["fn"].batch_shape
+        assert batch_shape == (4, num_instances[node.entity]), f"Wrong batch shape {batch_shape} of {node} with vectorized particles"
+
+    # A batch of interventions adds one dimension to the descendants of the intervened node
+    model = compile_pyro_model(scm.intervene("state.policy", torch.tensor([1.0, 2.0, 3.0])), skeleton, learn_parameters=False)
+    trace = pyro.poutine.trace(model).get_trace()
+    for node in [Node("town", "policy"), Node("town", "prevalence"), Node("business", "occupancy")]:
+        batch_shape = trace.nodes[scm.get_name_from_node(node)]["fn"].batch_shape
+        assert batch_shape == (3, num_instances[node.entity]), f"Wrong batch shape {batch_shape} of {node} with batched interventions"
@@ -0,0 +1,96 @@
+import pytest
+import torch
+from relational import *
+
+def test_sampler():
+
+    schema = RelationalSchema()
+    schema.load('tests/example/covid_schema.json')
+    structure = RelationalCausalStructure(schema)
+    structure.load('tests/example/covid_structure.json')
+    skeleton = RelationalSkeleton(schema)
+    skeleton.load(schema, 'tests/example/covid_skeleton.json')
+    scm = RelationalSCM()
+    scm.create_from_structure(structure)
+    scm.init_linear_gaussian(torch.Generator().manual_seed(0))
+
+    # Samples cover all instances of every attribute
+    sampler = RelationalSampler(scm, skeleton)
+    samples = sampler.sample(100, torch.Generator().manual_seed(0))
+    for node in structure.nodes:
+        assert samples[node].shape == (100, len(skeleton.entity_instances[node.entity]["names"])), f"Wrong shape of samples for {node}"
+
+    # Without noise the samples follow the linear mechanisms exactly
+    for node_name, mechanism in scm.mechanisms.items():
+        scm.mechanisms[node_name] = LinearGaussian({key: 1.0 for key in mechanism.weights}, 1.0, 0.0)
+    scm.intervene_("state.policy", 2.0)
+    samples = RelationalSampler(scm, skeleton).sample(3)
+    assert torch.all(samples[Node("state", "policy")] == 2.0), "Intervention on state.policy was not applied"
+    assert torch.all(samples[Node("town", "policy")] == 3.0), "town.policy should be 1 + state policy"
+    assert torch.all(samples[Node("business", "occupancy")] == 4.0), "business.occupancy should be 1 + town policy"
+    assert torch.all(samples[Node("town", "prevalence")] == 7.0), "town.prevalence should be 1 + state policy + mean occupancy"
+
+    # One sample can be written back into a skeleton
+    sampled_skeleton = RelationalSampler(scm, skeleton).sample_skeleton()
+    assert sampled_skeleton.is_valid_skeleton(schema), "Sampled skeleton is not valid"
+    assert torch.all(sampled_skeleton.get_attribute_vector("town", "prevalence") == 7.0), "Sampled skeleton doesn't contain the samples"
+
+    # Changing the sampled skeleton leaves the original skeleton and its indexes alone
+    sampled_skeleton.set_relationship_instances("contains", [0], [0])
+    sampled_skeleton.set_attribute_values("town", "policy", sampled_skeleton.entity_instances["town"]["policy"] + 1)
+    assert skeleton.get_neighbors("contains", "s1") == ["t1", "t2"], "Relation index of the original skeleton was changed"
+    assert len(skeleton.relationship_instances["contains"]) == 3, "Relationship instances of the original skeleton were changed"
+    assert skeleton.entity_instances["town"]["policy"] != sampled_skeleton.entity_instances["town"]["policy"].tolist(), "Values of the original skeleton were changed"
+
+def test_sampler_from_file(tmp_path):
+
+    schema = RelationalSchema()
+    schema.load('tests/example/covid_schema.json')
+    structure = RelationalCausalStructure(schema)
+    structure.load('tests/example/covid_structure.json')
+    skeleton = RelationalSkeleton(schema)
+    skeleton.load(schema, 'tests/example/covid_skeleton.json')
+    scm = RelationalSCM()
+    scm.create_from_structure(structure)
+    scm.intervene_("state.policy", 2.0)
+    scm.save(tmp_path / "scm.json")
+
+    # The structure isn't stored with the SCM, so it has to be passed to load before sampling
+    loaded_scm = RelationalSCM()
+    loaded_scm.load(tmp_path / "scm.json")
+    with pytest.raises(ValueError):
+        RelationalSampler(loaded_scm, skeleton)
+    loaded_scm.load(tmp_path / "scm.json", structure)
+    assert loaded_scm.functions == scm.functions, "Functions don't match the saved SCM"
+    samples = RelationalSampler(loaded_scm, skeleton).sample(2)
+    assert torch.all(samples[Node("state", "policy")] == 2.0), "Intervention of the saved SCM was not applied"
+
+def test_instance_intervention():
+
+    schema = RelationalSchema()
+    schema.load('tests/example/covid_schema.json')
+    structure = RelationalCausalStructure(schema)
+    structure.load('tests/example/covid_structure.json')
+    skeleton = RelationalSkeleton(schema)
+    skeleton.load(schema, 'tests/example/covid_skeleton.json')
+    scm = RelationalSCM()
+    scm.create_from_structure(structure)
+    scm.init_linear_gaussian(torch.Generator().manual_seed(0))
+    sampler = RelationalSampler(scm, skeleton)
+    samples, noise = sampler.sample(4, torch.Generator().manual_seed(0), return_noise=True)
+
+    # Intervene on the towns of s2 only
+    ground_graph = GroundGraph(structure, skeleton)
+    num_edges = ground_graph.num_edges
+    interventions = {InstanceNode("town", "policy", town): 1.0 for town in skeleton.get_neighbors("contains", "s2")}
+    new_samples = sampler.resample(samples, noise, ground_graph, interventions)
+    assert ground_graph.num_edges == num_edges - 1, "Only the edge from s2 into t3.policy should be removed"
+    assert torch.all(new_samples[Node("town", "policy")][:, 2] == 1.0), "t3.policy should be set to 1"
+
+    # Unaffected instances keep their values, affected ones match resampling with the same noise
+    assert torch.equal(new_samples[Node("town", "policy")][:, :2], samples[Node("town", "policy")][:, :2]), "Towns of s1 should not change"
+    assert torch.equal(new_samples[Node("business", "occupancy")][:, :3], samples[Node("business", "occupancy")][:, :3]), "Businesses of s1 should not change"
+    mechanism = scm.get_mechanism("business.occupancy")
+    weight = list(mechanism.weights.values())[0]
+    expected = mechanism.bias + mechanism.scale * noise[Node("business", "occupancy")][:, 3:] + weight * 1.0
+    assert torch.allclose(new_samples[Node("business", "occupancy")][:, 3:], expected), "Businesses of t3 should be resampled with the intervened policy"
@@ -1,3 +1,5 @@
+import pytest
+import torch
 from relational import *
 
 def test_scm():
@@ -24,3 +26,90 @@ def test_scm():
     intervened_scm.intervene_("town.prevalence", town_prevalence)
     assert len(intervened_scm.functions["town.prevalence"]) == 1, "Intervention should remove all parents of town_prevalence"
     assert 20 in intervened_scm.functions["town.prevalence"], f"Intervention attempted to set town_prevalence to {town_prevalence} but value found was {intervened_scm.functions['town_prevalence']}"
+
+def test_intervention_overlay(tmp_path):
+
+    schema = RelationalSchema()
+    schema.load('tests/example/covid_schema.json')
+    structure = RelationalCausalStructure(schema)
+    structure.load('tests/example/covid_structure.json')
+    skeleton = RelationalSkeleton(schema)
+    skeleton.load(schema, 'tests/example/covid_skeleton.json')
+    scm = RelationalSCM()
+    scm.create_from_structure(structure)
+    scm.init_linear_gaussian(torch.Generator().manual_seed(0))
+
+    # Stacked interventions only store do-assignments and share the base SCM
+    intervened_scm = scm.intervene("state.policy", 1.0).intervene("town.policy", 2.0)
+    assert intervened_scm.mechanisms is scm.mechanisms, "Overlay should share mechanisms with the base SCM"
+    assert intervened_scm.get_intervention("state.policy") == 1.0 and intervened_scm.get_intervention("town.policy") == 2.0, "Stacked interventions are missing"
+    assert "noise_state.policy" not in intervened_scm.unobserved_nodes and "noise_state.policy" in scm.unobserved_nodes, "Noise should only be removed in the overlay"
+    assert scm.get_intervention("state.policy") is None, "Base SCM should not be intervened on"
+
+    # The overlay saves its interventions, can't change the base SCM and rejects unknown nodes
+    intervened_scm.save(tmp_path / "intervened_scm.json")
+    loaded_scm = RelationalSCM()
+    loaded_scm.load(tmp_path / "intervened_scm.json", structure)
+    assert loaded_scm.get_intervention("state.policy") == 1.0 and loaded_scm.get_intervention("town.policy") == 2.0, "Saved overlay is missing interventions"
+    with pytest.raises(AttributeError):
+        intervened_scm.init_linear_gaussian()
+    assert scm.intervene("nonexistent.node", 1.0) is None, "Intervening on an unknown node should fail"
+    intervened_scm.intervene_("nonexistent.node", 1.0)
+    assert "nonexistent.node" not in intervened_scm.interventions, "Intervening in place on an unknown node should fail"
+
+    # A tensor of intervention values is evaluated in one batched pass with shared noise
+    doses = torch.linspace(-1, 1, 5)
+    samples = RelationalSampler(scm.intervene("state.policy", doses), skeleton).sample(10, torch.Generator().manual_seed(0))
+    town_policy = samples[Node("town", "policy")]
+    assert town_policy.shape == (5, 10, 3), f"Unexpected shape of batched samples {town_policy.shape}"
+    weight = scm.get_mechanism("town.policy").weights[("contains", Edge(Node("state", "policy"), Node("town", "policy")))]
+    assert torch.allclose(town_policy[1:] - town_policy[:-1], torch.full((4, 10, 3), weight * 0.5), atol=1e-5), "Dose response should be linear with shared noise"
+
+def test_fit():
+
+    schema = RelationalSchema()
+    schema.load('tests/example/covid_schema.json')
+    structure = RelationalCausalStructure(schema)
+    structure.load('tests/example/covid_structure.json')
+    scm = RelationalSCM()
+    scm.create_from_structure(structure)
+    scm.init_linear_gaussian(torch.Generator().manual_seed(0))
+    skeleton = generate_skeleton(schema, {"business": 20000}, fan_out={"contains": 10, "resides": 10}, seed=0)
+    skeleton = RelationalSampler(scm, skeleton).sample_skeleton(torch.Generator().manual_seed(0))
+
+    # Linear mechanisms recover the weights that generated the skeleton, fitting in threads or not
+    fitted_scm = RelationalSCM()
+    fitted_scm.create_from_structure(structure)
+    for num_workers in [1, 4]:
+        fitted = fitted_scm.fit(skeleton, num_workers=num_workers)
+        assert set(fitted) == fitted_scm.observed_nodes, "Every observed node should be fit"
+        for node_name, mechanism in scm.mechanisms.items():
+            for key, weight in mechanism.weights.items():
+                assert abs(fitted_scm.mechanisms[node_name].weights[key] - weight) < 0.2, f"Wrong weight of {key} for {node_name}"
+            assert abs(fitted_scm.mechanisms[node_name].scale - 1.0) < 0.2, f"Wrong noise scale for {node_name}"
+
+    # Networks fit at least as well as the noise allows
+    torch.manual_seed(0)
+    fitted = fitted_scm.fit(skeleton, model='mlp', num_steps=300, lr=0.05)
+    assert fitted_scm.neural_mechanisms["town.prevalence"] is fitted["town.prevalence"], "Networks should be stored on the SCM"
+    assert fitted["town.prevalence"].scale < 1.2, f"Network residual scale {fitted['town.prevalence'].scale} is too large"
+
+    # The sampler evaluates the networks, models that need linear mechanisms refuse them, and refitting replaces them
+    assert "town.prevalence" not in fitted_scm.mechanisms, "Refitting with networks should drop the linear mechanism"
+    prevalence = Node("town", "prevalence")
+    node_values = {node: skeleton.get_attribute_vector(node.entity, node.attribute).float()[None] for node in structure.nodes if node != prevalence}
+    samples = RelationalSampler(fitted_scm, skeleton).sample(node_values=node_values, noise={prevalence: torch.zeros(1, len(node_values[Node("town", "policy")][0]))})
+    with torch.no_grad():
+        expected = fitted["town.prevalence"].network(flatten(structure, skeleton)[prevalence].features.float()).squeeze(-1)
+    assert torch.allclose(samples[prevalence][0], expected, atol=1e-5), "The sampler should evaluate the fitted network"
+    with pytest.raises(ValueError):
+        compile_pyro_model(fitted_scm, skeleton, learn_parameters=False)
+    fitted_scm.fit(skeleton)
+    assert len(fitted_scm.neural_mechanisms) == 0, "Refitting linear mechanisms should drop the networks"
+
+    # The ridge penalty shrinks the weights towards zero but not the bias
+    feature_matrix = flatten(structure, skeleton)[prevalence]
+    plain, shrunk = fit_linear_gaussian(feature_matrix), fit_linear_gaussian(feature_matrix, ridge=1e6)
+    assert all(abs(weight) < 0.1 for weight in shrunk.weights.values()), f"Ridge weights {shrunk.weights} should be shrunk"
+    assert abs(shrunk.bias - feature_matrix.target.double().mean().item()) < 0.1, "Bias should not be penalized"
+    assert max(abs(plain.weights[key] - weight) for key, weight in fit_linear_gaussian(feature_matrix, ridge=1e-6).weights.items()) < 1e-4, "Small ridge should barely change the weights"
@@ -19,3 +19,28 @@ def test_structure():
     # Check parents
     for node in structure.parents:
         assert len(ref_structure.parents[node] - structure.parents[node]) == 0, f"Parents of {node} don't match reference {ref_structure.parents[node]}"
+
+def test_topological_order():
+
+    schema = RelationalSchema()
+    schema.load('tests/example/covid_schema.json')
+    structure = RelationalCausalStructure(schema)
+    structure.add_edge("self", ("town", "policy"), ("town", "prevalence"))
+    structure.add_edge("contains", ("state", "policy"), ("town", "policy"))
+    layers = structure.get_topological_layers()
+    assert layers == [[Node("business", "occupancy"), Node("state", "policy")], [Node("town", "policy")], [Node("town", "prevalence")]], f"Unexpected layers {layers}"
+
+    # Edges consistent with the cached layers keep the cache, other edges invalidate it
+    structure.add_edge("contains", ("state", "policy"), ("town", "prevalence"))
+    assert structure.topological_layers is layers, "Cached layers should be kept"
+    structure.add_edge("resides", ("town", "policy"), ("business", "occupancy"))
+    structure.add_edge("resides", ("business", "occupancy"), ("town", "prevalence"))
+    order = structure.get_topological_order()
+    for node, parents in structure.parents.items():
+        for parent in parents:
+            assert order.index(parent) < order.index(node), f"{parent} should come before {node}"
+
+    # Edges that create cycles are rejected
+    structure.add_edge("resides", ("business", "occupancy"), ("town", "policy"))
+    assert Node("business", "occupancy") not in structure.parents[Node("town", "policy")], "Cyclic edge should not be added"
+    assert structure.is_acyclic(), "Structure should be acyclic"
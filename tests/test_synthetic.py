@@ -0,0 +1,34 @@
+import numpy as np
+from relational import *
+
+def test_generate_skeleton():
+
+    schema = RelationalSchema()
+    schema.load('tests/example/covid_schema.json')
+    schema.add_entity("owner", "wealth")
+    schema.add_relation("owns", "owner", "business", "many_to_many")
+    schema.add_entity("mayor", "approval")
+    schema.add_relation("governs", "mayor", "town", "one_to_one")
+
+    # Counts follow the relations out from the known entity
+    num_instances = get_num_instances(schema, {"town": 20}, fan_out={"resides": 5, "contains": 4})
+    assert num_instances == {"town": 20, "business": 100, "state": 5, "owner": 100, "mayor": 20}, "Wrong number of instances"
+    assert get_num_instances(schema, {}) is None, "Counts can't be found without a known entity"
+
+    fan_out = {"resides": 5, "contains": 4, "owns": 3}
+    distributions = {"owner.wealth": lambda rng, size: rng.exponential(size=size)}
+    skeleton = generate_skeleton(schema, {"town": 20}, fan_out=fan_out, distributions=distributions, seed=0)
+    assert skeleton.is_valid_skeleton(schema), "Generated skeleton is not valid"
+    for entity, count in num_instances.items():
+        assert len(skeleton.entity_instances[entity]["names"]) == count, f"Wrong number of {entity} instances"
+    assert len(skeleton.relationship_instances["resides"]) == 100, "Every business should reside in one town"
+    assert len(skeleton.relationship_instances["governs"]) == 20, "Every town should have one mayor"
+    assert 100 < len(skeleton.relationship_instances["owns"]) <= 300, "Owners should own up to fan-out businesses"
+    assert (skeleton.get_attribute_vector("owner", "wealth") >= 0).all(), "Attribute distribution was not used"
+    mayor, town = skeleton.relationship_instances["governs"][0]
+    assert skeleton.get_instance_type(mayor) == "mayor" and skeleton.get_neighbors("governs", mayor) == [town], "Instances should be found by name"
+
+    # The same seed gives the same skeleton
+    same_skeleton = generate_skeleton(schema, {"town": 20}, fan_out=fan_out, distributions=distributions, seed=0)
+    assert same_skeleton.relationship_instances == skeleton.relationship_instances, "Skeleton should be reproducible from the seed"
+    assert np.array_equal(same_skeleton.entity_instances["town"]["prevalence"], skeleton.entity_instances["town"]["prevalence"]), "Attribute values should be reproducible from the seed"